@@ -0,0 +1,71 @@
+"""
+Views assíncronas das rotas que dependem do Google Books.
+
+Rodando sob um servidor ASGI (ex.: ``uvicorn sistema_biblioteca.asgi:application``),
+a espera pelo Google não ocupa uma thread: centenas de chamadas em andamento
+dividem o mesmo worker. Sob WSGI elas continuam funcionando (o Django roda
+cada uma num event loop próprio), mas sem esse ganho.
+
+O DRF não tem views assíncronas, então a autenticação JWT é feita aqui com o
+mesmo CachedJWTAuthentication das views do DRF (a busca do usuário, quando
+não está no cache, roda numa thread) e as respostas têm o mesmo JSON das
+views síncronas.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+
+from users.authentication import CachedJWTAuthentication
+
+from .services import GoogleBooksService
+from .views import MAX_API_LIMIT, GlobalSearchView
+
+_sync_global_search = GlobalSearchView.as_view()
+
+
+async def _authenticate(request):
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _unauthorized():
+    return JsonResponse({'detail': str(exceptions.NotAuthenticated.default_detail)}, status=401)
+
+
+@require_GET
+async def global_search(request):
+    """Mesma interface de GlobalSearchView; só o source=google roda de forma assíncrona."""
+    if request.GET.get('source', 'local') != 'google':
+        # Busca local é só banco: delega para a view síncrona
+        return await sync_to_async(_sync_global_search)(request)
+
+    if await _authenticate(request) is None:
+        return _unauthorized()
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse([], safe=False)
+
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        return JsonResponse({'error': 'Página inválida.'}, status=400)
+    genre = request.GET.get('genre', 'ALL')
+
+    books = await GoogleBooksService().asearch_books(query, page, genre, MAX_API_LIMIT)
+    return JsonResponse(books, safe=False)
+
+
+@require_GET
+async def google_book_detail(request, google_id):
+    if await _authenticate(request) is None:
+        return _unauthorized()
+
+    data = await GoogleBooksService().aget_book_by_google_id(google_id)
+    if data:
+        return JsonResponse(data)
+    return JsonResponse({'error': 'Livro não encontrado'}, status=404)
@@ -0,0 +1,48 @@
+"""
+Cache de leitura do detalhe de livro (BookViewSet.retrieve).
+
+As chaves são versionadas: cada livro tem um contador ``book_detail_version_{pk}``
+e o detalhe fica em ``book_detail_{pk}_v{versão}``. Invalidar é só incrementar a
+versão (via signals); entradas antigas expiram sozinhas pelo TTL.
+
+O valor cacheado é a parte da representação que não depende do usuário;
+o ``status_usuario`` é sobreposto a cada requisição.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+BOOK_DETAIL_CACHE_TTL = getattr(settings, 'BOOK_DETAIL_CACHE_TTL', 60 * 15)
+
+
+def _version_key(pk):
+    return f'book_detail_version_{pk}'
+
+
+def book_detail_key(pk, host):
+    # O host entra na chave porque a URL da capa local é absoluta
+    version = cache.get(_version_key(pk), 1)
+    return f'book_detail_{pk}_v{version}_{host}'
+
+
+def get_book_detail(pk, host):
+    return cache.get(book_detail_key(pk, host))
+
+
+def set_book_detail(pk, host, data):
+    cache.set(book_detail_key(pk, host), data, BOOK_DETAIL_CACHE_TTL)
+
+
+def _bump_version(pk):
+    key = _version_key(pk)
+    if cache.add(key, 2, timeout=None):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def invalidate_book_detail(pk):
+    # Só após o commit: antes disso, uma leitura concorrente recolocaria dados antigos
+    transaction.on_commit(lambda: _bump_version(pk))
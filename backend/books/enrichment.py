@@ -0,0 +1,156 @@
+"""
+Enriquecimento em segundo plano dos livros do acervo com dados do Google
+Books (capa, descrição, data de publicação, editora e idioma).
+
+Roda na task ``books.tasks.enrich_books`` (Celery) ou pelo comando
+``enrich_books``; nenhuma requisição de usuário espera por isso. Os livros
+incompletos são percorridos por id em lotes e o último id processado fica
+no cache, então uma execução interrompida (erro do Google, deploy, limite
+de lotes) continua de onde parou. Cada livro só grava os campos que
+mudaram (``save(update_fields=...)``).
+
+Cada consulta fica registrada em ``enrichment_checked_at``: livros que o
+Google não completou só voltam a ser consultados depois de
+BOOK_ENRICHMENT_RECHECK_DAYS, e não a cada noite. Uma trava no cache
+(``cache.add``) impede que a execução agendada e a continuação de outra
+rodem ao mesmo tempo sobre o mesmo progresso.
+"""
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .importer import google_volume_data
+from .models import Book
+from .services import GoogleBooksService
+
+ENRICHMENT_BATCH_SIZE = getattr(settings, 'BOOK_ENRICHMENT_BATCH_SIZE', 50)
+# Consultas por segundo ao Google (a cota é compartilhada com as buscas dos usuários)
+ENRICHMENT_RATE = getattr(settings, 'BOOK_ENRICHMENT_RATE', 2.0)
+# Campos preenchidos quando vazios no acervo
+ENRICHMENT_FIELDS = ('cover_url', 'description', 'publication_date', 'publisher', 'language')
+
+# Dias até consultar de novo um livro que continuou incompleto
+ENRICHMENT_RECHECK_DAYS = getattr(settings, 'BOOK_ENRICHMENT_RECHECK_DAYS', 30)
+
+PROGRESS_KEY = 'books:enrichment:last_id'
+LOCK_KEY = 'books:enrichment:lock'
+# Validade da trava; renovada a cada lote, expira sozinha se o worker morrer
+LOCK_TTL = 10 * 60
+
+
+class Throttle:
+    """Espaça as chamadas para no máximo ``per_second`` por segundo."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self.next_call = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_call > now:
+            time.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+
+def incomplete_books(recheck_days=ENRICHMENT_RECHECK_DAYS):
+    """Livros com campos vazios que não foram consultados nos últimos ``recheck_days``."""
+    no_cover = (
+        (Q(cover_url__isnull=True) | Q(cover_url=''))
+        & (Q(cover_image__isnull=True) | Q(cover_image=''))
+    )
+    recent = timezone.now() - timedelta(days=recheck_days)
+    return Book.objects.exclude(isbn='').filter(
+        no_cover | Q(description='') | Q(publication_date__isnull=True)
+        | Q(publisher='') | Q(language='')
+    ).filter(Q(enrichment_checked_at__isnull=True) | Q(enrichment_checked_at__lt=recent))
+
+
+def missing_fields(book, volume):
+    """Valores do Google para os campos vazios do livro."""
+    changes = {}
+    for name, value in google_volume_data(volume).items():
+        if name not in ENRICHMENT_FIELDS or getattr(book, name):
+            continue
+        if name == 'cover_url' and book.cover_image:
+            continue
+        changes[name] = value
+    return changes
+
+
+def get_progress():
+    return cache.get(PROGRESS_KEY, 0)
+
+
+def reset_progress():
+    cache.delete(PROGRESS_KEY)
+
+
+def enrich_incomplete_books(batch_size=ENRICHMENT_BATCH_SIZE, max_batches=None, rate=ENRICHMENT_RATE):
+    """
+    Processa lotes de livros incompletos a partir do último id salvo.
+    GoogleBooksUnavailable é propagada (para a task tentar de novo) com o
+    progresso salvo até o último livro concluído. Se outra execução estiver
+    em andamento, volta sem consultar nada (``stats['locked']``).
+    """
+    started = time.perf_counter()
+    stats = {'checked': 0, 'updated': 0, 'not_found': 0, 'done': False, 'locked': False}
+
+    token = uuid.uuid4().hex
+    if not cache.add(LOCK_KEY, token, timeout=LOCK_TTL):
+        stats['locked'] = True
+        stats['duration'] = time.perf_counter() - started
+        return stats
+
+    service = GoogleBooksService()
+    # O intervalo só conta para as consultas que vão ao Google, não para as do cache
+    throttle = Throttle(rate)
+
+    last_id = get_progress()
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            books = list(
+                incomplete_books().filter(pk__gt=last_id).order_by('pk')[:batch_size]
+            )
+            if not books:
+                # Passada completa: a próxima execução recomeça do início
+                # (e pula os livros consultados há pouco)
+                stats['done'] = True
+                reset_progress()
+                break
+
+            for book in books:
+                volume = service.get_book_by_isbn(book.isbn, raise_errors=True, before_request=throttle.wait)
+                stats['checked'] += 1
+
+                book.enrichment_checked_at = timezone.now()
+                changes = missing_fields(book, volume) if volume else {}
+                if changes:
+                    for name, value in changes.items():
+                        setattr(book, name, value)
+                    book.save(update_fields=[*changes, 'enrichment_checked_at', 'updated_at'])
+                    stats['updated'] += 1
+                else:
+                    # Nada a gravar no livro: só o registro da consulta, sem signals nem updated_at
+                    Book.objects.filter(pk=book.pk).update(enrichment_checked_at=book.enrichment_checked_at)
+                    if not volume:
+                        stats['not_found'] += 1
+                last_id = book.pk
+
+            cache.set(PROGRESS_KEY, last_id, timeout=None)
+            cache.touch(LOCK_KEY, LOCK_TTL)
+            batches += 1
+    finally:
+        if not stats['done'] and last_id:
+            cache.set(PROGRESS_KEY, last_id, timeout=None)
+        if cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+        stats['duration'] = time.perf_counter() - started
+
+    return stats
@@ -1,5 +1,7 @@
 import django_filters
+from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import Book
+from .search import search_books
 
 class BookFilter(django_filters.FilterSet):
     genre = django_filters.CharFilter(lookup_expr='icontains')
@@ -18,3 +20,20 @@ class BookFilter(django_filters.FilterSet):
         if value:
             return queryset.filter(available_copies__gt=0)
         return queryset
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    Troca o icontains do SearchFilter pelo motor de busca textual.
+    Sem ?ordering explícito, o resultado sai ordenado por relevância.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        queryset = search_books(queryset, query)
+        if OrderingFilter.ordering_param not in request.query_params:
+            queryset = queryset.order_by('-search_rank', '-created_at')
+        return queryset
@@ -0,0 +1,373 @@
+"""
+Importação do acervo em lote (CSV ou lista de ISBNs).
+
+As linhas são lidas em streaming e processadas em lotes: cada lote faz um
+SELECT dos ISBNs já cadastrados, um bulk_create dos novos e um bulk_update
+dos existentes (upsert por ISBN), então a memória usada depende do tamanho
+do lote e não do arquivo.
+
+Colunas aceitas no CSV (cabeçalho obrigatório, só ``isbn`` é exigida):
+title, author, isbn, publisher, publication_date, genre, language,
+description, cover_url, total_copies.
+
+Com ``enrich=True`` os campos vazios são completados pelo Google Books
+(consultas em paralelo, por lote). Erros são reportados por linha e não
+interrompem a importação.
+"""
+import codecs
+import csv
+import re
+from concurrent.futures import wait
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from sistema_biblioteca.instrumentation import timed
+from users.services import invalidate_librarian_stats
+from .cache import invalidate_book_detail
+from .models import Book
+from .search import get_search_engine
+from .services import SEARCH_DEADLINE, GoogleBooksService, get_executor
+
+IMPORT_BATCH_SIZE = 1000
+# Erros guardados no resultado (o total continua sendo contado)
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FIELDS = (
+    'title', 'author', 'isbn', 'publisher', 'publication_date', 'genre',
+    'language', 'description', 'cover_url', 'total_copies',
+)
+ENRICH_FIELDS = ('title', 'author', 'publisher', 'publication_date', 'genre', 'language', 'description', 'cover_url')
+REQUIRED_FIELDS = ('title', 'author')
+
+# Valores usados em livros novos quando a coluna não vem preenchida
+DEFAULTS = {'publisher': '', 'genre': 'Geral', 'language': '', 'description': '', 'total_copies': 1}
+
+# Codificações aceitas nos uploads, na ordem de tentativa. CSVs exportados pelo
+# Excel em português vêm em Windows-1252
+UPLOAD_ENCODINGS = ('utf-8-sig', 'cp1252')
+
+_ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%Y-%m', '%Y')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, isbn, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'isbn': isbn, 'error': message})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def clean_isbn(value):
+    isbn = re.sub(r'[\s-]', '', value or '').upper()
+    return isbn if _ISBN_RE.match(isbn) else None
+
+
+def isbn_variants(isbn):
+    """O ISBN e seu equivalente (ISBN-13 978 <-> ISBN-10), para comparar cadastros."""
+    isbn = clean_isbn(isbn)
+    if not isbn:
+        return set()
+    variants = {isbn}
+    if len(isbn) == 13 and isbn.startswith('978'):
+        body = isbn[3:12]
+        check = (11 - sum((10 - i) * int(d) for i, d in enumerate(body)) % 11) % 11
+        variants.add(body + ('X' if check == 10 else str(check)))
+    elif len(isbn) == 10:
+        body = '978' + isbn[:9]
+        check = (10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(body)) % 10) % 10
+        variants.add(body + str(check))
+    return variants
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Data inválida: "{value}".')
+
+
+def read_csv(stream):
+    """Gera (linha, dict) a partir de um arquivo/iterável de texto CSV."""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_isbns(stream):
+    """Gera (linha, {'isbn': ...}) a partir de uma lista com um ISBN por linha."""
+    for line_number, line in enumerate(stream, start=1):
+        value = line.strip()
+        if value and not value.startswith('#'):
+            yield line_number, {'isbn': value}
+
+
+class UploadEncodingError(ValueError):
+    """O arquivo não é UTF-8 nem Windows-1252; ``line`` é a primeira linha ilegível."""
+
+    def __init__(self, line):
+        self.line = line
+        super().__init__(
+            f'Linha {line}: codificação não reconhecida. Salve o arquivo em UTF-8 '
+            f'(ou Windows-1252, o padrão do Excel) e envie de novo; nada foi importado.'
+        )
+
+
+def _first_invalid_line(upload, encoding):
+    """Linha do primeiro byte que ``encoding`` não decodifica, ou None se o arquivo é válido."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    lines = 0
+    for chunk in upload.chunks():
+        try:
+            decoder.decode(chunk)
+        except UnicodeDecodeError as exc:
+            return lines + chunk[:max(exc.start, 0)].count(b'\n') + 1
+        lines += chunk.count(b'\n')
+    try:
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return lines + 1
+    return None
+
+
+def detect_encoding(upload):
+    """
+    Confere o arquivo inteiro (em blocos) antes da importação: um erro de
+    decodificação no meio do streaming deixaria os lotes anteriores gravados.
+    """
+    for encoding in UPLOAD_ENCODINGS:
+        line = _first_invalid_line(upload, encoding)
+        if line is None:
+            return encoding
+    raise UploadEncodingError(line)
+
+
+def decode_upload(upload):
+    # Lê o arquivo enviado linha a linha, sem carregar tudo na memória
+    encoding = detect_encoding(upload)
+    upload.seek(0)
+    return codecs.iterdecode(upload, encoding)
+
+
+def _clean_row(row):
+    data = {}
+    for name in IMPORT_FIELDS:
+        value = row.get(name)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            data[name] = value
+
+    isbn = clean_isbn(data.get('isbn'))
+    if not isbn:
+        raise ValueError('ISBN ausente ou inválido.')
+    data['isbn'] = isbn
+
+    if 'publication_date' in data:
+        data['publication_date'] = parse_date(data['publication_date'])
+
+    if 'total_copies' in data:
+        try:
+            data['total_copies'] = int(data['total_copies'])
+        except ValueError:
+            raise ValueError('total_copies deve ser um número inteiro.')
+        if data['total_copies'] < 1:
+            raise ValueError('total_copies deve ser maior que zero.')
+    return data
+
+
+def google_volume_data(volume):
+    """Campos de ENRICH_FIELDS com valor real (sem os textos padrão do parser)."""
+    data = {}
+    for name in ENRICH_FIELDS:
+        value = volume.get(name)
+        if not value or value in ('Desconhecido', 'Sem Título', 'Sem descrição disponível.'):
+            continue
+        if name == 'publication_date':
+            try:
+                value = parse_date(value)
+            except ValueError:
+                continue
+        data[name] = value
+    return data
+
+
+def _enrich(entries, existing, service):
+    """
+    Completa com o Google Books os campos vazios tanto na linha quanto no
+    livro já cadastrado (um request por ISBN, em paralelo).
+    """
+    def blank(isbn, data, name):
+        book = existing.get(isbn)
+        return not data.get(name) and not (book and getattr(book, name))
+
+    pending = [
+        isbn for isbn, (_, data) in entries.items()
+        if any(blank(isbn, data, name) for name in ENRICH_FIELDS)
+    ]
+    if not pending:
+        return
+
+    executor = get_executor()
+    with timed('google'):
+        futures = {isbn: executor.submit(service.get_book_by_isbn, isbn) for isbn in pending}
+        wait(futures.values(), timeout=SEARCH_DEADLINE)
+
+    for isbn, future in futures.items():
+        if not future.done() or future.exception() or not future.result():
+            continue
+        data = entries[isbn][1]
+        for name, value in google_volume_data(future.result()).items():
+            if blank(isbn, data, name):
+                data[name] = value
+
+
+def _validation_message(exc):
+    if hasattr(exc, 'message_dict'):
+        return '; '.join(f'{name}: {" ".join(messages)}' for name, messages in exc.message_dict.items())
+    return ' '.join(exc.messages)
+
+
+def _import_batch(batch, result, enrich, service, on_error):
+    def fail(line, isbn, message):
+        result.add_error(line, isbn, message)
+        if on_error:
+            on_error(line, isbn, message)
+
+    # ISBN -> (linha, dados); repetido no mesmo lote: a última linha vence
+    entries = {}
+    for line, row in batch:
+        try:
+            data = _clean_row(row)
+        except ValueError as exc:
+            fail(line, (row.get('isbn') or '').strip(), str(exc))
+            continue
+        previous = entries.pop(data['isbn'], (None, {}))[1]
+        entries[data['isbn']] = (line, {**previous, **data})
+
+    if not entries:
+        return
+
+    existing = Book.objects.in_bulk(list(entries), field_name='isbn')
+    if enrich:
+        _enrich(entries, existing, service)
+
+    to_create, to_update, update_fields = [], [], set()
+    now = timezone.now()
+
+    for isbn, (line, data) in entries.items():
+        book = existing.get(isbn)
+        if book is None:
+            missing = [name for name in REQUIRED_FIELDS if not data.get(name)]
+            if missing:
+                fail(line, isbn, f'Campos obrigatórios ausentes: {", ".join(missing)}.')
+                continue
+            book = Book(**{**DEFAULTS, **data})
+            book.available_copies = book.total_copies
+        else:
+            changed = {name: value for name, value in data.items() if getattr(book, name) != value}
+            if not changed:
+                result.unchanged += 1
+                continue
+            if 'total_copies' in changed:
+                # Mantém os exemplares emprestados: ajusta o disponível pela diferença
+                delta = changed['total_copies'] - book.total_copies
+                book.available_copies = max(0, book.available_copies + delta)
+                update_fields.add('available_copies')
+            for name, value in changed.items():
+                setattr(book, name, value)
+            update_fields.update(changed)
+            book.updated_at = now
+
+        # Editora e idioma são opcionais na importação (o formulário exige)
+        exclude = ['cover_image'] + [name for name in ('publisher', 'language') if not getattr(book, name)]
+        try:
+            book.clean_fields(exclude=exclude)
+        except ValidationError as exc:
+            fail(line, isbn, _validation_message(exc))
+            continue
+
+        (to_update if book.pk else to_create).append((line, book))
+
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create([book for _, book in to_create])
+            if to_update:
+                Book.objects.bulk_update(
+                    [book for _, book in to_update],
+                    sorted(update_fields | {'updated_at'}),
+                )
+
+            created = [book for _, book in to_create]
+            if created and created[0].pk is None:
+                # Bancos sem RETURNING no INSERT em lote: busca os ids pelo ISBN
+                ids = dict(Book.objects.filter(isbn__in=[b.isbn for b in created]).values_list('isbn', 'pk'))
+                for book in created:
+                    book.pk = ids[book.isbn]
+
+            # bulk_create/bulk_update não disparam os signals de índice e cache
+            get_search_engine().index_many(created + [book for _, book in to_update])
+            for _, book in to_update:
+                invalidate_book_detail(book.pk)
+    except DatabaseError as exc:
+        for line, book in to_create + to_update:
+            fail(line, book.isbn, f'Erro ao gravar o lote: {exc}')
+        return
+
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_books(rows, enrich=False, batch_size=IMPORT_BATCH_SIZE, on_error=None, on_batch=None):
+    """
+    Importa (upsert por ISBN) as linhas geradas por read_csv/read_isbns.
+
+    ``on_error(linha, isbn, mensagem)`` é chamado a cada erro e
+    ``on_batch(resultado)`` ao fim de cada lote (progresso).
+    """
+    result = ImportResult()
+    service = GoogleBooksService() if enrich else None
+
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            _import_batch(batch, result, enrich, service, on_error)
+            batch = []
+            if on_batch:
+                on_batch(result)
+    if batch:
+        _import_batch(batch, result, enrich, service, on_error)
+        if on_batch:
+            on_batch(result)
+
+    if result.created or result.updated:
+        invalidate_librarian_stats()
+    return result
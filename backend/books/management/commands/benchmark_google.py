@@ -0,0 +1,173 @@
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.services import GoogleBooksService
+
+BENCH_USERNAME = 'bench_leitor'
+
+
+class _FakeGoogleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Sem isso o Nagle + ACK atrasado somam ~40 ms a cada resposta keep-alive
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        params = parse_qs(urlparse(self.path).query)
+        start = int(params.get('startIndex', ['0'])[0])
+        limit = int(params.get('maxResults', ['20'])[0])
+        items = [
+            {'id': f'bench{start + i}', 'volumeInfo': {'title': f'Livro {start + i}', 'authors': ['Autor']}}
+            for i in range(limit)
+        ]
+        body = json.dumps({'totalItems': 1000, 'items': items}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeGoogleServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # O padrão (5) descarta conexões quando o modo assíncrono abre dezenas de uma vez
+    request_queue_size = 256
+
+
+def _serve_fake_google(latency, port_pipe):
+    _FakeGoogleHandler.latency = latency
+    server = _FakeGoogleServer(('127.0.0.1', 0), _FakeGoogleHandler)
+    port_pipe.send(server.server_port)
+    server.serve_forever()
+
+
+def start_fake_google(latency):
+    """
+    Sobe um Google Books simulado (latência fixa) em outro processo, para não
+    disputar o GIL com o que está sendo medido. Devolve (processo, url base).
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve_fake_google, args=(latency, sender), daemon=True)
+    process.start()
+    port = receiver.recv()
+    return process, f'http://127.0.0.1:{port}/volumes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a vazão da busca do Google pela view síncrona (threads) e pela '
+        'assíncrona (um event loop), contra um Google Books simulado local.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requisições por modo.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requisições simultâneas.')
+        parser.add_argument('--workers', type=int, default=8, help='Threads do modo síncrono (como num worker WSGI).')
+        parser.add_argument('--latency', type=float, default=0.2, help='Latência simulada do Google, em segundos.')
+        parser.add_argument('--output', help='Arquivo JSON onde salvar os resultados.')
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(username=BENCH_USERNAME)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        server, base_url = start_fake_google(options['latency'])
+
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                    mock.patch.object(GoogleBooksService, 'BASE_URL', base_url):
+                results = [
+                    self._run_sync(options, headers),
+                    self._run_async(options, headers),
+                ]
+        finally:
+            server.terminate()
+            server.join()
+
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<6} {result['requests']} req em {result['total_s']:6.2f}s  "
+                f"{result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+                f"p95 {result['p95_ms']:8.2f}ms  erros {result['errors']}"
+            )
+
+        if options['output']:
+            report = {'options': {k: options[k] for k in ('requests', 'concurrency', 'workers', 'latency')},
+                      'results': results}
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Resultados salvos em {options['output']}."))
+
+    def _queries(self, mode, total):
+        # Termos únicos: toda requisição passa pelo Google (sem acerto de cache)
+        cache.clear()
+        return [f'bench-{mode}-{i}' for i in range(total)]
+
+    def _run_sync(self, options, headers):
+        queries = self._queries('sync', options['requests'])
+        client = Client(headers=headers)
+
+        def one(query):
+            started = time.perf_counter()
+            response = client.get('/api/books/search-global/', {'q': query, 'source': 'google'})
+            return time.perf_counter() - started, response.status_code == 200
+
+        # O limite real do modo síncrono é o número de threads do worker
+        workers = min(options['workers'], options['concurrency'])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            samples = list(pool.map(one, queries))
+        return self._summary('sync', samples, time.perf_counter() - started)
+
+    def _run_async(self, options, headers):
+        queries = self._queries('async', options['requests'])
+
+        async def run():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def one(query):
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.get(
+                        '/api/books/async/search-global/', {'q': query, 'source': 'google'}, headers=headers,
+                    )
+                    return time.perf_counter() - started, response.status_code == 200
+
+            started = time.perf_counter()
+            samples = await asyncio.gather(*(one(query) for query in queries))
+            return samples, time.perf_counter() - started
+
+        samples, elapsed = asyncio.run(run())
+        return self._summary('async', samples, elapsed)
+
+    def _summary(self, mode, samples, elapsed):
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        p95_index = max(0, int(len(latencies) * 0.95) - 1)
+        return {
+            'mode': mode,
+            'requests': len(samples),
+            'errors': sum(1 for _, ok in samples if not ok),
+            'total_s': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(latencies[p95_index], 2),
+        }
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.enrichment import (
+    ENRICHMENT_BATCH_SIZE, ENRICHMENT_RATE, enrich_incomplete_books, get_progress, reset_progress,
+)
+from books.services import GoogleBooksUnavailable
+
+
+class Command(BaseCommand):
+    help = (
+        'Completa capa, descrição, data de publicação, editora e idioma dos livros '
+        'pelo Google Books (mesma rotina da task books.tasks.enrich_books).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ENRICHMENT_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, help='Para depois de N lotes (continua na próxima execução).')
+        parser.add_argument('--rate', type=float, default=ENRICHMENT_RATE, help='Consultas por segundo ao Google.')
+        parser.add_argument('--restart', action='store_true', help='Ignora o progresso salvo e recomeça do início.')
+
+    def handle(self, *args, **options):
+        if options['restart']:
+            reset_progress()
+        elif get_progress():
+            self.stdout.write(f'Continuando a partir do livro #{get_progress()}.')
+
+        try:
+            stats = enrich_incomplete_books(
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches'],
+                rate=options['rate'],
+            )
+        except GoogleBooksUnavailable as exc:
+            raise CommandError(f'Google Books indisponível ({exc}); progresso salvo em #{get_progress()}.')
+        if stats['locked']:
+            raise CommandError('Outra execução do enriquecimento está em andamento.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['checked']} livros consultados, {stats['updated']} completados, "
+            f"{stats['not_found']} sem dados no Google ({stats['duration']:.2f}s)."
+        ))
+        if not stats['done']:
+            self.stdout.write('Ainda há livros a processar; rode de novo para continuar.')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+from books.tasks import generate_cover_thumbnails
+from books.thumbnails import thumbnails_outdated, update_cover_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas das capas enviadas que ainda não têm (ou estão desatualizadas).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regera as miniaturas de todas as capas.')
+        parser.add_argument('--async', dest='use_celery', action='store_true', help='Enfileira no Celery em vez de gerar aqui.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        books = (
+            Book.objects.exclude(cover_image='').exclude(cover_image__isnull=True)
+            | Book.objects.exclude(cover_thumbnails={})
+        ).only('cover_image', 'cover_thumbnails').order_by('pk')
+
+        generated = queued = skipped = 0
+        for book in books.iterator(chunk_size=options['batch_size']):
+            if not options['force'] and not thumbnails_outdated(book):
+                skipped += 1
+                continue
+            if options['use_celery']:
+                generate_cover_thumbnails.delay(book.pk)
+                queued += 1
+            elif update_cover_thumbnails(book.pk, force=options['force']) is not None:
+                generated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{generated} livros processados, {queued} enfileirados, {skipped} já em dia.'
+        ))
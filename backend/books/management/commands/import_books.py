@@ -0,0 +1,53 @@
+import sys
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from books.importer import IMPORT_BATCH_SIZE, UploadEncodingError, decode_upload, import_books, read_csv, read_isbns
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa livros em lote a partir de um CSV ou de uma lista de ISBNs '
+        '(upsert por ISBN). Use "-" para ler da entrada padrão.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'isbns'], help='Padrão: pela extensão (.csv = csv, senão isbns).')
+        parser.add_argument('--enrich', action='store_true', help='Completa campos vazios com o Google Books.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'isbns')
+        reader = read_csv if fmt == 'csv' else read_isbns
+
+        def on_error(line, isbn, message):
+            self.stderr.write(f'Linha {line} ({isbn or "sem ISBN"}): {message}')
+
+        def on_batch(result):
+            self.stdout.write(
+                f'{result.created} criados, {result.updated} atualizados, {result.failed} com erro...'
+            )
+
+        try:
+            source = sys.stdin if path == '-' else File(open(path, 'rb'))
+        except OSError as exc:
+            raise CommandError(f'Não foi possível abrir {path}: {exc}')
+
+        with source:
+            try:
+                # Arquivos: UTF-8 ou Windows-1252 (CSV do Excel), conferido antes de importar
+                stream = source if path == '-' else decode_upload(source)
+            except UploadEncodingError as exc:
+                raise CommandError(str(exc))
+            result = import_books(
+                reader(stream), enrich=options['enrich'], batch_size=options['batch_size'],
+                on_error=on_error, on_batch=on_batch,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Importação concluída: {result.created} criados, {result.updated} atualizados, '
+            f'{result.unchanged} sem alterações, {result.failed} com erro.'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from books.models import Book
+from books.search import get_search_engine
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca textual do acervo (backfill/reindex).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        engine = get_search_engine()
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            engine.clear()
+            total = engine.rebuild(Book.objects.order_by('pk').iterator(chunk_size=batch_size))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} livros reindexados ({engine.__class__.__name__}).'
+        ))
@@ -0,0 +1,87 @@
+import unicodedata
+
+from django.db import migrations
+
+# Cópia congelada do que books.search usava quando esta migração foi escrita:
+# migrações não importam código da app (mudanças nele alterariam o histórico).
+FTS_TABLE = 'books_book_fts'
+SEARCH_FIELDS = (
+    ('title', 'A'),
+    ('author', 'A'),
+    ('isbn', 'A'),
+    ('genre', 'C'),
+    ('publisher', 'C'),
+    ('description', 'D'),
+)
+SEARCH_FIELD_NAMES = tuple(name for name, _ in SEARCH_FIELDS)
+
+
+def _normalize(text):
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def _documents(apps):
+    Book = apps.get_model('books', 'Book')
+    for pk, *values in Book.objects.values_list('pk', *SEARCH_FIELD_NAMES).iterator(chunk_size=1000):
+        yield pk, [_normalize(value) for value in values]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute("ALTER TABLE books_book ADD COLUMN search_vector tsvector")
+        schema_editor.execute("ALTER TABLE books_book ADD COLUMN search_text text NOT NULL DEFAULT ''")
+        schema_editor.execute(
+            "CREATE INDEX books_book_search_vector_gin ON books_book USING gin (search_vector)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX books_book_search_text_trgm ON books_book USING gin (search_text gin_trgm_ops)"
+        )
+        vector_sql = ' || '.join(
+            f"setweight(to_tsvector('simple', %s), '{weight}')" for _, weight in SEARCH_FIELDS
+        )
+        sql = f"UPDATE books_book SET search_vector = {vector_sql}, search_text = %s WHERE id = %s"
+        rows = [[*document, ' '.join(document), pk] for pk, document in _documents(apps)]
+    elif vendor == 'sqlite':
+        columns = ', '.join(SEARCH_FIELD_NAMES)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{columns}, tokenize='unicode61 remove_diacritics 2')"
+        )
+        placeholders = ', '.join(['%s'] * len(SEARCH_FIELD_NAMES))
+        sql = f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})"
+        rows = [[pk, *document] for pk, document in _documents(apps)]
+    else:
+        return
+
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS books_book_search_text_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS books_book_search_vector_gin")
+        schema_editor.execute("ALTER TABLE books_book DROP COLUMN IF EXISTS search_text")
+        schema_editor.execute("ALTER TABLE books_book DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Filtros genre/language usam icontains (UPPER(col) LIKE UPPER('%x%')),
+    # que só é indexável no PostgreSQL com pg_trgm (criado na 0003)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('genre', 'language'):
+        schema_editor.execute(
+            f"CREATE INDEX books_book_{column}_trgm ON books_book "
+            f"USING gin (UPPER({column}) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in ('genre', 'language'):
+        schema_editor.execute(f"DROP INDEX IF EXISTS books_book_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['-created_at', '-id'], name='book_available_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaserequest',
+            index=models.Index(fields=['user', 'title'], name='purchase_user_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaserequest',
+            index=models.Index(fields=['-created_at', '-id'], name='purchase_created_id_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
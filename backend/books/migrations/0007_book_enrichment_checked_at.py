@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_book_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='enrichment_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Enriquecido em'),
+        ),
+    ]
@@ -16,6 +16,10 @@ class Book(models.Model):
     
     cover_image = models.ImageField(upload_to='covers/', null=True, blank=True, verbose_name="Capa (Arquivo local)")
     cover_url = models.URLField(null=True, blank=True, verbose_name="Capa (URL externa)")
+    # Miniaturas geradas a partir da cover_image ({'small': caminho, ...}); ver books.thumbnails
+    cover_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Miniaturas da capa")
+    # Última consulta ao Google pelo enriquecimento (books.enrichment), com ou sem dados
+    enrichment_checked_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Enriquecido em")
     
     total_copies = models.PositiveIntegerField(default=1, verbose_name="Total de Cópias")
     available_copies = models.PositiveIntegerField(default=1, verbose_name="Cópias Disponíveis")
@@ -23,6 +27,20 @@ class Book(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Ordenação padrão do acervo e da paginação por cursor
+            models.Index(fields=['-created_at', '-id'], name='book_created_id_idx'),
+            # Filtro ?available=true
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(available_copies__gt=0),
+                name='book_available_created_idx',
+            ),
+            # Validador do GET condicional das listagens (max(updated_at) + contagem)
+            models.Index(fields=['updated_at'], name='book_updated_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -48,5 +66,12 @@ class PurchaseRequest(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Checagem de duplicidade em PurchaseRequestView
+            models.Index(fields=['user', 'title'], name='purchase_user_title_idx'),
+            models.Index(fields=['-created_at', '-id'], name='purchase_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"Solicitação: {self.title} por {self.user.username}"
\ No newline at end of file
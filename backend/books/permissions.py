@@ -16,4 +16,12 @@ class IsLibrarianOrReadOnly(permissions.BasePermission):
         # O usuário precisa estar logado E ser Bibliotecário ou Superusuário.
         return request.user.is_authenticated and (
             request.user.role == 'LIBRARIAN' or request.user.is_staff
-        )
\ No newline at end of file
+        )
+
+class IsLibrarian(permissions.BasePermission):
+    """Apenas Bibliotecários/Admins (ex.: exportações do acervo)."""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.role == 'LIBRARIAN' or request.user.is_staff
+        )
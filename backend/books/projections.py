@@ -0,0 +1,40 @@
+from django.core.files.storage import default_storage
+
+from sistema_biblioteca.projections import Projection, file_url_formatter, format_date, datetime_formatter
+from .serializers import BookSerializer, _status_from_loan_status, status_map_for
+
+
+class BookProjection(Projection):
+    """values() equivalente ao BookSerializer (listagem da busca global)."""
+    serializer_class = BookSerializer
+    columns = {
+        **{name: name for name in BookSerializer.Meta.fields},
+        # Calculado a partir do id (mapa de empréstimos do usuário)
+        'status_usuario': 'id',
+    }
+
+    def get_formatters(self, request, records):
+        format_datetime = datetime_formatter()
+        formatters = {
+            'publication_date': format_date,
+            'cover_image': file_url_formatter(request),
+            'cover_thumbnails': self._thumbnails_formatter(request),
+            'created_at': format_datetime,
+            'updated_at': format_datetime,
+        }
+        if 'status_usuario' in self.get_fields(request):
+            status_map = status_map_for(request, [record['id'] for record in records])
+            formatters['status_usuario'] = lambda pk: _status_from_loan_status(status_map.get(pk))
+        return formatters
+
+    @staticmethod
+    def _thumbnails_formatter(request):
+        # Mesmo resultado de BookSerializer.get_cover_thumbnails
+        def format_thumbnails(thumbnails):
+            urls = {}
+            for size, name in (thumbnails or {}).items():
+                url = default_storage.url(name)
+                urls[size] = request.build_absolute_uri(url) if request else url
+            return urls
+
+        return format_thumbnails
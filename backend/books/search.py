@@ -0,0 +1,214 @@
+"""
+Motor de busca textual do acervo local.
+
+O índice vive fora das colunas do model e depende do banco em uso:
+
+- PostgreSQL: colunas ``search_vector`` (tsvector com pesos) e ``search_text``
+  (texto normalizado) em ``books_book``, com índices GIN e trigram.
+- SQLite: tabela virtual FTS5 ``books_book_fts`` (rowid = id do livro).
+- Outros bancos: fallback com icontains (sem ranking).
+
+O texto é normalizado em Python (minúsculas e sem acentos) tanto na indexação
+quanto na consulta, então "Sao Joao" encontra "São João" em qualquer backend.
+Todos os motores anotam ``search_rank`` no queryset (maior = mais relevante).
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Campo, peso no PostgreSQL e peso no bm25 do FTS5
+SEARCH_FIELDS = (
+    ('title', 'A', 10.0),
+    ('author', 'A', 8.0),
+    ('isbn', 'A', 10.0),
+    ('genre', 'C', 3.0),
+    ('publisher', 'C', 3.0),
+    ('description', 'D', 1.0),
+)
+SEARCH_FIELD_NAMES = tuple(name for name, _, _ in SEARCH_FIELDS)
+
+FTS_TABLE = 'books_book_fts'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _document(book):
+    return [normalize(getattr(book, name, '') or '') for name in SEARCH_FIELD_NAMES]
+
+
+class BaseBookSearch:
+    def index(self, book):
+        pass
+
+    def index_many(self, books):
+        """Indexa vários livros de uma vez (importação em lote)."""
+        for book in books:
+            self.index(book)
+
+    def remove(self, book_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, books):
+        """Reindexa os livros recebidos (iterável) e retorna a quantidade."""
+        count = 0
+        for book in books:
+            self.index(book)
+            count += 1
+        return count
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class IContainsBookSearch(BaseBookSearch):
+    def search(self, queryset, query):
+        condition = Q()
+        for name in SEARCH_FIELD_NAMES:
+            condition |= Q(**{f'{name}__icontains': query})
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+class PostgresBookSearch(BaseBookSearch):
+    CONFIG = 'simple'
+
+    def _vector_sql(self):
+        parts = [
+            f"setweight(to_tsvector('{self.CONFIG}', %s), '{weight}')"
+            for _, weight, _ in SEARCH_FIELDS
+        ]
+        return ' || '.join(parts)
+
+    def index(self, book):
+        document = _document(book)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE books_book SET search_vector = {self._vector_sql()}, "
+                f"search_text = %s WHERE id = %s",
+                [*document, ' '.join(document), book.pk],
+            )
+
+    def index_many(self, books):
+        rows = []
+        for book in books:
+            document = _document(book)
+            rows.append([*document, ' '.join(document), book.pk])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE books_book SET search_vector = {self._vector_sql()}, "
+                f"search_text = %s WHERE id = %s",
+                rows,
+            )
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        text = ' '.join(tokens)
+        # "<%" usa o índice trigram (limiar em pg_trgm.word_similarity_threshold)
+        match = RawSQL(
+            f"(books_book.search_vector @@ to_tsquery('{self.CONFIG}', %s) "
+            f"OR %s <%% books_book.search_text)",
+            [tsquery, text],
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"(ts_rank(books_book.search_vector, to_tsquery('{self.CONFIG}', %s)) "
+            f"+ word_similarity(%s, books_book.search_text))",
+            [tsquery, text],
+            output_field=FloatField(),
+        )
+        return queryset.filter(match).annotate(search_rank=rank)
+
+
+class SqliteFtsBookSearch(BaseBookSearch):
+    def index(self, book):
+        columns = ', '.join(SEARCH_FIELD_NAMES)
+        placeholders = ', '.join(['%s'] * len(SEARCH_FIELD_NAMES))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})",
+                [book.pk, *_document(book)],
+            )
+
+    def index_many(self, books):
+        books = list(books)
+        columns = ', '.join(SEARCH_FIELD_NAMES)
+        placeholders = ', '.join(['%s'] * len(SEARCH_FIELD_NAMES))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[book.pk] for book in books])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})",
+                [[book.pk, *_document(book)] for book in books],
+            )
+
+    def remove(self, book_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for _, _, weight in SEARCH_FIELDS)
+        # bm25 é "menor = melhor"; invertemos para manter search_rank crescente
+        rank = RawSQL(
+            f"(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = books_book.id)",
+            [match],
+            output_field=FloatField(),
+        )
+        matching_ids = RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+        )
+        return queryset.filter(pk__in=matching_ids).annotate(search_rank=rank)
+
+
+_fts_available = {}
+
+
+def _sqlite_has_fts_table():
+    # Só memoriza o resultado positivo: a tabela pode surgir após o migrate
+    if not _fts_available.get(connection.alias):
+        _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[connection.alias]
+
+
+def get_search_engine():
+    if connection.vendor == 'postgresql':
+        return PostgresBookSearch()
+    if connection.vendor == 'sqlite' and _sqlite_has_fts_table():
+        return SqliteFtsBookSearch()
+    return IContainsBookSearch()
+
+
+def search_books(queryset, query):
+    """Filtra o queryset pela busca textual e anota ``search_rank``."""
+    return get_search_engine().search(queryset, query)
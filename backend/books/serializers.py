@@ -1,8 +1,124 @@
+from django.core.files.storage import default_storage
+from django.db import models
 from rest_framework import serializers
+from sistema_biblioteca.instrumentation import TimedListSerializer, TimedSerializerMixin
+from sistema_biblioteca.sparse import SparseFieldsetMixin
 from .models import Book, PurchaseRequest  # <--- Adicionado PurchaseRequest
 
-class BookSerializer(serializers.ModelSerializer):
+STATUS_EMPRESTIMO_ABERTO = ['PENDING', 'ACTIVE', 'OVERDUE']
+
+
+def _status_from_loan_status(loan_status):
+    if loan_status is None:
+        return 'disponivel'
+
+    if loan_status == 'PENDING':
+        return 'solicitado'
+
+    return 'alugado'
+
+
+def status_usuario_for(request, book_id):
+    """Status do livro para o usuário da requisição (uma consulta)."""
+    if not request or not request.user.is_authenticated:
+        return 'disponivel'
+
+    try:
+        from loans.models import Loan
+    except ImportError:
+        return 'disponivel'
+
+    # Verifica status do livro para o usuário atual
+    loan = Loan.objects.filter(
+        user=request.user, 
+        book_id=book_id, 
+        status__in=STATUS_EMPRESTIMO_ABERTO
+    ).first()
+
+    return _status_from_loan_status(loan.status if loan else None)
+
+
+def status_usuario_version(request):
+    """
+    Resumo dos empréstimos do usuário que muda sempre que algum status_usuario
+    pode mudar (parte do ETag das listagens), numa consulta só e sem estado em
+    cache. Empréstimos novos mudam o total e o maior id; as transições mudam
+    as contagens de pendentes/abertos; a soma dos livros de cada grupo pega a
+    edição de um empréstimo para outro livro (LoanViewSet.update).
+    """
+    if not request or not request.user.is_authenticated:
+        return None
+
+    try:
+        from loans.models import Loan
+    except ImportError:
+        return None
+
+    pending = models.Q(status='PENDING')
+    open_ = models.Q(status__in=STATUS_EMPRESTIMO_ABERTO)
+    summary = Loan.objects.filter(user=request.user).aggregate(
+        total=models.Count('id'),
+        last=models.Max('id'),
+        pending=models.Count('id', filter=pending),
+        open=models.Count('id', filter=open_),
+        pending_books=models.Sum('book_id', filter=pending),
+        open_books=models.Sum('book_id', filter=open_),
+    )
+    return (
+        request.user.pk, summary['total'], summary['last'], summary['pending'], summary['open'],
+        summary['pending_books'], summary['open_books'],
+    )
+
+
+def status_map_for(request, book_ids):
+    """{book_id: status do empréstimo aberto} do usuário para vários livros (uma consulta)."""
+    if not request or not request.user.is_authenticated or not book_ids:
+        return {}
+
+    try:
+        from loans.models import Loan
+    except ImportError:
+        return {}
+
+    loans = Loan.objects.filter(
+        user=request.user,
+        book_id__in=book_ids,
+        status__in=STATUS_EMPRESTIMO_ABERTO
+    ).order_by('pk').values_list('book_id', 'status')
+
+    # Mantém o mesmo critério do .first() individual (menor pk por livro)
+    status_map = {}
+    for book_id, loan_status in loans:
+        status_map.setdefault(book_id, loan_status)
+    return status_map
+
+
+class BookListSerializer(TimedListSerializer):
+    """
+    Resolve o status_usuario da página inteira com uma única consulta,
+    em vez de uma consulta de Loan por livro serializado.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        books = list(iterable)
+
+        # Sem status_usuario no recorte pedido (?fields=/?omit=) não há o que consultar
+        wants_status = 'status_usuario' in self.child.fields
+        self.child._status_map = self._build_status_map(books) if wants_status else {}
+        try:
+            return [self.child.to_representation(item) for item in books]
+        finally:
+            self.child._status_map = None
+
+    def _build_status_map(self, books):
+        return status_map_for(self.context.get('request'), [book.pk for book in books])
+
+
+class BookSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     cover_image = serializers.ImageField(required=False)
+    # URLs das miniaturas por tamanho (vazio até a task gerar); ver books.thumbnails
+    cover_thumbnails = serializers.SerializerMethodField()
     status_usuario = serializers.SerializerMethodField()
 
     class Meta:
@@ -10,39 +126,35 @@ class BookSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'author', 'isbn', 'publisher', 
             'publication_date', 'genre', 'language', 'description', 
-            'cover_image', 'cover_url', 'total_copies', 
+            'cover_image', 'cover_thumbnails', 'cover_url', 'total_copies', 
             'available_copies', 'created_at', 'updated_at',
             'status_usuario' 
         ]
-        read_only_fields = ('created_at', 'updated_at', 'available_copies', 'status_usuario')
+        read_only_fields = ('created_at', 'updated_at', 'available_copies', 'cover_thumbnails', 'status_usuario')
+        list_serializer_class = BookListSerializer
+        # ?compact=true: o que os cards do acervo e da busca usam (ver sistema_biblioteca.sparse)
+        compact_fields = [
+            'id', 'title', 'author', 'isbn', 'cover_image', 'cover_thumbnails',
+            'cover_url', 'available_copies', 'status_usuario',
+        ]
+        field_columns = {'status_usuario': ()}
 
-    def get_status_usuario(self, obj):
+    _status_map = None
+
+    def get_cover_thumbnails(self, obj):
         request = self.context.get('request')
-        
-        if not request or not request.user.is_authenticated:
-            return 'disponivel'
+        urls = {}
+        for size, name in (obj.cover_thumbnails or {}).items():
+            url = default_storage.url(name)
+            urls[size] = request.build_absolute_uri(url) if request else url
+        return urls
 
-        user = request.user
+    def get_status_usuario(self, obj):
+        # Quando serializado via many=True, o mapa já foi carregado pela lista
+        if self._status_map is not None:
+            return _status_from_loan_status(self._status_map.get(obj.pk))
 
-        try:
-            from loans.models import Loan
-        except ImportError:
-            return 'disponivel'
-
-        # Verifica status do livro para o usuário atual
-        loan = Loan.objects.filter(
-            user=user, 
-            book=obj, 
-            status__in=['PENDING', 'ACTIVE', 'OVERDUE']
-        ).first()
-
-        if not loan:
-            return 'disponivel'
-        
-        if loan.status == 'PENDING':
-            return 'solicitado'
-        
-        return 'alugado'
+        return status_usuario_for(self.context.get('request'), obj.pk)
 
     def update(self, instance, validated_data):
         new_total = validated_data.get('total_copies')
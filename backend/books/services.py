@@ -1,10 +1,24 @@
 from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
 import requests
 from dataclasses import dataclass, asdict
-from typing import List, Optional, Dict, Any, Set
+from typing import Callable, List, Optional, Dict, Any, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+import asyncio
+import hashlib
+import httpx
+import logging
+import os
 import random
+import threading
 import time
 
+from sistema_biblioteca.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
 try:
     # Acessa a chave de forma segura
     API_KEY = settings.GOOGLE_API_KEY
@@ -14,6 +28,95 @@ except AttributeError:
 BASE_URL = "https://www.googleapis.com/books/v1/volumes"
 MAX_API_RESULTS = 40 # Variável de classe
 
+# Cache compartilhado (Django cache) das respostas do Google. TTLs em segundos.
+SEARCH_CACHE_TTL = getattr(settings, 'GOOGLE_BOOKS_SEARCH_CACHE_TTL', 60 * 60)
+VOLUME_CACHE_TTL = getattr(settings, 'GOOGLE_BOOKS_VOLUME_CACHE_TTL', 60 * 60 * 24)
+NEGATIVE_CACHE_TTL = getattr(settings, 'GOOGLE_BOOKS_NEGATIVE_CACHE_TTL', 60)
+CACHE_PREFIX = 'google_books'
+
+# Prazo total (segundos) para os blocos paralelos de uma página de busca
+SEARCH_DEADLINE = getattr(settings, 'GOOGLE_BOOKS_SEARCH_DEADLINE', 6.0)
+HTTP_POOL_SIZE = 20
+# Conexões simultâneas do cliente assíncrono (views ASGI); várias requisições dividem um worker
+ASYNC_HTTP_MAX_CONNECTIONS = getattr(settings, 'GOOGLE_BOOKS_ASYNC_MAX_CONNECTIONS', 100)
+
+_pool_lock = threading.Lock()
+_pool_pid = None
+_http_session = None
+_executor = None
+
+
+def _ensure_pools():
+    """
+    Session (keep-alive) e executor compartilhados pelo processo.
+    São recriados após um fork (ex.: workers prefork do Celery/gunicorn),
+    para não herdar sockets ou threads do processo pai.
+    """
+    global _pool_pid, _http_session, _executor
+    pid = os.getpid()
+    if _pool_pid == pid:
+        return
+    with _pool_lock:
+        if _pool_pid == pid:
+            return
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+        _executor = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="google-books")
+        _pool_pid = pid
+
+
+def get_http_session() -> requests.Session:
+    _ensure_pools()
+    return _http_session
+
+
+def get_executor() -> ThreadPoolExecutor:
+    _ensure_pools()
+    return _executor
+
+
+# Um cliente por event loop; sai daqui quando o loop é encerrado (_close_with_loop)
+_async_clients = {}
+
+
+async def _close_with_loop(loop, client):
+    # Fica pendente enquanto o loop roda. asyncio.run (uvicorn) e o async_to_sync
+    # do asgiref cancelam as tasks restantes ao encerrar o loop: o cliente é
+    # fechado ali, no loop em que foi criado
+    try:
+        await asyncio.Event().wait()
+    finally:
+        _async_clients.pop(loop, None)
+        await client.aclose()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Cliente httpx (keep-alive) do event loop atual. Sob um servidor ASGI há
+    um loop por worker, então o pool de conexões é compartilhado por todas
+    as requisições daquele worker. O cliente é fechado quando o loop termina.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        # Loops fechados sem cancelar as tasks não passaram pelo _close_with_loop
+        for closed in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[closed]
+        client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=ASYNC_HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_POOL_SIZE,
+        ))
+        # O loop só guarda referência fraca das tasks: a entrada mantém a do fechamento viva
+        entry = _async_clients[loop] = (client, loop.create_task(_close_with_loop(loop, client)))
+    return entry[0]
+
+
+class GoogleBooksUnavailable(Exception):
+    """Falha de rede/HTTP (inclusive 429) ao consultar o Google Books."""
+
+
 @dataclass
 class Book:
     google_id: str
@@ -45,69 +148,189 @@ class GoogleBooksService:
         "Romance", "Fantasy", "Horror", "Biography", "Children"
     ]
 
+    LANG_RESTRICT = "pt"
+
     def __init__(self, timeout: float = 5.0):
         self.timeout = timeout
         pass 
 
+    # --- Cache -------------------------------------------------------------
+
+    @staticmethod
+    def _cache_key(kind: str, *parts: Any) -> str:
+        raw = "|".join(str(part) for part in parts)
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"{CACHE_PREFIX}:{kind}:{digest}"
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _count(event: str) -> None:
+        key = f"{CACHE_PREFIX}:stats:{event}"
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Chave expulsa entre o add e o incr; a contagem perde um evento
+            pass
+
+    def _cache_get(self, key: str) -> Tuple[bool, Any]:
+        entry = cache.get(key)
+        if entry is None:
+            self._count("miss")
+            return False, None
+        self._count("hit")
+        return True, entry["value"]
+
+    def _cache_set(self, key: str, value: Any, ttl: int) -> None:
+        # Envolve o valor para que respostas negativas (None/[]) também sejam cacheadas
+        cache.set(key, {"value": value}, timeout=ttl)
+
+    # Cache nas views assíncronas: cada operação vira um único salto para uma
+    # thread (get + contagem juntos). O cache é thread-safe, então não precisa
+    # da thread única do sync_to_async padrão, que serializa as requisições.
+    async def _acache_get(self, key: str) -> Tuple[bool, Any]:
+        return await sync_to_async(self._cache_get, thread_sensitive=False)(key)
+
+    async def _acache_set(self, key: str, value: Any, ttl: int) -> None:
+        await sync_to_async(self._cache_set, thread_sensitive=False)(key, value, ttl)
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, int]:
+        keys = {event: f"{CACHE_PREFIX}:stats:{event}" for event in ("hit", "miss")}
+        values = cache.get_many(list(keys.values()))
+        return {event: values.get(key, 0) for event, key in keys.items()}
+
     def search_books(self, query: Optional[str], page: int = 1, genre: Optional[str] = None, max_results: int = 40) -> List[Dict[str, Any]]:
         
-        is_deterministic_search = bool(query) or (genre and genre != "ALL") or (page > 1)
-
-        if is_deterministic_search:
-            q = query.strip() if query else "subject:fiction" 
-            if genre and genre != "ALL":
-                q = f"{q} subject:{genre}".strip()
-
-            results = []
-            block_size = 20  # A API parece limitar a 20, mesmo pedindo 40
-            num_fetches = (max_results + block_size - 1) // block_size # Ex: 40/20 = 2 fetches
-
-            for i in range(num_fetches):
-                # Calcula o offset para a página e para o fetch atual dentro da página
-                start_index = ((page - 1) * max_results) + (i * block_size)
-                
-                block = self._fetch(q, start_index, block_size)
-                
-                # Adiciona à lista, garantindo que não haja duplicatas
-                for book in block:
-                    if book['google_id'] not in {b['google_id'] for b in results}:
-                        results.append(book)
-
-                # Se a API retornar menos do que pedimos, não há mais resultados para buscar
-                if len(block) < block_size:
-                    break
-            
-            return results[:max_results]
-
-        else:
+        futures = self.start_search(query, page, genre, max_results)
+        if futures is None:
             # Se não tem query nem filtro, não retorna nada do Google (comportamento limpo)
             return []
 
-    def _fetch(self, query: str, start: int, limit: int) -> List[Dict[str, Any]]:
-        if not query: return []
-        
+        with timed('google'):
+            results, _ = self.collect_search(futures, max_results, SEARCH_DEADLINE)
+        return results
+
+    def start_search(self, query: Optional[str], page: int = 1, genre: Optional[str] = None, max_results: int = 40) -> Optional[List[Future]]:
+        """
+        Dispara os blocos da página em paralelo (no executor) e devolve os
+        futures, para quem chama poder fazer outro trabalho enquanto o Google
+        responde. None quando não há o que buscar.
+        """
+        q = self._build_query(query, page, genre)
+        if not q:
+            return None
+
+        executor = get_executor()
+        return [
+            executor.submit(self._fetch, q, start, limit)
+            for start, limit in self._blocks(page, max_results)
+        ]
+
+    def collect_search(self, futures: List[Future], max_results: int, timeout: float) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Espera os blocos por até ``timeout`` segundos e junta os que chegaram.
+        Devolve (resultados, completo). Blocos atrasados continuam rodando e
+        preenchem o cache para a próxima busca.
+        """
+        done, _ = wait(futures, timeout=max(0.0, timeout))
+        blocks = [future.result() if future in done else None for future in futures]
+        return self._merge_blocks(blocks, max_results), len(done) == len(futures)
+
+    # Blocos de uma página: a API parece limitar a 20, mesmo pedindo 40
+    BLOCK_SIZE = 20
+
+    @staticmethod
+    def _build_query(query: Optional[str], page: int, genre: Optional[str]) -> Optional[str]:
+        is_deterministic_search = bool(query) or (genre and genre != "ALL") or (page > 1)
+        if not is_deterministic_search:
+            return None
+
+        q = query.strip() if query else "subject:fiction"
+        if genre and genre != "ALL":
+            q = f"{q} subject:{genre}".strip()
+        return q
+
+    def _blocks(self, page: int, max_results: int) -> List[Tuple[int, int]]:
+        num_fetches = (max_results + self.BLOCK_SIZE - 1) // self.BLOCK_SIZE  # Ex: 40/20 = 2 fetches
+        first = (page - 1) * max_results
+        return [(first + i * self.BLOCK_SIZE, self.BLOCK_SIZE) for i in range(num_fetches)]
+
+    def _merge_blocks(self, blocks: List[Optional[List[Dict[str, Any]]]], max_results: int) -> List[Dict[str, Any]]:
+        results = []
+        seen_ids = set()
+        for block in blocks:
+            # Bloco que estourou o prazo (None) encerra a página (mantém a ordem dos resultados)
+            if block is None:
+                break
+
+            # Adiciona à lista, garantindo que não haja duplicatas
+            for book in block:
+                if book['google_id'] not in seen_ids:
+                    seen_ids.add(book['google_id'])
+                    results.append(book)
+
+            # Se a API retornar menos do que pedimos, não há mais resultados para buscar
+            if len(block) < self.BLOCK_SIZE:
+                break
+
+        return results[:max_results]
+
+    def _search_request(self, query: str, start: int, limit: int) -> Tuple[Dict[str, Any], str]:
+        """Parâmetros da chamada à API e a chave de cache correspondente."""
         params = {
             "q": query,
             # CORRIGIDO: Acessando a variável de classe corretamente
             "maxResults": min(limit, self.MAX_API_RESULTS), 
             "startIndex": max(0, start),
-            "langRestrict": "pt",
+            "langRestrict": self.LANG_RESTRICT,
             "key": API_KEY 
         }
-        
+
+        key = self._cache_key(
+            "search", self._normalize_query(query), params["startIndex"],
+            params["maxResults"], params["langRestrict"],
+        )
+        return params, key
+
+    def _parse_search(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        items = data.get("items") or []
+        return [asdict(self._parse_volume(item)) for item in items]
+
+    def _fetch(self, query: str, start: int, limit: int, raise_errors: bool = False,
+               before_request: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+        if not query: return []
+
+        params, key = self._search_request(query, start, limit)
+        hit, cached = self._cache_get(key)
+        if hit:
+            return cached
+
+        # Só consultas que vão de fato ao Google (ex.: o throttle do enriquecimento)
+        if before_request is not None:
+            before_request()
         try:
-            resp = requests.get(self.BASE_URL, params=params, timeout=self.timeout)
+            resp = get_http_session().get(self.BASE_URL, params=params, timeout=self.timeout)
             resp.raise_for_status()
             data = resp.json()
         except requests.exceptions.RequestException as e:
-            print(f"ERRO CRÍTICO NA API GOOGLE: {e}")
+            if raise_errors:
+                # Quem pediu vai tentar de novo: não grava resultado negativo no cache
+                raise GoogleBooksUnavailable(str(e)) from e
+            logger.warning('Google Books indisponível: %s', e)
+            self._cache_set(key, [], NEGATIVE_CACHE_TTL)
             return []
         except Exception as e:
-            print(f"Erro ao decodificar JSON ou erro desconhecido: {e}")
+            logger.exception('Resposta inesperada do Google Books')
+            self._cache_set(key, [], NEGATIVE_CACHE_TTL)
             return []
 
-        items = data.get("items") or []
-        return [asdict(self._parse_volume(item)) for item in items]
+        results = self._parse_search(data)
+        self._cache_set(key, results, SEARCH_CACHE_TTL if results else NEGATIVE_CACHE_TTL)
+        return results
 
     def _parse_volume(self, item: Dict[str, Any]) -> Book:
         info = item.get('volumeInfo', {})
@@ -137,14 +360,103 @@ class GoogleBooksService:
             publication_date=info.get("publishedDate", "")
         )
         
+    def get_book_by_isbn(self, isbn: str, raise_errors: bool = False,
+                         before_request: Optional[Callable[[], None]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Primeiro volume do Google para o ISBN (usa o mesmo cache da busca).
+        Com ``raise_errors`` falhas de rede/HTTP levantam GoogleBooksUnavailable
+        em vez de virar "não encontrado". ``before_request`` roda antes da
+        chamada HTTP, nunca quando a resposta vem do cache.
+        """
+        results = self._fetch(f"isbn:{isbn}", 0, 1, raise_errors=raise_errors, before_request=before_request)
+        return results[0] if results else None
+
     def get_book_by_google_id(self, google_id):
+        key = self._cache_key("volume", google_id)
+        hit, cached = self._cache_get(key)
+        if hit:
+            return cached
+
         url = f"{self.BASE_URL}/{google_id}"
         params = {'key': API_KEY}
         
         try:
-            response = requests.get(url, params=params, timeout=self.timeout)
-            response.raise_for_status()
-            data = response.json()
-            return asdict(self._parse_volume(data))
+            with timed('google'):
+                response = get_http_session().get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            book = asdict(self._parse_volume(data))
         except Exception:
-            return None
\ No newline at end of file
+            self._cache_set(key, None, NEGATIVE_CACHE_TTL)
+            return None
+
+        self._cache_set(key, book, VOLUME_CACHE_TTL)
+        return book
+
+    # --- Versões assíncronas (views ASGI) ------------------------------------
+    # Mesmas regras, chaves de cache e formato de resposta das versões síncronas,
+    # mas com httpx: a espera pelo Google não prende uma thread do worker.
+
+    async def asearch_books(self, query: Optional[str], page: int = 1, genre: Optional[str] = None, max_results: int = 40) -> List[Dict[str, Any]]:
+        q = self._build_query(query, page, genre)
+        if not q:
+            return []
+
+        with timed('google'):
+            tasks = [
+                asyncio.ensure_future(self._afetch(q, start, limit))
+                for start, limit in self._blocks(page, max_results)
+            ]
+            done, pending = await asyncio.wait(tasks, timeout=SEARCH_DEADLINE)
+        for task in pending:
+            task.cancel()
+
+        blocks = [task.result() if task in done else None for task in tasks]
+        return self._merge_blocks(blocks, max_results)
+
+    async def _afetch(self, query: str, start: int, limit: int) -> List[Dict[str, Any]]:
+        if not query: return []
+
+        params, key = self._search_request(query, start, limit)
+        hit, cached = await self._acache_get(key)
+        if hit:
+            return cached
+
+        try:
+            resp = await get_async_client().get(self.BASE_URL, params=params, timeout=self.timeout)
+            resp.raise_for_status()
+            data = resp.json()
+        except httpx.HTTPError as e:
+            logger.warning('Google Books indisponível: %s', e)
+            await self._acache_set(key, [], NEGATIVE_CACHE_TTL)
+            return []
+        except Exception as e:
+            logger.exception('Resposta inesperada do Google Books')
+            await self._acache_set(key, [], NEGATIVE_CACHE_TTL)
+            return []
+
+        results = self._parse_search(data)
+        await self._acache_set(key, results, SEARCH_CACHE_TTL if results else NEGATIVE_CACHE_TTL)
+        return results
+
+    async def aget_book_by_google_id(self, google_id):
+        key = self._cache_key("volume", google_id)
+        hit, cached = await self._acache_get(key)
+        if hit:
+            return cached
+
+        url = f"{self.BASE_URL}/{google_id}"
+        params = {'key': API_KEY}
+
+        try:
+            with timed('google'):
+                response = await get_async_client().get(url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            book = asdict(self._parse_volume(data))
+        except Exception:
+            await self._acache_set(key, None, NEGATIVE_CACHE_TTL)
+            return None
+
+        await self._acache_set(key, book, VOLUME_CACHE_TTL)
+        return book
\ No newline at end of file
@@ -1,14 +1,56 @@
+import logging
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
+from kombu.exceptions import OperationalError
+from .cache import invalidate_book_detail
 from .models import Book
+from .search import SEARCH_FIELD_NAMES, get_search_engine
+from .thumbnails import delete_thumbnail_files, thumbnails_outdated
 from loans.models import Loan
 
+logger = logging.getLogger(__name__)
+
 @receiver(post_save, sender=Book)
 @receiver(post_delete, sender=Book)
 def clear_book_cache(sender, instance, **kwargs):
-    cache.delete(f'book_detail_{instance.pk}')
+    invalidate_book_detail(instance.pk)
 
 @receiver(post_save, sender=Loan)
 def clear_book_cache_from_loan(sender, instance, **kwargs):
-    cache.delete(f'book_detail_{instance.book.pk}')
+    # Mudanças de empréstimo alteram available_copies do livro
+    if instance.book_id is not None:
+        invalidate_book_detail(instance.book_id)
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, update_fields=None, **kwargs):
+    # Saves parciais que não tocam campos de busca não precisam reindexar
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELD_NAMES):
+        return
+    get_search_engine().index(instance)
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    get_search_engine().remove(instance.pk)
+
+def _schedule_cover_thumbnails(book_id):
+    from .tasks import generate_cover_thumbnails
+    try:
+        generate_cover_thumbnails.delay(book_id)
+    except OperationalError:
+        # Sem broker a capa original continua valendo; o backfill gera depois
+        logger.warning('Broker indisponível: miniaturas do livro #%s não agendadas.', book_id)
+
+@receiver(post_save, sender=Book)
+def refresh_cover_thumbnails(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'cover_image' not in update_fields:
+        return
+    if thumbnails_outdated(instance):
+        transaction.on_commit(lambda: _schedule_cover_thumbnails(instance.pk))
+
+@receiver(post_delete, sender=Book)
+def delete_cover_thumbnails(sender, instance, **kwargs):
+    names = list((instance.cover_thumbnails or {}).values())
+    if names:
+        transaction.on_commit(lambda: delete_thumbnail_files(names))
@@ -0,0 +1,33 @@
+from celery import shared_task
+from .enrichment import enrich_incomplete_books
+from .services import GoogleBooksUnavailable
+from .thumbnails import update_cover_thumbnails
+
+# Lotes por execução; o restante segue numa nova task para não prender o worker
+ENRICHMENT_BATCHES_PER_RUN = 20
+
+@shared_task(
+    bind=True,
+    autoretry_for=(GoogleBooksUnavailable,),
+    retry_backoff=30,
+    retry_backoff_max=15 * 60,
+    max_retries=5,
+)
+def enrich_books(self, max_batches=ENRICHMENT_BATCHES_PER_RUN):
+    stats = enrich_incomplete_books(max_batches=max_batches)
+    if stats['locked']:
+        return 'Outra execução do enriquecimento está em andamento.'
+
+    if not stats['done']:
+        enrich_books.apply_async(kwargs={'max_batches': max_batches}, countdown=5)
+
+    return (
+        f"{stats['checked']} livros consultados, {stats['updated']} completados e "
+        f"{stats['not_found']} sem dados no Google em {stats['duration']:.2f}s"
+        + ('.' if stats['done'] else ' (continua na próxima execução).')
+    )
+
+
+@shared_task(ignore_result=True)
+def generate_cover_thumbnails(book_id):
+    update_cover_thumbnails(book_id)
@@ -1,3 +1,1207 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+from unittest import mock
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
 
-# Create your tests here.
+import httpx
+import requests
+from PIL import Image
+from asgiref.sync import sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from kombu.exceptions import OperationalError as KombuOperationalError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from loans.models import Loan
+from sistema_biblioteca.instrumentation import QueryBudgetExceeded
+from sistema_biblioteca.projections import ProjectedResponse
+from .enrichment import ENRICHMENT_RECHECK_DAYS, LOCK_KEY, enrich_incomplete_books, get_progress
+from .importer import import_books
+from .models import Book
+from .serializers import BookSerializer
+from .search import search_books
+from . import services
+from .services import GoogleBooksService, GoogleBooksUnavailable, get_async_client
+from .tasks import enrich_books, generate_cover_thumbnails
+from .thumbnails import THUMBNAIL_SIZES, thumbnails_outdated
+
+User = get_user_model()
+
+
+def criar_livros(quantidade, inicio=0):
+    return Book.objects.bulk_create([
+        Book(
+            title=f'Livro {i}',
+            author='Autor',
+            isbn=f'{i:013d}',
+            publisher='Editora',
+            genre='Ficção',
+            language='pt',
+        )
+        for i in range(inicio, inicio + quantidade)
+    ])
+
+
+class StatusUsuarioQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _contar_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_global_search_custo_constante_com_tamanho_da_pagina(self):
+        criar_livros(5)
+        queries_pequena, _ = self._contar_queries('/api/books/search-global/')
+
+        criar_livros(35, inicio=5)
+        queries_grande, response = self._contar_queries('/api/books/search-global/')
+
+        self.assertEqual(len(response.data['results']), 40)
+        self.assertEqual(queries_pequena, queries_grande)
+
+    def test_book_list_custo_constante_com_tamanho_da_pagina(self):
+        criar_livros(3)
+        queries_pequena, _ = self._contar_queries('/api/books/')
+
+        criar_livros(30, inicio=3)
+        queries_grande, _ = self._contar_queries('/api/books/')
+
+        self.assertEqual(queries_pequena, queries_grande)
+
+    def test_status_usuario_mapeado_por_livro(self):
+        livros = criar_livros(4)
+        Loan.objects.create(user=self.user, book=livros[0], status='PENDING')
+        Loan.objects.create(user=self.user, book=livros[1], status='ACTIVE')
+        Loan.objects.create(user=self.user, book=livros[2], status='RETURNED')
+
+        _, response = self._contar_queries('/api/books/search-global/')
+        status_por_id = {b['id']: b['status_usuario'] for b in response.data['results']}
+
+        self.assertEqual(status_por_id[livros[0].pk], 'solicitado')
+        self.assertEqual(status_por_id[livros[1].pk], 'alugado')
+        self.assertEqual(status_por_id[livros[2].pk], 'disponivel')
+        self.assertEqual(status_por_id[livros[3].pk], 'disponivel')
+
+
+class BuscaTextualTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.sao_bernardo = Book.objects.create(
+            title='Memórias de São Bernardo', author='Graciliano Ramos', isbn='9788501000001',
+            publisher='Record', genre='Romance', language='pt',
+        )
+        self.vidas = Book.objects.create(
+            title='Vidas Secas', author='Graciliano Ramos', isbn='9788501000002',
+            publisher='Record', genre='Romance', language='pt',
+            description='Retirantes no sertão, citado em Memórias de São Bernardo.',
+        )
+        Book.objects.create(
+            title='Dom Casmurro', author='Machado de Assis', isbn='9788501000003',
+            publisher='Ática', genre='Romance', language='pt',
+        )
+
+    def _ids(self, queryset):
+        return [book.pk for book in queryset]
+
+    def test_busca_ignora_acentos(self):
+        resultado = search_books(Book.objects.all(), 'sao bernardo')
+        self.assertIn(self.sao_bernardo.pk, self._ids(resultado))
+
+    def test_busca_por_prefixo_e_isbn(self):
+        self.assertCountEqual(self._ids(search_books(Book.objects.all(), 'gracil')),
+                              [self.sao_bernardo.pk, self.vidas.pk])
+        self.assertEqual(self._ids(search_books(Book.objects.all(), '9788501000003')),
+                         [Book.objects.get(isbn='9788501000003').pk])
+
+    def test_titulo_rankeia_acima_da_descricao(self):
+        response = self.client.get('/api/books/search-global/', {'q': 'memorias bernardo'})
+        self.assertEqual([b['id'] for b in response.data['results']], [self.sao_bernardo.pk, self.vidas.pk])
+
+        response = self.client.get('/api/books/', {'search': 'memorias bernardo'})
+        self.assertEqual([b['id'] for b in response.data['results']], [self.sao_bernardo.pk, self.vidas.pk])
+
+    def test_indice_atualizado_no_save_e_delete(self):
+        self.vidas.title = 'Angústia'
+        self.vidas.save()
+        self.assertIn(self.vidas.pk, self._ids(search_books(Book.objects.all(), 'angustia')))
+
+        self.vidas.delete()
+        self.assertEqual(self._ids(search_books(Book.objects.all(), 'angustia')), [])
+
+    def test_reindex_books_indexa_bulk_create(self):
+        criar_livros(3)
+        self.assertEqual(self._ids(search_books(Book.objects.all(), 'livro')), [])
+
+        call_command('reindex_books', stdout=StringIO())
+        self.assertEqual(len(self._ids(search_books(Book.objects.all(), 'livro'))), 3)
+
+
+class PaginacaoKeysetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        criar_livros(95)
+
+    def _percorrer(self, url, params=None):
+        ids, paginas = [], 0
+        response = self.client.get(url, params or {})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(b['id'] for b in response.data['results'])
+            paginas += 1
+            if not response.data['next']:
+                return ids, paginas
+            response = self.client.get(response.data['next'])
+
+    def test_global_search_percorre_todas_as_paginas_sem_repetir(self):
+        ids, paginas = self._percorrer('/api/books/search-global/')
+        self.assertEqual(paginas, 3)
+        self.assertEqual(len(ids), 95)
+        self.assertEqual(len(set(ids)), 95)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_book_list_paginada_com_busca(self):
+        call_command('reindex_books', stdout=StringIO())
+        ids, _ = self._percorrer('/api/books/', {'search': 'livro', 'page_size': 30})
+        self.assertEqual(len(set(ids)), 95)
+
+    def test_pagina_profunda_nao_usa_offset(self):
+        response = self.client.get('/api/books/search-global/')
+        response = self.client.get(response.data['next'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(response.data['next'])
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries if 'books_book' in q['sql'])
+        self.assertNotIn('OFFSET', sql.upper())
+
+
+def resposta_google(payload):
+    response = mock.Mock()
+    response.json.return_value = payload
+    response.raise_for_status.return_value = None
+    return response
+
+
+VOLUME_GOOGLE = {'id': 'abc123', 'volumeInfo': {'title': 'Capitães da Areia', 'authors': ['Jorge Amado']}}
+
+
+class GoogleBooksCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = GoogleBooksService()
+
+    @mock.patch('books.services.get_http_session')
+    def test_busca_normalizada_usa_cache(self, session):
+        get = session.return_value.get
+        get.return_value = resposta_google({'items': [VOLUME_GOOGLE]})
+
+        primeira = self.service._fetch('Capitães  da Areia', 0, 20)
+        segunda = self.service._fetch('  capitães da areia ', 0, 20)
+
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(GoogleBooksService.cache_stats(), {'hit': 1, 'miss': 1})
+
+    @mock.patch('books.services.get_http_session')
+    def test_erro_e_volume_inexistente_geram_cache_negativo(self, session):
+        get = session.return_value.get
+        get.side_effect = requests.exceptions.ConnectionError('fora do ar')
+
+        self.assertEqual(self.service._fetch('jorge amado', 0, 20), [])
+        self.assertEqual(self.service._fetch('jorge amado', 0, 20), [])
+        self.assertIsNone(self.service.get_book_by_google_id('nao-existe'))
+        self.assertIsNone(self.service.get_book_by_google_id('nao-existe'))
+
+        self.assertEqual(get.call_count, 2)
+
+    @mock.patch('books.services.get_http_session')
+    def test_detalhe_por_volume_usa_cache(self, session):
+        get = session.return_value.get
+        get.return_value = resposta_google(VOLUME_GOOGLE)
+
+        self.assertEqual(self.service.get_book_by_google_id('abc123')['title'], 'Capitães da Areia')
+        self.assertEqual(self.service.get_book_by_google_id('abc123')['title'], 'Capitães da Areia')
+        self.assertEqual(get.call_count, 1)
+
+
+def volumes(inicio, quantidade):
+    return {'items': [
+        {'id': f'vol{i}', 'volumeInfo': {'title': f'Volume {i}'}}
+        for i in range(inicio, inicio + quantidade)
+    ]}
+
+
+class GoogleBooksBuscaParalelaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('books.services.get_http_session')
+    def test_blocos_buscados_em_paralelo_e_sem_duplicatas(self, session):
+        barreira = threading.Barrier(2, timeout=2)
+
+        def get(url, params=None, timeout=None):
+            # Só passa se os dois blocos estiverem em andamento ao mesmo tempo
+            barreira.wait()
+            inicio = params['startIndex']
+            # Segundo bloco repete um item do primeiro
+            return resposta_google(volumes(inicio - 1 if inicio else 0, 20))
+
+        session.return_value.get.side_effect = get
+        resultados = GoogleBooksService().search_books('jorge amado', page=1, max_results=40)
+
+        ids = [livro['google_id'] for livro in resultados]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids[:20], [f'vol{i}' for i in range(20)])
+        self.assertEqual(len(ids), 39)
+
+    @mock.patch('books.services.SEARCH_DEADLINE', 0.2)
+    @mock.patch('books.services.get_http_session')
+    def test_bloco_atrasado_e_descartado_no_prazo(self, session):
+        def get(url, params=None, timeout=None):
+            if params['startIndex']:
+                time.sleep(1)
+            return resposta_google(volumes(params['startIndex'], 20))
+
+        session.return_value.get.side_effect = get
+        inicio = time.monotonic()
+        resultados = GoogleBooksService().search_books('jorge amado', page=1, max_results=40)
+
+        self.assertLess(time.monotonic() - inicio, 0.9)
+        self.assertEqual(len(resultados), 20)
+
+
+def volume_com_isbn(google_id, titulo, isbn):
+    return {'id': google_id, 'volumeInfo': {
+        'title': titulo,
+        'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': isbn}],
+    }}
+
+
+class BuscaFederadaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='leitor', password='senha-forte-123'))
+        Book.objects.create(
+            title='Capitães da Areia', author='Jorge Amado', isbn='0306406152',
+            publisher='Editora', genre='Romance', language='pt',
+        )
+        # Fora da página local (não casa com a busca), mas já está no acervo
+        Book.objects.create(
+            title='Outro Título', author='Outra Pessoa', isbn='9788535914849',
+            publisher='Editora', genre='Romance', language='pt',
+        )
+
+    def google(self, session, atraso=0):
+        def get(url, params=None, timeout=None):
+            time.sleep(atraso)
+            if params['startIndex']:
+                return resposta_google({'items': []})
+            return resposta_google({'items': [
+                volume_com_isbn('g1', 'Capitães da Areia (Google)', '9780306406157'),
+                volume_com_isbn('g2', 'Mesma obra, outra edição', '9788535914849'),
+                volume_com_isbn('g3', 'Só no Google', '9781234567897'),
+            ]})
+        session.return_value.get.side_effect = get
+
+    @mock.patch('books.services.get_http_session')
+    def test_acervo_primeiro_e_google_sem_duplicatas_por_isbn(self, session):
+        self.google(session)
+        response = self.client.get('/api/books/search-global/', {'q': 'capitães', 'source': 'all'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['google'], 'ok')
+        titulos = [(livro['title'], livro['is_google']) for livro in response.data['results']]
+        self.assertEqual(titulos, [('Capitães da Areia', False), ('Só no Google', True)])
+
+    @mock.patch('books.views.FEDERATED_SEARCH_BUDGET', 0.2)
+    @mock.patch('books.services.get_http_session')
+    def test_google_atrasado_fica_de_fora(self, session):
+        self.google(session, atraso=1)
+        inicio = time.monotonic()
+        response = self.client.get('/api/books/search-global/', {'q': 'capitães', 'source': 'all'})
+
+        self.assertLess(time.monotonic() - inicio, 0.9)
+        self.assertEqual(response.data['google'], 'timeout')
+        self.assertEqual([livro['title'] for livro in response.data['results']], ['Capitães da Areia'])
+
+    @mock.patch('books.services.get_http_session')
+    def test_paginas_seguintes_so_com_acervo(self, session):
+        self.google(session)
+        response = self.client.get(
+            '/api/books/search-global/', {'q': 'capitães', 'source': 'all', 'cursor': 'cD0x'},
+        )
+
+        self.assertEqual(response.data['google'], 'skipped')
+        session.return_value.get.assert_not_called()
+
+
+def volume_completo(isbn):
+    return {'items': [{'id': f'g{isbn}', 'volumeInfo': {
+        'title': 'Título do Google',
+        'description': 'Descrição do Google.',
+        'publishedDate': '1937-05-01',
+        'publisher': 'Editora do Google',
+        'imageLinks': {'thumbnail': 'http://books.google.com/capa.jpg'},
+        'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': isbn}],
+    }}]}
+
+
+class EnriquecimentoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.incompleto = Book.objects.create(
+            title='Capitães da Areia', author='Jorge Amado', isbn='9788535914849',
+            publisher='Companhia das Letras', genre='Romance', language='pt',
+        )
+        self.outro = Book.objects.create(
+            title='Mar Morto', author='Jorge Amado', isbn='9788535911800',
+            publisher='', genre='Romance', language='pt',
+        )
+        self.completo = Book.objects.create(
+            title='Completo', author='Autor', isbn='9780306406157', publisher='Editora',
+            genre='Geral', language='pt', description='Já tem.', cover_url='https://capa/x.jpg',
+            publication_date=date(2000, 1, 1),
+        )
+
+    @mock.patch('books.services.get_http_session')
+    def test_preenche_so_campos_vazios(self, session):
+        session.return_value.get.side_effect = (
+            lambda url, params=None, timeout=None: resposta_google(volume_completo(params['q'][5:]))
+        )
+        stats = enrich_incomplete_books(rate=0)
+
+        self.assertEqual((stats['checked'], stats['updated'], stats['done']), (2, 2, True))
+        self.incompleto.refresh_from_db()
+        self.assertEqual(self.incompleto.title, 'Capitães da Areia')
+        self.assertEqual(self.incompleto.publisher, 'Companhia das Letras')
+        self.assertEqual(self.incompleto.description, 'Descrição do Google.')
+        self.assertEqual(self.incompleto.publication_date, date(1937, 5, 1))
+        self.assertEqual(self.incompleto.cover_url, 'https://books.google.com/capa.jpg')
+        self.outro.refresh_from_db()
+        self.assertEqual(self.outro.publisher, 'Editora do Google')
+        # O livro completo nem é consultado
+        consultados = [c.kwargs['params']['q'] for c in session.return_value.get.call_args_list]
+        self.assertNotIn('isbn:9780306406157', consultados)
+
+    @mock.patch('books.services.get_http_session')
+    def test_erro_do_google_salva_progresso_e_retoma(self, session):
+        def fora_do_ar_no_segundo(url, params=None, timeout=None):
+            if params['q'] == f'isbn:{self.outro.isbn}':
+                raise requests.exceptions.ConnectionError('429')
+            return resposta_google(volume_completo(params['q'][5:]))
+
+        session.return_value.get.side_effect = fora_do_ar_no_segundo
+        with self.assertRaises(GoogleBooksUnavailable):
+            enrich_incomplete_books(rate=0)
+        self.assertEqual(get_progress(), self.incompleto.pk)
+
+        session.return_value.get.reset_mock()
+        session.return_value.get.side_effect = (
+            lambda url, params=None, timeout=None: resposta_google(volume_completo(params['q'][5:]))
+        )
+        stats = enrich_incomplete_books(rate=0)
+
+        self.assertEqual(stats['checked'], 1)
+        self.assertEqual(session.return_value.get.call_count, 1)
+        self.assertEqual(get_progress(), 0)
+
+    @mock.patch('books.services.get_http_session')
+    def test_task_continua_em_nova_execucao(self, session):
+        session.return_value.get.return_value = resposta_google({'items': []})
+        with mock.patch('books.tasks.enrich_books.apply_async') as agendar:
+            mensagem = enrich_books(max_batches=0)
+            agendar.assert_called_once()
+            self.assertIn('continua na próxima execução', mensagem)
+
+            agendar.reset_mock()
+            mensagem = enrich_books()
+            agendar.assert_not_called()
+            self.assertIn('2 sem dados no Google', mensagem)
+
+    @mock.patch('books.services.get_http_session')
+    def test_livros_sem_dados_nao_sao_consultados_toda_noite(self, session):
+        session.return_value.get.return_value = resposta_google({'items': []})
+        self.assertEqual(enrich_incomplete_books(rate=0)['not_found'], 2)
+        cache.clear()
+
+        # Passada seguinte (mesmo sem o cache do Google): ninguém é consultado de novo
+        session.return_value.get.reset_mock()
+        stats = enrich_incomplete_books(rate=0)
+        self.assertEqual((stats['checked'], stats['done']), (0, True))
+        session.return_value.get.assert_not_called()
+
+        Book.objects.filter(pk=self.outro.pk).update(
+            enrichment_checked_at=timezone.now() - timedelta(days=ENRICHMENT_RECHECK_DAYS + 1),
+        )
+        self.assertEqual(enrich_incomplete_books(rate=0)['checked'], 1)
+
+    @mock.patch('books.enrichment.time.sleep')
+    @mock.patch('books.services.get_http_session')
+    def test_throttle_so_nas_consultas_ao_google(self, session, dormir):
+        session.return_value.get.side_effect = (
+            lambda url, params=None, timeout=None: resposta_google(volume_completo(params['q'][5:]))
+        )
+        servico = GoogleBooksService()
+        for livro in (self.incompleto, self.outro):
+            servico.get_book_by_isbn(livro.isbn)
+
+        # Uma consulta a cada 100s: com as respostas em cache não há espera
+        stats = enrich_incomplete_books(rate=0.01)
+        self.assertEqual(stats['updated'], 2)
+        dormir.assert_not_called()
+
+    @mock.patch('books.services.get_http_session')
+    def test_execucoes_simultaneas_nao_se_sobrepoem(self, session):
+        cache.add(LOCK_KEY, 'outra execução')
+        stats = enrich_incomplete_books(rate=0)
+        self.assertTrue(stats['locked'])
+        session.return_value.get.assert_not_called()
+
+        with mock.patch('books.tasks.enrich_books.apply_async') as agendar:
+            self.assertIn('em andamento', enrich_books())
+            agendar.assert_not_called()
+
+        cache.delete(LOCK_KEY)
+        session.return_value.get.return_value = resposta_google({'items': []})
+        self.assertFalse(enrich_incomplete_books(rate=0)['locked'])
+        self.assertIsNone(cache.get(LOCK_KEY))
+
+
+def imagem_capa(largura=1200, altura=1800, formato='JPEG', nome='capa.jpg'):
+    buffer = BytesIO()
+    Image.new('RGB', (largura, altura), (200, 30, 30)).save(buffer, formato)
+    return SimpleUploadedFile(nome, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MiniaturasCapaTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        # Executa a task na hora, como se o worker tivesse pegado
+        delay = mock.patch.object(generate_cover_thumbnails, 'delay', side_effect=generate_cover_thumbnails)
+        self.delay = delay.start()
+        self.addCleanup(delay.stop)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            username='bibliotecaria', password='senha-forte-123', role='LIBRARIAN',
+        ))
+
+    def criar_com_capa(self, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/books/', {
+                'title': 'Capitães da Areia', 'author': 'Jorge Amado', 'isbn': '9788535914849',
+                'publisher': 'Editora', 'genre': 'Romance', 'language': 'pt',
+                'cover_image': imagem_capa(**extra),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Book.objects.get(pk=response.data['id'])
+
+    def test_upload_gera_miniaturas_webp(self):
+        livro = self.criar_com_capa()
+
+        self.assertEqual(set(livro.cover_thumbnails), set(THUMBNAIL_SIZES))
+        for tamanho, nome in livro.cover_thumbnails.items():
+            with default_storage.open(nome) as arquivo, Image.open(arquivo) as miniatura:
+                self.assertEqual(miniatura.format, 'WEBP')
+                largura, altura = THUMBNAIL_SIZES[tamanho]
+                self.assertLessEqual(miniatura.width, largura)
+                self.assertEqual(miniatura.height, altura)
+            self.assertLess(default_storage.size(nome), livro.cover_image.size)
+
+        response = self.client.get('/api/books/')
+        miniaturas = response.data['results'][0]['cover_thumbnails']
+        self.assertTrue(miniaturas['small'].startswith('http://testserver/media/covers/thumbs/'))
+
+    def test_troca_de_capa_apaga_miniaturas_antigas(self):
+        livro = self.criar_com_capa()
+        antigas = list(livro.cover_thumbnails.values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/books/{livro.pk}/', {'cover_image': imagem_capa(nome='nova.jpg')}, format='multipart')
+
+        livro.refresh_from_db()
+        self.assertTrue(all('nova' in nome for nome in livro.cover_thumbnails.values()))
+        self.assertFalse(any(default_storage.exists(nome) for nome in antigas))
+
+    def test_capas_de_mesmo_nome_em_livros_diferentes(self):
+        jpg = self.criar_com_capa()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/books/', {
+                'title': 'Vidas Secas', 'author': 'Graciliano Ramos', 'isbn': '9788525406347',
+                'publisher': 'Record', 'genre': 'Romance', 'language': 'pt',
+                'cover_image': imagem_capa(formato='PNG', nome='capa.png'),
+            }, format='multipart')
+        png = Book.objects.get(pk=response.data['id'])
+        jpg.refresh_from_db()
+
+        self.assertTrue(set(jpg.cover_thumbnails.values()).isdisjoint(png.cover_thumbnails.values()))
+        self.assertFalse(thumbnails_outdated(jpg))
+        self.assertFalse(thumbnails_outdated(png))
+
+        # Trocar a capa de um não apaga as miniaturas do outro
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/books/{png.pk}/', {'cover_image': imagem_capa(nome='nova.jpg')}, format='multipart')
+        self.assertTrue(all(default_storage.exists(nome) for nome in jpg.cover_thumbnails.values()))
+
+    def test_sem_broker_nao_quebra_o_upload(self):
+        self.delay.side_effect = KombuOperationalError('sem redis')
+        with self.assertLogs('books.signals', 'WARNING'):
+            livro = self.criar_com_capa()
+        self.assertEqual(livro.cover_thumbnails, {})
+
+    def test_backfill_das_capas_existentes(self):
+        self.delay.side_effect = None
+        livro = self.criar_com_capa(formato='PNG')
+        self.assertEqual(livro.cover_thumbnails, {})
+
+        saida = StringIO()
+        call_command('generate_thumbnails', stdout=saida)
+        call_command('generate_thumbnails', stdout=saida)
+
+        livro.refresh_from_db()
+        self.assertEqual(len(livro.cover_thumbnails), len(THUMBNAIL_SIZES))
+        self.assertIn('1 livros processados', saida.getvalue())
+        self.assertIn('1 já em dia', saida.getvalue())
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.outro = User.objects.create_user(username='outro', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.leitor)
+        self.livros = criar_livros(3)
+
+    def revalidar(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_lista_sem_mudanca_responde_304_sem_serializar(self):
+        primeira = self.client.get('/api/books/')
+        self.assertEqual(primeira.status_code, 200)
+        self.assertIn('private', primeira['Cache-Control'])
+
+        with mock.patch.object(BookSerializer, 'to_representation') as serializar, \
+                CaptureQueriesContext(connection) as ctx:
+            segunda = self.revalidar('/api/books/', primeira)
+
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.content, b'')
+        self.assertEqual(segunda['ETag'], primeira['ETag'])
+        serializar.assert_not_called()
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_emprestimo_de_outro_usuario_muda_o_etag(self):
+        primeira = self.client.get('/api/books/')
+
+        outro = APIClient()
+        outro.force_authenticate(self.outro)
+        outro.post('/api/loans/', {'book': self.livros[0].pk})
+
+        segunda = self.revalidar('/api/books/', primeira)
+        self.assertEqual(segunda.status_code, 200)
+        livro = next(b for b in segunda.data['results'] if b['id'] == self.livros[0].pk)
+        self.assertEqual(livro['available_copies'], 0)
+
+    def test_status_usuario_entra_no_etag(self):
+        primeira = self.client.get(f'/api/books/{self.livros[1].pk}/')
+        self.assertEqual(self.revalidar(f'/api/books/{self.livros[1].pk}/', primeira).status_code, 304)
+
+        emprestimo = Loan.objects.create(user=self.leitor, book=self.livros[2], status='PENDING')
+        lista = self.client.get('/api/books/')
+        # Aprovação vista por outro worker (ou com o cache descartado): o ETag vem do banco
+        Loan.objects.filter(pk=emprestimo.pk).update(status='ACTIVE')
+        cache.clear()
+
+        segunda = self.revalidar('/api/books/', lista)
+        self.assertEqual(segunda.status_code, 200)
+        livro = next(b for b in segunda.data['results'] if b['id'] == self.livros[2].pk)
+        self.assertEqual(livro['status_usuario'], 'alugado')
+
+    def test_detalhe_e_busca_local(self):
+        url = f'/api/books/{self.livros[0].pk}/'
+        primeira = self.client.get(url)
+        self.assertEqual(self.revalidar(url, primeira).status_code, 304)
+
+        self.livros[0].title = 'Outro título'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.livros[0].save()
+        self.assertEqual(self.revalidar(url, primeira).status_code, 200)
+
+        busca = self.client.get('/api/books/search-global/', {'q': 'livro'})
+        self.assertEqual(self.revalidar('/api/books/search-global/', busca, q='livro').status_code, 304)
+
+    def test_anonimo_recebe_last_modified_so_no_detalhe(self):
+        anonimo = APIClient()
+        url = f'/api/books/{self.livros[0].pk}/'
+        detalhe = anonimo.get(url)
+        self.assertIn('Last-Modified', detalhe)
+        self.assertEqual(anonimo.get(url, HTTP_IF_MODIFIED_SINCE=detalhe['Last-Modified']).status_code, 304)
+
+        # Na lista, remover um livro não muda o max(updated_at): só o ETag (com a contagem) vale
+        lista = anonimo.get('/api/books/')
+        self.assertNotIn('Last-Modified', lista)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.livros[1].delete()
+        self.assertEqual(anonimo.get('/api/books/', HTTP_IF_NONE_MATCH=lista['ETag']).status_code, 200)
+
+    def test_edicao_do_emprestimo_pelo_bibliotecario_muda_o_etag(self):
+        emprestimo = Loan.objects.create(user=self.leitor, book=self.livros[2], status='ACTIVE')
+        lista = self.client.get('/api/books/')
+        self.assertEqual(self.revalidar('/api/books/', lista).status_code, 304)
+
+        # Troca de livro: mesmas contagens e mesmo maior id, mas outro status_usuario
+        bibliotecario = APIClient()
+        bibliotecario.force_authenticate(User.objects.create_user(
+            username='staff', password='senha-forte-123', is_staff=True,
+        ))
+        response = bibliotecario.patch(
+            f'/api/loans/{emprestimo.pk}/', {'book': self.livros[1].pk}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        segunda = self.revalidar('/api/books/', lista)
+        self.assertEqual(segunda.status_code, 200)
+        status = {b['id']: b['status_usuario'] for b in segunda.data['results']}
+        self.assertEqual(status[self.livros[1].pk], 'alugado')
+        self.assertEqual(status[self.livros[2].pk], 'disponivel')
+
+
+class CamposEsparsosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.leitor)
+        self.livros = criar_livros(3)
+        Book.objects.update(description='Uma descrição bem longa. ' * 50)
+
+    def consulta_dos_livros(self, ctx):
+        return next(q['sql'] for q in ctx.captured_queries if 'ORDER BY' in q['sql'])
+
+    def test_modo_compacto_na_listagem_nao_le_a_descricao(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/', {'compact': 'true'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results'][0]), BookSerializer.Meta.compact_fields)
+        self.assertNotIn('description', self.consulta_dos_livros(ctx))
+
+        completa = self.client.get('/api/books/')
+        self.assertIn('description', completa.data['results'][0])
+        self.assertLess(len(response.content), len(completa.content) / 4)
+
+    def test_fields_e_omit(self):
+        Loan.objects.create(user=self.leitor, book=self.livros[0], status='PENDING')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/', {'fields': 'title,id', 'ordering': 'title'})
+        self.assertEqual(response.data['results'][0], {'id': self.livros[0].pk, 'title': 'Livro 0'})
+        # Sem status_usuario no recorte, a consulta de empréstimos da página não roda
+        self.assertFalse(any('"book_id" IN (' in q['sql'] for q in ctx.captured_queries))
+
+        response = self.client.get('/api/books/', {'compact': '1', 'omit': 'cover_image,isbn', 'ordering': 'title'})
+        livro = response.data['results'][0]
+        self.assertNotIn('isbn', livro)
+        self.assertEqual(livro['status_usuario'], 'solicitado')
+
+    def test_recorte_le_as_colunas_da_ordenacao(self):
+        # O cursor lê a ordenação dos itens da página: coluna adiada seria uma query por livro
+        for ordering in ['-created_at', '-available_copies']:
+            params = {'ordering': ordering, 'page_size': 2}
+            cache.clear()
+            with CaptureQueriesContext(connection) as completa:
+                self.client.get('/api/books/', params)
+            for recorte in [{'compact': 'true'}, {'fields': 'title'}]:
+                with self.subTest(ordering=ordering, **recorte):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = self.client.get('/api/books/', {**params, **recorte})
+                    self.assertIsNotNone(response.data['next'])
+                    self.assertLessEqual(len(ctx), len(completa))
+
+    def test_campo_invalido_responde_400(self):
+        response = self.client.get('/api/books/', {'fields': 'title,senha'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('senha', str(response.data['fields']))
+        self.assertEqual(self.client.get('/api/books/', {'omit': 'x'}).status_code, 400)
+
+    def test_detalhe_recortado_nao_contamina_o_cache(self):
+        url = f'/api/books/{self.livros[1].pk}/'
+        recortado = self.client.get(url, {'fields': 'id,status_usuario'})
+        self.assertEqual(recortado.data, {'id': self.livros[1].pk, 'status_usuario': 'disponivel'})
+
+        completo = self.client.get(url)
+        self.assertEqual(list(completo.data), BookSerializer.Meta.fields)
+
+    def test_busca_global_compacta(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/search-global/', {'fields': 'id,title'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'is_google'})
+        self.assertNotIn('description', self.consulta_dos_livros(ctx))
+
+    def test_escrita_ignora_o_recorte(self):
+        bibliotecario = User.objects.create_user(username='bib', password='senha-forte-123', is_staff=True)
+        self.client.force_authenticate(bibliotecario)
+        response = self.client.post('/api/books/?fields=id', {
+            'title': 'Novo', 'author': 'Autor', 'isbn': '9780000000001', 'publisher': 'Editora',
+            'genre': 'Ficção', 'language': 'pt', 'total_copies': 1,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['title'], 'Novo')
+
+
+class ProjecaoJsonTests(TestCase):
+    """A busca global em JSON sai pela BookProjection com os mesmos bytes do BookSerializer."""
+
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.leitor)
+        completo = Book.objects.create(
+            title='São Bernardo\u2028 "edição" comentada', author='Graciliano Ramos', isbn='9788501067339',
+            publisher='Record', genre='Romance', language='pt', description='Linha 1\nLinha 2\t😀',
+            publication_date=date(1934, 12, 1), cover_url='https://example.com/capa.jpg',
+            total_copies=3, available_copies=2,
+        )
+        Book.objects.filter(pk=completo.pk).update(
+            cover_image='covers/sao_bernardo.jpg',
+            cover_thumbnails={'small': 'covers/thumbs/sao_bernardo_small.webp'},
+        )
+        self.vazio = Book.objects.create(
+            title='Angústia', author='Graciliano Ramos', isbn='9788501067340',
+            publisher='', genre='Romance', language='', cover_url=None,
+        )
+        criar_livros(5)
+        Loan.objects.create(user=self.leitor, book=completo, status='PENDING')
+        Loan.objects.create(user=self.leitor, book=self.vazio, status='ACTIVE')
+
+    def comparar(self, url, params):
+        rapida = self.client.get(url, params)
+        with mock.patch('books.views.accepts_projection', return_value=False):
+            serializada = self.client.get(url, params)
+
+        self.assertIsInstance(rapida, ProjectedResponse)
+        self.assertNotIsInstance(serializada, ProjectedResponse)
+        self.assertEqual(rapida.status_code, 200)
+        self.assertEqual(rapida['Content-Type'], serializada['Content-Type'])
+        self.assertEqual(rapida.content, serializada.content)
+        return rapida
+
+    def test_mesmos_bytes_do_serializer(self):
+        for params in [
+            {},
+            {'compact': 'true'},
+            {'fields': 'id,status_usuario,publication_date', 'ordering': 'title'},
+            {'q': 'graciliano'},
+            {'ordering': '-available_copies', 'page_size': 2},
+        ]:
+            with self.subTest(params=params):
+                self.comparar('/api/books/search-global/', params)
+
+        busca = self.comparar('/api/books/search-global/', {'q': 'graciliano'}).data['results']
+        self.assertCountEqual([livro['status_usuario'] for livro in busca], ['solicitado', 'alugado'])
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_datas_no_fuso_atual(self):
+        response = self.comparar('/api/books/search-global/', {'fields': 'id,created_at'})
+        self.assertTrue(response.data['results'][0]['created_at'].endswith('-03:00'))
+
+    def test_cursor_da_proxima_pagina_e_o_mesmo(self):
+        primeira = self.comparar('/api/books/search-global/', {'page_size': 3})
+        cursor = primeira.data['next'].split('cursor=')[1].split('&')[0]
+        self.comparar('/api/books/search-global/', {'page_size': 3, 'cursor': cursor})
+
+    def test_navegador_da_api_usa_o_serializer(self):
+        response = self.client.get('/api/books/search-global/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIsInstance(response, ProjectedResponse)
+
+
+class BookDetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.book = Book.objects.create(
+            title='Iracema', author='José de Alencar', isbn='9788508000002',
+            publisher='Ática', genre='Romance', language='pt', total_copies=2, available_copies=2,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.leitor)
+        self.url = f'/api/books/{self.book.pk}/'
+
+    def test_segunda_leitura_so_consulta_o_status_do_usuario(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['title'], 'Iracema')
+        self.assertEqual(response.data['status_usuario'], 'disponivel')
+
+    def test_status_usuario_nao_vaza_entre_usuarios(self):
+        outro = User.objects.create_user(username='outro', password='senha-forte-123')
+        Loan.objects.create(user=outro, book=self.book, status='PENDING')
+
+        self.assertEqual(self.client.get(self.url).data['status_usuario'], 'disponivel')
+        self.client.force_authenticate(outro)
+        self.assertEqual(self.client.get(self.url).data['status_usuario'], 'solicitado')
+
+    def test_save_do_livro_e_emprestimo_invalidam(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Iracema (edição crítica)'
+            self.book.save()
+        self.assertEqual(self.client.get(self.url).data['title'], 'Iracema (edição crítica)')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/loans/', {'book': self.book.pk})
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['available_copies'], 1)
+        self.assertEqual(response.data['status_usuario'], 'solicitado')
+
+    def test_livro_inexistente_continua_404(self):
+        self.assertEqual(self.client.get('/api/books/999999/').status_code, 404)
+
+    def test_pk_com_zeros_a_esquerda_usa_a_mesma_chave(self):
+        padded = f'/api/books/0{self.book.pk}/'
+        self.client.get(padded)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Iracema (2ª edição)'
+            self.book.save()
+        self.assertEqual(self.client.get(padded).data['title'], 'Iracema (2ª edição)')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.delete()
+        self.assertEqual(self.client.get(padded).status_code, 404)
+        self.assertEqual(self.client.get('/api/books/abc/').status_code, 404)
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, QUERY_BUDGET_STRICT=True)
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        criar_livros(5)
+
+    def test_server_timing_e_log_estruturado(self):
+        with self.assertLogs('sistema_biblioteca.requests', 'INFO') as logs:
+            response = self.client.get('/api/books/')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;desc="\d+ queries";dur=[\d.]+')
+        self.assertIn('serializer;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+        registro = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(registro['view'], 'BookViewSet.list')
+        self.assertEqual(registro['status'], 200)
+        self.assertGreaterEqual(registro['queries'], 1)
+        self.assertTrue(registro['slowest'])
+
+    @mock.patch('books.services.get_http_session')
+    def test_tempo_do_google_aparece_no_header(self, session):
+        session.return_value.get.return_value = resposta_google(VOLUME_GOOGLE)
+
+        with self.assertLogs('sistema_biblioteca.requests', 'INFO'):
+            response = self.client.get('/api/books/google/abc123/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('google;dur=', response['Server-Timing'])
+
+    def test_orcamento_de_queries_estourado_falha_no_modo_estrito(self):
+        with mock.patch('books.views.BookViewSet.query_budget', {'list': 0}):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs('sistema_biblioteca.requests', 'INFO'):
+                self.client.get('/api/books/')
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_orcamento_de_queries_estourado_gera_aviso(self):
+        with mock.patch('books.views.BookViewSet.query_budget', {'list': 0}):
+            with self.assertLogs('sistema_biblioteca.requests', 'WARNING') as logs:
+                response = self.client.get('/api/books/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('orçamento: 0' in linha for linha in logs.output))
+
+    def test_endpoints_de_livros_dentro_do_orcamento(self):
+        livro = Book.objects.first()
+        for url in ['/api/books/', f'/api/books/{livro.pk}/', '/api/books/search-global/',
+                    '/api/books/search-global/?q=livro']:
+            with self.assertLogs('sistema_biblioteca.requests', 'INFO'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    @override_settings(REQUEST_INSTRUMENTATION=False)
+    def test_desligada_nao_adiciona_header(self):
+        response = APIClient().get('/api/books/')
+        self.assertNotIn('Server-Timing', response)
+
+
+CSV_IMPORTACAO = (
+    'isbn,title,author,publisher,genre,language,total_copies,publication_date\n'
+    '978-85-359-1406-1,Capitães da Areia (nova edição),Jorge Amado,Companhia das Letras,Romance,pt,4,1937\n'
+    '9788525406347,Vidas Secas,Graciliano Ramos,Record,Romance,pt,2,1938-01-01\n'
+    'abc,Sem ISBN,Autor,Editora,Romance,pt,1,\n'
+    '9788520932071,,,Editora,Romance,pt,1,\n'
+    '9788535902778,Quincas Borba,Machado de Assis,Ática,Romance,pt,zero,\n'
+)
+
+
+class ImportacaoEmLoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.bibliotecario = User.objects.create_user(
+            username='bibliotecaria', password='senha-forte-123', role='LIBRARIAN',
+        )
+        self.existente = Book.objects.create(
+            title='Capitães da Areia', author='Jorge Amado', isbn='9788535914061',
+            publisher='Companhia das Letras', genre='Romance', language='pt',
+            total_copies=2, available_copies=1,
+        )
+
+    def test_comando_faz_upsert_por_isbn_e_reporta_erros_por_linha(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as arquivo:
+            arquivo.write(CSV_IMPORTACAO)
+
+        erros = StringIO()
+        try:
+            call_command('import_books', arquivo.name, batch_size=2, stdout=StringIO(), stderr=erros)
+        finally:
+            os.remove(arquivo.name)
+
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.title, 'Capitães da Areia (nova edição)')
+        self.assertEqual(self.existente.total_copies, 4)
+        # Um exemplar continua emprestado
+        self.assertEqual(self.existente.available_copies, 3)
+
+        vidas_secas = Book.objects.get(isbn='9788525406347')
+        self.assertEqual(vidas_secas.available_copies, 2)
+        self.assertEqual(str(vidas_secas.publication_date), '1938-01-01')
+        # Livros importados em lote entram no índice de busca
+        self.assertEqual(list(search_books(Book.objects.all(), 'graciliano')), [vidas_secas])
+
+        saida = erros.getvalue()
+        self.assertIn('Linha 4', saida)
+        self.assertIn('Linha 5 (9788520932071): Campos obrigatórios ausentes: title, author.', saida)
+        self.assertIn('Linha 6', saida)
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_queries_por_lote_nao_crescem_com_o_numero_de_linhas(self):
+        def importar(inicio, quantidade):
+            linhas = [(i, {'isbn': f'{i:013d}', 'title': f'Livro {i}', 'author': 'Autor'})
+                      for i in range(inicio, inicio + quantidade)]
+            with CaptureQueriesContext(connection) as ctx:
+                resultado = import_books(linhas)
+            self.assertEqual(resultado.created, quantidade)
+            return len(ctx.captured_queries)
+
+        # Até 60 linhas cabem num único INSERT mesmo no limite de parâmetros do SQLite
+        self.assertEqual(importar(1000, 10), importar(2000, 60))
+
+    def test_endpoint_so_para_bibliotecario(self):
+        client = APIClient()
+        client.force_authenticate(self.leitor)
+        arquivo = SimpleUploadedFile('acervo.csv', CSV_IMPORTACAO.encode('utf-8'))
+        self.assertEqual(client.post('/api/books/import/', {'file': arquivo}).status_code, 403)
+
+        client.force_authenticate(self.bibliotecario)
+        arquivo = SimpleUploadedFile('acervo.csv', CSV_IMPORTACAO.encode('utf-8'))
+        response = client.post('/api/books/import/', {'file': arquivo})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {k: response.data[k] for k in ('created', 'updated', 'unchanged', 'failed')},
+            {'created': 1, 'updated': 1, 'unchanged': 0, 'failed': 3},
+        )
+        self.assertEqual(sorted(erro['line'] for erro in response.data['errors']), [4, 5, 6])
+
+    def test_csv_do_excel_em_windows_1252(self):
+        client = APIClient()
+        client.force_authenticate(self.bibliotecario)
+        arquivo = SimpleUploadedFile('acervo.csv', CSV_IMPORTACAO.encode('cp1252'))
+
+        response = client.post('/api/books/import/', {'file': arquivo})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.title, 'Capitães da Areia (nova edição)')
+
+    def test_codificacao_invalida_responde_400_antes_de_importar(self):
+        client = APIClient()
+        client.force_authenticate(self.bibliotecario)
+        # 0x81 não existe nem em UTF-8 nem em Windows-1252
+        conteudo = CSV_IMPORTACAO.encode('cp1252') + b'9788500000001,Livro \x81,Autor\n'
+        arquivo = SimpleUploadedFile('acervo.csv', conteudo)
+
+        response = client.post('/api/books/import/', {'file': arquivo})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['line'], CSV_IMPORTACAO.count('\n') + 1)
+        self.assertIn('nada foi importado', response.data['error'])
+        self.assertEqual(Book.objects.count(), 1)
+
+    @mock.patch('books.services.get_http_session')
+    def test_lista_de_isbns_enriquecida_pelo_google(self, session):
+        session.return_value.get.return_value = resposta_google({'items': [VOLUME_GOOGLE]})
+        client = APIClient()
+        client.force_authenticate(self.bibliotecario)
+
+        response = client.post(
+            '/api/books/import/', {'isbns': ['9788535914061', '9788520932071'], 'enrich': True}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['unchanged'], 1)
+        novo = Book.objects.get(isbn='9788520932071')
+        self.assertEqual((novo.title, novo.author), ('Capitães da Areia', 'Jorge Amado'))
+        # O livro já cadastrado não é sobrescrito pelo Google
+        self.existente.refresh_from_db()
+        self.assertEqual(self.existente.title, 'Capitães da Areia')
+
+
+def cliente_google_async(handler):
+    """httpx.AsyncClient que responde localmente (sem rede)."""
+    def transporte(request):
+        status_code, payload = handler(request)
+        return httpx.Response(status_code, json=payload)
+    return httpx.AsyncClient(transport=httpx.MockTransport(transporte))
+
+
+class GoogleViewsAssincronasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.leitor)}'}
+
+    async def test_busca_assincrona_igual_a_sincrona(self):
+        def bloco(request):
+            return 200, volumes(int(request.url.params['startIndex']), 20)
+
+        with mock.patch('books.services.get_async_client', return_value=cliente_google_async(bloco)):
+            response = await self.async_client.get(
+                '/api/books/async/search-global/', {'q': 'jorge amado', 'source': 'google'}, headers=self.auth,
+            )
+        self.assertEqual(response.status_code, 200)
+
+        await cache.aclear()
+        with mock.patch('books.services.get_http_session') as session:
+            session.return_value.get.side_effect = (
+                lambda url, params=None, timeout=None: resposta_google(volumes(params['startIndex'], 20))
+            )
+            sincrona = await sync_to_async(GoogleBooksService().search_books)('jorge amado', 1, 'ALL', 40)
+
+        self.assertEqual(response.json(), sincrona)
+        self.assertEqual(len(sincrona), 40)
+
+    async def test_blocos_em_paralelo_no_mesmo_loop(self):
+        iniciados = []
+        iniciados_ao_terminar = []
+
+        async def lento(request):
+            iniciados.append(request.url.params['startIndex'])
+            await asyncio.sleep(0.3)
+            iniciados_ao_terminar.append(len(iniciados))
+            return httpx.Response(200, json=volumes(int(request.url.params['startIndex']), 20))
+
+        cliente = httpx.AsyncClient(transport=httpx.MockTransport(lento))
+        with mock.patch('books.services.get_async_client', return_value=cliente):
+            inicio = time.monotonic()
+            resultados = await GoogleBooksService().asearch_books('machado', 1, 'ALL', 40)
+
+        self.assertEqual(len(resultados), 40)
+        # Os dois blocos começaram antes de qualquer um terminar
+        self.assertEqual(sorted(iniciados), ['0', '20'])
+        self.assertEqual(iniciados_ao_terminar, [2, 2])
+        # Dois blocos de 0,3 s em paralelo: bem menos que 0,6 s
+        self.assertLess(time.monotonic() - inicio, 0.55)
+
+    def test_cliente_async_fechado_com_o_loop(self):
+        async def cliente_do_loop():
+            cliente = get_async_client()
+            self.assertIs(get_async_client(), cliente)
+            return cliente
+
+        cliente = asyncio.run(cliente_do_loop())
+        self.assertTrue(cliente.is_closed)
+        self.assertEqual(services._async_clients, {})
+
+    async def test_detalhe_assincrono_e_cache_negativo(self):
+        chamadas = []
+
+        def volume(request):
+            chamadas.append(request.url.path)
+            if request.url.path.endswith('/abc123'):
+                return 200, VOLUME_GOOGLE
+            return 404, {}
+
+        with mock.patch('books.services.get_async_client', return_value=cliente_google_async(volume)):
+            ok = await self.async_client.get('/api/books/async/google/abc123/', headers=self.auth)
+            ausente = await self.async_client.get('/api/books/async/google/nao-existe/', headers=self.auth)
+            await self.async_client.get('/api/books/async/google/nao-existe/', headers=self.auth)
+
+        self.assertEqual(ok.json()['title'], 'Capitães da Areia')
+        self.assertEqual(ausente.status_code, 404)
+        self.assertEqual(len(chamadas), 2)
+
+    async def test_exige_autenticacao_e_delega_busca_local(self):
+        response = await self.async_client.get('/api/books/async/google/abc123/')
+        self.assertEqual(response.status_code, 401)
+
+        await sync_to_async(criar_livros)(3)
+        local = await self.async_client.get('/api/books/async/search-global/', headers=self.auth)
+        self.assertEqual(local.status_code, 200)
+        self.assertEqual(len(local.json()['results']), 3)
+
+
+class BenchmarkGoogleTests(TransactionTestCase):
+    # As requisições do benchmark rodam em outras threads: os dados precisam estar commitados
+    def test_comando_benchmark_google(self):
+        saida = StringIO()
+        with tempfile.TemporaryDirectory() as pasta:
+            arquivo = os.path.join(pasta, 'google.json')
+            call_command(
+                'benchmark_google', requests=4, concurrency=2, workers=2, latency=0,
+                output=arquivo, stdout=saida,
+            )
+            with open(arquivo) as f:
+                relatorio = json.load(f)
+
+        self.assertEqual([r['mode'] for r in relatorio['results']], ['sync', 'async'])
+        self.assertTrue(all(r['errors'] == 0 for r in relatorio['results']))
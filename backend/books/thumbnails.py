@@ -0,0 +1,125 @@
+"""
+Miniaturas das capas enviadas (``Book.cover_image``).
+
+Cada upload gera, em segundo plano (task ``books.tasks.generate_cover_thumbnails``),
+versões WebP de tamanho fixo em ``covers/thumbs/``. Os caminhos ficam em
+``Book.cover_thumbnails`` ({'small': ..., 'medium': ..., 'large': ...}) e o
+serializer expõe as URLs; as listagens usam a miniatura em vez do original.
+
+O nome da miniatura deriva do livro e do nome do arquivo original (com a
+extensão: ``capa.jpg`` e ``capa.png`` são capas diferentes), então dá para
+saber se as miniaturas gravadas ainda são da capa atual sem abrir arquivos,
+e livros diferentes nunca compartilham miniaturas.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import invalidate_book_detail
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+# Caixa máxima (largura, altura); a proporção da capa é mantida e nunca se amplia
+THUMBNAIL_SIZES = {
+    'small': (120, 180),
+    'medium': (240, 360),
+    'large': (480, 720),
+}
+THUMBNAIL_DIR = 'covers/thumbs'
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_name(book_id, source_name, size):
+    base, ext = os.path.splitext(os.path.basename(source_name))
+    return f'{THUMBNAIL_DIR}/{book_id}_{base}_{ext.lstrip(".").lower()}_{size}.webp'
+
+
+def thumbnails_outdated(book):
+    """True se as miniaturas gravadas não correspondem à capa atual."""
+    if not book.cover_image:
+        return bool(book.cover_thumbnails)
+    expected = {size: thumbnail_name(book.pk, book.cover_image.name, size) for size in THUMBNAIL_SIZES}
+    return book.cover_thumbnails != expected
+
+
+def render_thumbnails(source):
+    """Gera {tamanho: bytes WebP} a partir de um arquivo de imagem aberto."""
+    with Image.open(source) as image:
+        # Fotos de celular vêm rotacionadas via EXIF
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+        rendered = {}
+        for size, box in THUMBNAIL_SIZES.items():
+            thumb = image.copy()
+            thumb.thumbnail(box, Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            thumb.save(buffer, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+            rendered[size] = buffer.getvalue()
+        return rendered
+
+
+def _store(name, content):
+    # Nome determinístico: substitui em vez de deixar o storage criar um sufixo
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def delete_thumbnail_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Não foi possível apagar a miniatura %s', name)
+
+
+def update_cover_thumbnails(book_id, force=False):
+    """
+    Gera (ou remove) as miniaturas do livro. Devolve o novo mapa de
+    miniaturas, ou None se não havia nada a fazer.
+    """
+    book = Book.objects.filter(pk=book_id).only('cover_image', 'cover_thumbnails').first()
+    if book is None or not (force or thumbnails_outdated(book)):
+        return None
+
+    previous = dict(book.cover_thumbnails or {})
+    source_name = book.cover_image.name if book.cover_image else ''
+    thumbnails = {}
+
+    if source_name:
+        try:
+            with book.cover_image.open('rb') as source:
+                rendered = render_thumbnails(source)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+            logger.warning('Capa do livro #%s não pôde ser processada: %s', book_id, exc)
+            return None
+        thumbnails = {
+            size: _store(thumbnail_name(book_id, source_name, size), content)
+            for size, content in rendered.items()
+        }
+
+    with transaction.atomic():
+        # Só grava se a capa não mudou enquanto as miniaturas eram geradas
+        same_cover = Q(cover_image=source_name) if source_name else Q(cover_image='') | Q(cover_image__isnull=True)
+        updated = Book.objects.filter(same_cover, pk=book_id).update(
+            cover_thumbnails=thumbnails, updated_at=timezone.now(),
+        )
+        if updated:
+            invalidate_book_detail(book_id)
+
+    if not updated:
+        delete_thumbnail_files(name for name in thumbnails.values() if name not in previous.values())
+        return None
+
+    delete_thumbnail_files(name for name in previous.values() if name not in thumbnails.values())
+    return thumbnails
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     BookViewSet, 
     GlobalSearchView, 
@@ -16,5 +17,8 @@ urlpatterns = [
     path('search-global/', GlobalSearchView.as_view(), name='global-search'),
     path('request-purchase/', PurchaseRequestView.as_view(), name='request-purchase'),
     path('google/<str:google_id>/', GoogleBookDetailView.as_view(), name='google-detail'),
+    # Versões assíncronas (para servidores ASGI)
+    path('async/search-global/', async_views.global_search, name='async-global-search'),
+    path('async/google/<str:google_id>/', async_views.google_book_detail, name='async-google-detail'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,36 +1,119 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from drf_spectacular.utils import extend_schema, extend_schema_view
 from .models import Book, PurchaseRequest
-from .serializers import BookSerializer, PurchaseRequestSerializer
+from .projections import BookProjection
+from .serializers import BookSerializer, PurchaseRequestSerializer, status_usuario_for, status_usuario_version
+from .cache import get_book_detail, set_book_detail
 from .services import GoogleBooksService
-from .filters import BookFilter
-from .permissions import IsLibrarianOrReadOnly
-from django.db.models import Q 
+from .filters import BookFilter, BookSearchFilter
+from .importer import UploadEncodingError, decode_upload, import_books, isbn_variants, read_csv, read_isbns
+from .search import search_books
+from sistema_biblioteca.conditional import make_etag, not_modified, set_validators
+from sistema_biblioteca.export import ExportMixin
+from sistema_biblioteca.pagination import BookCursorPagination, CreatedAtCursorPagination
+from .permissions import IsLibrarian, IsLibrarianOrReadOnly
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from sistema_biblioteca.instrumentation import timed
+from sistema_biblioteca.projections import ProjectedResponse, accepts_projection
 import random
+import time
 
 # Definindo o limite máximo de resultados para a API (40 é o máximo seguro do Google)
 MAX_API_LIMIT = 40
 
+# source=all: prazo único (segundos) para o Google; o que não chegar a tempo fica de fora
+FEDERATED_SEARCH_BUDGET = getattr(settings, 'FEDERATED_SEARCH_BUDGET', 2.0)
+
+# Mesmos nomes de coluna aceitos por import_books (o arquivo exportado pode ser reimportado)
+BOOK_EXPORT_COLUMNS = [
+    (name, name) for name in (
+        'id', 'title', 'author', 'isbn', 'publisher', 'publication_date', 'genre',
+        'language', 'total_copies', 'available_copies', 'created_at',
+    )
+]
+
 @extend_schema_view(
     create=extend_schema(description="Cria um novo livro", request=BookSerializer),
     update=extend_schema(description="Atualiza um livro", request=BookSerializer),
 )
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all().order_by('-created_at')
     serializer_class = BookSerializer
+    pagination_class = BookCursorPagination
     parser_classes = (MultiPartParser, FormParser)
     permission_classes = [IsLibrarianOrReadOnly] 
+    # Máximo de queries por action (ver sistema_biblioteca.instrumentation)
+    # list: +2 dos validadores do GET condicional (acervo e empréstimos do usuário)
+    query_budget = {'list': 6, 'retrieve': 3}
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # BookSearchFilter vem depois do OrderingFilter para poder ordenar por relevância
+    filter_backends = [DjangoFilterBackend, OrderingFilter, BookSearchFilter]
     filterset_class = BookFilter
-    search_fields = ['title', 'author', 'isbn', 'genre', 'publisher', 'description']
     ordering_fields = ['title', 'publication_date', 'created_at', 'available_copies']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+
+    def list(self, request, *args, **kwargs):
+        # ?fields=/?omit=/?compact=: o banco só devolve as colunas do recorte
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = BookSerializer.restrict_queryset(
+            queryset, request, ordering=self.paginator.get_ordering(request, queryset, self),
+        )
+
+        # Validadores antes da paginação/serialização: sem mudança, 304 sem corpo
+        etag = _catalog_validators(request, queryset)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return set_validators(self.get_paginated_response(serializer.data), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Chave do cache pela pk normalizada: /books/05/ e /books/5/ são o mesmo livro
+        # (e a invalidação só conhece a pk inteira)
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        host = request.get_host()
+
+        data = get_book_detail(pk, host)
+        if data is None:
+            book = self.get_object()
+            book_id, updated_at, available = book.pk, book.updated_at, book.available_copies
+        else:
+            book_id, updated_at, available = data['id'], parse_datetime(data['updated_at']), data['available_copies']
+
+        # O status depende do usuário: nunca vai para o cache compartilhado
+        status_usuario = status_usuario_for(request, book_id)
+        etag = make_etag('book', updated_at.timestamp(), available, status_usuario)
+        last_modified = None if request.user.is_authenticated else updated_at
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        if data is None:
+            # O cache guarda a representação completa; o recorte é aplicado depois
+            serializer = self.get_serializer(book, context={**self.get_serializer_context(), 'sparse_fields': False})
+            data = dict(serializer.data)
+            data.pop('status_usuario', None)
+            set_book_detail(pk, host, data)
+
+        data = {**data, 'status_usuario': status_usuario}
+        fields = BookSerializer.requested_fields(request)
+        if fields is not None:
+            data = {name: data[name] for name in fields}
+        return set_validators(Response(data), etag, last_modified)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -44,18 +127,84 @@ class BookViewSet(viewsets.ModelViewSet):
             data = new_data
         return super().update(request, data=data, partial=partial, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsLibrarian])
+    def export(self, request):
+        """Exporta o acervo filtrado (mesmos filtros/busca da listagem) em CSV/NDJSON."""
+        return self.export_queryset(self.filter_queryset(self.get_queryset()), BOOK_EXPORT_COLUMNS, 'acervo')
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, JSONParser])
+    def import_catalog(self, request):
+        """
+        Importação em lote (upsert por ISBN). Aceita um arquivo em ``file``
+        (CSV com cabeçalho, ou .txt com um ISBN por linha) ou uma lista
+        ``isbns`` no JSON. ``enrich=true`` completa os dados pelo Google Books.
+        """
+        upload = request.FILES.get('file')
+        isbns = request.data.get('isbns')
+        enrich = str(request.data.get('enrich', '')).lower() in ('true', '1')
+
+        if upload is not None:
+            is_csv = request.data.get('format', '') == 'csv' or upload.name.lower().endswith('.csv')
+            try:
+                stream = decode_upload(upload)
+            except UploadEncodingError as exc:
+                return Response({'error': str(exc), 'line': exc.line}, status=status.HTTP_400_BAD_REQUEST)
+            rows = (read_csv if is_csv else read_isbns)(stream)
+        elif isinstance(isbns, list):
+            rows = ((index, {'isbn': str(isbn)}) for index, isbn in enumerate(isbns, start=1))
+        else:
+            return Response(
+                {"error": "Envie um arquivo em 'file' ou uma lista 'isbns'."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        result = import_books(rows, enrich=enrich)
+        return Response(result.as_dict())
+
+def _catalog_validators(request, queryset):
+    """
+    ETag de uma listagem do acervo: max(updated_at) e contagem do queryset
+    filtrado, mais a versão dos empréstimos do usuário (status_usuario).
+    Sem Last-Modified: remover um livro não muda o max(updated_at), e um
+    cliente que só manda If-Modified-Since continuaria vendo o livro.
+    """
+    summary = queryset.order_by().aggregate(last=Max('updated_at'), total=Count('id'))
+    last = summary['last']
+    return make_etag('books', last.timestamp() if last else None, summary['total'], status_usuario_version(request))
+
+
+def _drop_catalog_duplicates(google_books, local_isbns):
+    """Remove do Google os livros que já estão no acervo (mesmo ISBN)."""
+    known = set()
+    for isbn in local_isbns:
+        known |= isbn_variants(isbn)
+
+    # ISBNs do Google que não estão na página local: uma consulta confere o resto do acervo
+    pending = {
+        variant for book in google_books for variant in isbn_variants(book.get('isbn'))
+    } - known
+    if pending:
+        for isbn in Book.objects.filter(isbn__in=pending).values_list('isbn', flat=True):
+            known |= isbn_variants(isbn)
+
+    return [book for book in google_books if not (isbn_variants(book.get('isbn')) & known)]
+
+
 class GlobalSearchView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    # Validadores do GET condicional (+2) ou, no source=all, deduplicação por ISBN (+1)
+    query_budget = 6
 
     def get(self, request):
+        started = time.monotonic()
         query = request.query_params.get('q', '').strip()
         page = int(request.query_params.get('page', 1))
         genre = request.query_params.get('genre', 'ALL')
-        source = request.query_params.get('source', 'local') # local (default) | google
+        source = request.query_params.get('source', 'local') # local (default) | google | all
         min_year = request.query_params.get('min_year')
         max_year = request.query_params.get('max_year')
         available = request.query_params.get('available')
-        ordering = request.query_params.get('ordering', '-created_at') # Default sorting
+        ordering = request.query_params.get('ordering') # Default: relevância (com q) ou -created_at
         
         google_service = GoogleBooksService()
         local_data = []
@@ -65,15 +214,17 @@ class GlobalSearchView(APIView):
              google_books = google_service.search_books(query, page, genre, MAX_API_LIMIT)
              return Response(google_books)
 
-        local_queryset = Book.objects.all().order_by(ordering)
+        # source=all: o Google roda em paralelo com a consulta local. Só entra na
+        # primeira página (sem cursor); as seguintes continuam só com o acervo.
+        google_futures = None
+        if source == 'all' and query and not request.query_params.get('cursor'):
+            google_futures = google_service.start_search(query, page, genre, MAX_API_LIMIT)
+
+        local_queryset = Book.objects.all()
 
         if query:
-            local_queryset = local_queryset.filter(
-                Q(title__icontains=query) | 
-                Q(author__icontains=query) | 
-                Q(isbn__icontains=query)
-            )
-        
+            local_queryset = search_books(local_queryset, query)
+
         if genre != 'ALL':
                 local_queryset = local_queryset.filter(genre__icontains=genre)
         
@@ -86,18 +237,69 @@ class GlobalSearchView(APIView):
         if available == 'true':
             local_queryset = local_queryset.filter(available_copies__gt=0)
 
-        local_books = local_queryset
-        
-        start = (page - 1) * MAX_API_LIMIT
-        end = start + MAX_API_LIMIT
-        local_books_page = local_books[start:end]
+        # Paginação keyset: a ordenação é aplicada pelo paginator (relevância por padrão com q)
+        paginator = BookCursorPagination()
+        paginator.page_size = MAX_API_LIMIT
+        if ordering and ordering.lstrip('-') in BookViewSet.ordering_fields:
+            paginator.ordering = (ordering, '-id')
+
+        # O isbn sempre vem do banco no source=all, mesmo fora do JSON: é a chave da deduplicação
+        local_queryset = BookSerializer.restrict_queryset(
+            local_queryset, request, extra=('isbn',) if source == 'all' else (),
+            ordering=paginator.get_ordering(request, local_queryset, self),
+        )
+
+        if source != 'all':
+            # Só o acervo: dá para validar antes de paginar (source=all depende do Google)
+            etag = _catalog_validators(request, local_queryset)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
 
-        local_serializer = BookSerializer(local_books_page, many=True, context={'request': request})
-        local_data = local_serializer.data
+        # JSON: a página vem do values() e é montada pela BookProjection (mesmo JSON do
+        # BookSerializer, sem instanciar models); o navegador da API usa o serializer
+        projection = BookProjection() if accepts_projection(request) else None
+        if projection is not None:
+            ordering = paginator.get_ordering(request, local_queryset, self)
+            # Colunas da ordenação entram no values(): o cursor é a posição do último item
+            extra = [field.lstrip('-') for field in ordering] + (['isbn'] if source == 'all' else [])
+            local_queryset = projection.values(local_queryset, request, extra=extra)
+
+        local_books_page = paginator.paginate_queryset(local_queryset, request, view=self)
+
+        if projection is not None:
+            with timed('serializer'):
+                local_data = projection.rows(local_books_page, request)
+            local_isbns = [record['isbn'] for record in local_books_page] if source == 'all' else []
+        else:
+            local_serializer = BookSerializer(local_books_page, many=True, context={'request': request})
+            local_data = local_serializer.data
+            local_isbns = [book.isbn for book in local_books_page] if source == 'all' else []
         for b in local_data: 
             b['is_google'] = False
 
-        return Response(local_data)
+        if source != 'all':
+            response = paginator.get_paginated_response(local_data)
+            if projection is not None:
+                response = ProjectedResponse(response.data)
+            return set_validators(response, etag)
+
+        google_status = 'skipped'
+        google_data = []
+        if google_futures is not None:
+            with timed('google'):
+                google_data, complete = google_service.collect_search(
+                    google_futures, MAX_API_LIMIT, FEDERATED_SEARCH_BUDGET - (time.monotonic() - started),
+                )
+            google_status = 'ok' if complete else 'timeout'
+            google_data = _drop_catalog_duplicates(google_data, local_isbns)
+
+        # Acervo primeiro (na ordem de relevância), depois o que só existe no Google
+        response = paginator.get_paginated_response(list(local_data) + google_data)
+        response.data['google'] = google_status
+        if projection is not None:
+            response = ProjectedResponse(response.data)
+        return response
 
 class PurchaseRequestView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -138,6 +340,7 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
     queryset = None 
     serializer_class = PurchaseRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         base_queryset = PurchaseRequest.objects.all().order_by('-created_at')
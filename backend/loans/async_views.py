@@ -0,0 +1,114 @@
+"""
+Stream de eventos (Server-Sent Events) dos empréstimos do usuário:
+``GET /api/loans/events/``. Substitui o polling de ``lendo_agora`` e do
+dashboard; os eventos vêm de loans.events.
+
+O EventSource do navegador não envia headers. Além do
+``Authorization: Bearer``, o stream aceita em ``?ticket=`` um ticket
+assinado de ``POST /api/loans/events/ticket/``, válido por
+LOAN_EVENTS_TICKET_MAX_AGE segundos e que só abre o stream. O token de
+acesso nunca vai na URL (e nos logs de acesso do servidor e dos proxies).
+A conexão termina quando o token que emitiu o ticket expira (ou após
+LOAN_EVENTS_MAX_AGE); o cliente pede outro ticket e reconecta.
+
+Sob ASGI cada conexão aberta é só uma corrotina esperando a fila; sob WSGI
+(runserver) ela ocupa uma thread, o que serve para desenvolvimento. Depois
+da autenticação o stream não consulta o banco.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework_simplejwt.settings import api_settings
+
+from users.authentication import CachedJWTAuthentication
+
+from . import events
+
+# Comentário periódico: mantém a conexão viva em proxies que cortam conexões ociosas
+HEARTBEAT_SECONDS = getattr(settings, 'LOAN_EVENTS_HEARTBEAT', 15)
+MAX_AGE_SECONDS = getattr(settings, 'LOAN_EVENTS_MAX_AGE', 30 * 60)
+RETRY_MS = 3000
+TICKET_MAX_AGE = getattr(settings, 'LOAN_EVENTS_TICKET_MAX_AGE', 30)
+TICKET_SALT = 'loans.events.ticket'
+
+PREAMBLE = f'retry: {RETRY_MS}\n: conectado\n\n'
+HEARTBEAT = ': ping\n\n'
+
+
+def issue_ticket(token):
+    """
+    Ticket do stream para o token de acesso (já validado) da requisição: os
+    claims que a autenticação confere, assinados e com prazo curto.
+    """
+    claims = (api_settings.USER_ID_CLAIM, 'exp', api_settings.REVOKE_TOKEN_CLAIM)
+    return signing.dumps(
+        {claim: token.get(claim) for claim in claims if token.get(claim) is not None},
+        salt=TICKET_SALT,
+    )
+
+
+def _authenticate(request):
+    """(usuário, expiração do token em epoch) ou None."""
+    auth = CachedJWTAuthentication()
+    header = auth.get_header(request)
+    raw_token = auth.get_raw_token(header) if header else None
+
+    try:
+        if raw_token is not None:
+            claims = auth.get_validated_token(raw_token)
+        elif request.GET.get('ticket'):
+            claims = signing.loads(request.GET['ticket'], salt=TICKET_SALT, max_age=TICKET_MAX_AGE)
+        else:
+            return None
+        # Mesmas verificações do token: usuário ativo e, se ligado, senha não trocada
+        user = auth.get_user(claims)
+    except (exceptions.AuthenticationFailed, signing.BadSignature):
+        return None
+    return user, claims['exp']
+
+
+def format_event(message):
+    return f"event: {message['type']}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+
+def _stream(user, deadline):
+    # Assina ao começar o stream: o que for publicado depois do "conectado" chega
+    with events.subscribe(user) as subscription:
+        yield PREAMBLE
+        while (remaining := deadline - time.time()) > 0:
+            message = subscription.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            yield HEARTBEAT if message is None else format_event(message)
+
+
+async def _astream(user, deadline):
+    with events.subscribe(user, loop=asyncio.get_running_loop()) as subscription:
+        yield PREAMBLE
+        while (remaining := deadline - time.time()) > 0:
+            message = await subscription.aget(timeout=min(HEARTBEAT_SECONDS, remaining))
+            yield HEARTBEAT if message is None else format_event(message)
+
+
+@require_GET
+async def loan_events(request):
+    authenticated = await sync_to_async(_authenticate)(request)
+    if authenticated is None:
+        return JsonResponse({'detail': str(exceptions.NotAuthenticated.default_detail)}, status=401)
+
+    user, expires_at = authenticated
+    deadline = min(time.time() + MAX_AGE_SECONDS, expires_at)
+    # Sob WSGI a resposta é consumida numa thread: o stream precisa ser síncrono
+    stream = _astream(user, deadline) if isinstance(request, ASGIRequest) else _stream(user, deadline)
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx: não segurar os eventos no buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,233 @@
+"""
+Cenários de benchmark dos endpoints e tasks mais usados.
+
+Cada cenário é executado em sequência pelo comando ``benchmark``, medindo
+latência (média e percentis), vazão sequencial e número de queries por
+execução. As requisições passam pela pilha completa (middlewares, JWT,
+views e serializers) via ``django.test.Client``.
+
+Os cenários ``render.*`` medem só a montagem do JSON de uma lista fixa de
+linhas (consulta + serialização, sem a pilha HTTP), comparando o serializer
+do DRF com a projeção via values(); o resultado inclui o custo por linha.
+
+Rode sobre a massa gerada por ``seed_library``.
+"""
+import statistics
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.models import Book
+from books.projections import BookProjection
+from books.serializers import BookSerializer
+from sistema_biblioteca.projections import dumps
+from users.services import invalidate_librarian_stats
+from .models import Loan
+from .projections import LoanProjection
+from .serializers import LoanSerializer
+from .tasks import check_overdue_loans
+
+User = get_user_model()
+
+LIBRARIAN_USERNAME = 'bench_librarian'
+
+# Linhas por execução nos cenários render.*
+RENDER_ROWS = 1000
+
+
+@dataclass
+class Scenario:
+    name: str
+    run: Callable[[], Optional[int]]
+    # Executado antes de cada iteração, fora da medição
+    before_each: Optional[Callable[[], None]] = None
+    # Linhas processadas por execução (render.*): o resultado ganha o custo por linha
+    rows: int = 0
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    iterations: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    min_ms: float
+    max_ms: float
+    throughput_rps: float
+    queries_mean: float
+    queries_max: int
+    status_codes: Dict[str, int] = field(default_factory=dict)
+    per_row_us: Optional[float] = None
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(scenario, iterations, warmup):
+    for _ in range(warmup):
+        if scenario.before_each:
+            scenario.before_each()
+        scenario.run()
+
+    timings, queries, status_codes = [], [], {}
+    for _ in range(iterations):
+        if scenario.before_each:
+            scenario.before_each()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            status = scenario.run()
+            timings.append(time.perf_counter() - started)
+        queries.append(len(ctx.captured_queries))
+        if status is not None:
+            status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+
+    total = sum(timings)
+    return ScenarioResult(
+        name=scenario.name,
+        iterations=iterations,
+        mean_ms=statistics.mean(timings) * 1000,
+        p50_ms=_percentile(timings, 50) * 1000,
+        p95_ms=_percentile(timings, 95) * 1000,
+        p99_ms=_percentile(timings, 99) * 1000,
+        min_ms=min(timings) * 1000,
+        max_ms=max(timings) * 1000,
+        throughput_rps=iterations / total if total else 0.0,
+        queries_mean=statistics.mean(queries),
+        queries_max=max(queries),
+        status_codes=status_codes,
+        per_row_us=statistics.mean(timings) / scenario.rows * 1_000_000 if scenario.rows else None,
+    )
+
+
+def _client_for(user):
+    return Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+
+def _get(client, url, **params):
+    return lambda: client.get(url, params).status_code
+
+
+def _cursor_for_page(client, url, page):
+    """Percorre as páginas anteriores para obter o cursor da página desejada."""
+    cursor = None
+    for _ in range(page - 1):
+        response = client.get(url, {'cursor': cursor} if cursor else {})
+        next_url = response.json().get('next')
+        if not next_url:
+            break
+        cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+    return cursor
+
+
+def _api_request(user):
+    request = Request(RequestFactory().get('/'))
+    request.user = user
+    return request
+
+
+def _render_with_serializer(serializer_class, queryset, request):
+    def run():
+        serializer = serializer_class(queryset.all(), many=True, context={'request': request})
+        JSONRenderer().render(serializer.data)
+    return run
+
+
+def _render_with_projection(projection, queryset, request):
+    def run():
+        dumps(projection.rows(projection.values(queryset.all(), request), request))
+    return run
+
+
+def _render_scenarios(reader):
+    request = _api_request(reader)
+    loans = Loan.objects.select_related('user', 'book').with_fine_due().order_by('-loan_date')[:RENDER_ROWS]
+    books = Book.objects.order_by('-created_at')[:RENDER_ROWS]
+    loan_rows = min(RENDER_ROWS, Loan.objects.count())
+    book_rows = min(RENDER_ROWS, Book.objects.count())
+    return [
+        Scenario('render.loans.serializer', _render_with_serializer(LoanSerializer, loans, request), rows=loan_rows),
+        Scenario('render.loans.projection', _render_with_projection(LoanProjection(), loans, request), rows=loan_rows),
+        Scenario('render.books.serializer', _render_with_serializer(BookSerializer, books, request), rows=book_rows),
+        Scenario('render.books.projection', _render_with_projection(BookProjection(), books, request), rows=book_rows),
+    ]
+
+
+def _rolled_back(func):
+    # Tasks que escrevem rodam numa transação desfeita, para não alterar a massa
+    def run():
+        with transaction.atomic():
+            func()
+            transaction.set_rollback(True)
+    return run
+
+
+def _reader():
+    reader = (
+        User.objects.filter(username__startswith='bench_', loans__status__in=['ACTIVE', 'OVERDUE'])
+        .order_by('pk').first()
+    )
+    return reader or User.objects.filter(is_staff=False).order_by('pk').first()
+
+
+def _librarian():
+    librarian, _ = User.objects.get_or_create(
+        username=LIBRARIAN_USERNAME, defaults={'role': 'LIBRARIAN', 'is_staff': True},
+    )
+    return librarian
+
+
+def build_scenarios():
+    reader = _reader()
+    if reader is None:
+        raise RuntimeError('Nenhum leitor encontrado. Rode "manage.py seed_library" antes.')
+
+    reader_client = _client_for(reader)
+    librarian_client = _client_for(_librarian())
+    book = Book.objects.order_by('-created_at').first()
+    deep_cursor = _cursor_for_page(reader_client, '/api/books/search-global/', 25)
+
+    return [
+        Scenario('books.list', _get(reader_client, '/api/books/')),
+        Scenario('books.list.available', _get(reader_client, '/api/books/', available='true')),
+        Scenario('books.detail', _get(reader_client, f'/api/books/{book.pk}/')),
+        Scenario('search.local', _get(reader_client, '/api/books/search-global/')),
+        Scenario('search.local.page25', _get(reader_client, '/api/books/search-global/', cursor=deep_cursor or '')),
+        Scenario('search.local.query', _get(reader_client, '/api/books/search-global/', q='memorias sertao')),
+        Scenario('loans.lendo_agora', _get(reader_client, '/api/loans/lendo_agora/')),
+        Scenario('loans.historico', _get(reader_client, '/api/loans/historico/')),
+        Scenario('loans.list.librarian', _get(librarian_client, '/api/loans/')),
+        Scenario('dashboard.reader', _get(reader_client, '/api/dashboard/')),
+        Scenario('dashboard.librarian', _get(librarian_client, '/api/dashboard/')),
+        Scenario(
+            'dashboard.librarian.cold', _get(librarian_client, '/api/dashboard/'),
+            before_each=invalidate_librarian_stats,
+        ),
+        Scenario('task.check_overdue_loans', _rolled_back(check_overdue_loans)),
+        *_render_scenarios(reader),
+    ]
+
+
+def dataset_summary():
+    return {
+        'books': Book.objects.count(),
+        'users': User.objects.count(),
+        'loans': Loan.objects.count(),
+    }
+
+
+def results_as_dicts(results: List[ScenarioResult]):
+    return [asdict(result) for result in results]
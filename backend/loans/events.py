@@ -0,0 +1,271 @@
+"""
+Eventos de empréstimo em tempo real, entregues por Server-Sent Events
+(``GET /api/loans/events/``, ver loans.async_views).
+
+Quem publica são os pontos que mudam o status de um empréstimo (aprovação,
+rejeição, devolução, processamento de atrasos, operações em lote) e o
+estoque. Os eventos vão para:
+
+- ``user:<id>``: os empréstimos do próprio leitor (``loan.status``);
+- ``staff``: todos os empréstimos, para as telas do bibliotecário (do
+  processamento de atrasos vem um resumo ``loans.overdue`` por lote, não um
+  evento por empréstimo);
+- ``books``: disponibilidade dos livros (``book.availability``), para todos.
+
+Cada processo tem um ``EventHub`` que entrega as mensagens às conexões
+abertas nele, sem consultas ao banco. Com ``LOAN_EVENTS_REDIS_URL`` as
+publicações passam por um canal Redis e cada processo mantém uma única
+assinatura (numa thread), então um evento publicado pelo worker do Celery
+chega às conexões de todos os workers web. Sem Redis a entrega é só dentro
+do processo (desenvolvimento/testes).
+
+As publicações rodam depois do commit: ninguém é avisado de uma mudança
+que acabou desfeita.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from books.models import Book
+
+logger = logging.getLogger(__name__)
+
+EVENTS_REDIS_URL = getattr(settings, 'LOAN_EVENTS_REDIS_URL', None)
+REDIS_CHANNEL = 'library:events'
+
+STAFF_CHANNEL = 'staff'
+BOOKS_CHANNEL = 'books'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+class Subscription:
+    """
+    Fila de mensagens de uma conexão. ``put`` pode ser chamado de qualquer
+    thread; a leitura é síncrona (``get``) ou, com ``loop``, assíncrona (``aget``).
+    """
+
+    def __init__(self, hub, channels, loop=None):
+        self.hub = hub
+        self.channels = tuple(channels)
+        self._loop = loop
+        self._queue = asyncio.Queue() if loop is not None else queue.SimpleQueue()
+
+    def put(self, message):
+        if self._loop is None:
+            self._queue.put(message)
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+
+    def get(self, timeout):
+        """Próxima mensagem, ou None se nada chegou em ``timeout`` segundos."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventHub:
+    """Fan-out em memória: canal -> conexões abertas neste processo."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels, loop=None):
+        subscription = Subscription(self, channels, loop)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+
+class LocalBackend:
+    """Entrega só dentro do processo."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, channel, message):
+        self.hub.dispatch(channel, message)
+
+    def ensure_listening(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Publica no canal Redis; uma thread por processo escuta o canal e repassa
+    as mensagens ao hub local. Se o Redis cair, a thread reconecta sozinha
+    (as mensagens publicadas nesse meio tempo se perdem, como em qualquer
+    pub/sub; o cliente recarrega a tela ao reconectar).
+    """
+    RECONNECT_DELAY = 2.0
+
+    def __init__(self, hub, url):
+        import redis  # dependência opcional: só com LOAN_EVENTS_REDIS_URL
+
+        self.hub = hub
+        self.redis = redis.Redis.from_url(url)
+        self._errors = (redis.RedisError, OSError)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        try:
+            self.redis.publish(REDIS_CHANNEL, json.dumps({'channel': channel, 'message': message}))
+        except self._errors as exc:
+            logger.warning('Redis indisponível, evento entregue só neste processo: %s', exc)
+            self.hub.dispatch(channel, message)
+
+    def ensure_listening(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='loan-events', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(REDIS_CHANNEL)
+                for item in pubsub.listen():
+                    data = json.loads(item['data'])
+                    self.hub.dispatch(data['channel'], data['message'])
+            except self._errors as exc:
+                logger.warning('Assinatura de eventos no Redis caiu, reconectando: %s', exc)
+                time.sleep(self.RECONNECT_DELAY)
+            finally:
+                pubsub.close()
+
+
+hub = EventHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = RedisBackend(hub, EVENTS_REDIS_URL) if EVENTS_REDIS_URL else LocalBackend(hub)
+        return _backend
+
+
+def subscribe(user, loop=None):
+    """Assinatura da conexão de ``user``: os próprios empréstimos, o estoque e, para staff, tudo."""
+    channels = [user_channel(user.pk), BOOKS_CHANNEL]
+    if user.is_staff:
+        channels.append(STAFF_CHANNEL)
+    backend = get_backend()
+    backend.ensure_listening()
+    return hub.subscribe(channels, loop)
+
+
+def loan_event(loan):
+    return {
+        'type': 'loan.status',
+        'loan': loan.pk,
+        'user': loan.user_id,
+        'book': loan.book_id,
+        'status': loan.status,
+        'due_date': _isoformat(loan.due_date),
+        'return_date': _isoformat(loan.return_date),
+    }
+
+
+def _publish(events, book_ids, staff_summary=None):
+    backend = get_backend()
+    for user_id, event in events:
+        backend.publish(user_channel(user_id), event)
+        if staff_summary is None:
+            backend.publish(STAFF_CHANNEL, event)
+    if staff_summary is not None:
+        backend.publish(STAFF_CHANNEL, staff_summary)
+
+    if book_ids:
+        # Uma consulta por mudança de estoque, não por conexão aberta
+        for book_id, available in Book.objects.filter(pk__in=book_ids).values_list('pk', 'available_copies'):
+            backend.publish(BOOKS_CHANNEL, {
+                'type': 'book.availability', 'book': book_id, 'available_copies': available,
+            })
+
+
+def notify_loan_changes(loans, stock_changed=True):
+    """
+    Agenda (para depois do commit) os eventos de status dos empréstimos e,
+    com ``stock_changed``, a disponibilidade dos livros envolvidos.
+    ``loans`` pode ser qualquer objeto com pk, user_id, book_id, status,
+    due_date e return_date.
+    """
+    events = [(loan.user_id, loan_event(loan)) for loan in loans]
+    book_ids = {loan.book_id for loan in loans if loan.book_id is not None} if stock_changed else set()
+    if events or book_ids:
+        # robust: uma falha ao publicar não desfaz nem derruba a requisição
+        transaction.on_commit(lambda: _publish(events, book_ids), robust=True)
+
+
+def notify_overdue(rows):
+    """
+    Eventos de um lote do processamento de atrasos (``rows``: pk, user_id,
+    book_id e due_date). Cada leitor recebe o ``loan.status`` dos seus
+    empréstimos; o staff recebe um único ``loans.overdue`` com os ids do lote.
+    """
+    events = [
+        (user_id, {
+            'type': 'loan.status', 'loan': pk, 'user': user_id, 'book': book_id, 'status': 'OVERDUE',
+            'due_date': _isoformat(due_date), 'return_date': None,
+        })
+        for pk, user_id, book_id, due_date in rows
+    ]
+    if events:
+        summary = {'type': 'loans.overdue', 'count': len(events), 'loans': [event['loan'] for _, event in events]}
+        transaction.on_commit(lambda: _publish(events, set(), staff_summary=summary), robust=True)
@@ -0,0 +1,17 @@
+import django_filters
+from .models import Loan
+
+
+class LoanFilter(django_filters.FilterSet):
+    # Sobre a multa devida agora (anotação fine_due de Loan.objects.with_fine_due)
+    min_fine = django_filters.NumberFilter(field_name='fine_due', lookup_expr='gte')
+    has_fine = django_filters.BooleanFilter(method='filter_has_fine')
+
+    class Meta:
+        model = Loan
+        fields = ['status', 'user', 'book']
+
+    def filter_has_fine(self, queryset, name, value):
+        if value:
+            return queryset.filter(fine_due__gt=0, paid=False)
+        return queryset.exclude(fine_due__gt=0, paid=False)
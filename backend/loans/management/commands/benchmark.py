@@ -0,0 +1,78 @@
+import json
+import platform
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from loans.benchmarks import build_scenarios, dataset_summary, results_as_dicts, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência, vazão e queries dos endpoints e tasks principais. '
+        'Rode sobre a massa gerada por "seed_library".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', default='', help='Prefixos de cenários separados por vírgula (ex.: "search,dashboard").')
+        parser.add_argument('--output', help='Arquivo JSON onde salvar os resultados.')
+        parser.add_argument('--compare', help='JSON de uma execução anterior para comparar.')
+
+    def handle(self, *args, **options):
+        prefixes = [p.strip() for p in options['only'].split(',') if p.strip()]
+        baseline = self._load_baseline(options['compare']) if options['compare'] else {}
+
+        # Libera o "testserver" no ALLOWED_HOSTS para o django.test.Client
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            scenarios = build_scenarios()
+            if prefixes:
+                scenarios = [s for s in scenarios if any(s.name.startswith(p) for p in prefixes)]
+
+            results = []
+            for scenario in scenarios:
+                result = run_scenario(scenario, options['iterations'], options['warmup'])
+                results.append(result)
+                self._print_result(result, baseline.get(result.name))
+
+        if options['output']:
+            report = {
+                'meta': {
+                    'created_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'iterations': options['iterations'],
+                    'warmup': options['warmup'],
+                    'dataset': dataset_summary(),
+                },
+                'results': results_as_dicts(results),
+            }
+            Path(options['output']).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+            self.stdout.write(self.style.SUCCESS(f"Resultados salvos em {options['output']}."))
+
+    def _load_baseline(self, path):
+        try:
+            report = json.loads(Path(path).read_text())
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Não foi possível ler {path}: {exc}')
+        return {item['name']: item for item in report.get('results', [])}
+
+    def _print_result(self, result, previous):
+        line = (
+            f'{result.name:<28} p50 {result.p50_ms:8.2f}ms  p95 {result.p95_ms:8.2f}ms  '
+            f'p99 {result.p99_ms:8.2f}ms  {result.throughput_rps:8.1f} req/s  '
+            f'{result.queries_mean:5.1f} queries'
+        )
+        if result.per_row_us is not None:
+            line += f'  {result.per_row_us:7.2f}µs/linha'
+        if previous:
+            delta = (result.p50_ms - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0
+            line += f'  (p50 {delta:+.1f}%, queries {result.queries_mean - previous["queries_mean"]:+.1f})'
+        self.stdout.write(line)
@@ -0,0 +1,242 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from books.models import Book
+from loans.models import Loan, get_fine_daily_amount
+from users.services import invalidate_librarian_stats
+
+User = get_user_model()
+
+# Marcadores dos dados sintéticos (permitem limpar sem tocar no acervo real)
+USERNAME_PREFIX = 'bench_'
+ISBN_PREFIX = '999'
+SEED_PASSWORD = 'bench-senha-123'
+
+GENRES = ['Romance', 'Ficção', 'Fantasia', 'História', 'Biografia', 'Ciência', 'Poesia', 'Infantil']
+LANGUAGES = ['pt'] * 8 + ['en', 'es']
+WORDS = [
+    'sertão', 'memórias', 'cidade', 'mar', 'noite', 'coração', 'caminho', 'tempo', 'vidas',
+    'história', 'amor', 'guerra', 'segredo', 'rio', 'estrela', 'viagem', 'casa', 'sombra',
+]
+AUTHORS = [
+    'Machado de Assis', 'Clarice Lispector', 'Jorge Amado', 'Graciliano Ramos', 'Cecília Meireles',
+    'Guimarães Rosa', 'Rachel de Queiroz', 'Érico Veríssimo', 'Lygia Fagundes Telles', 'José de Alencar',
+]
+
+# Distribuição de status dos empréstimos (peso relativo)
+LOAN_STATUS_WEIGHTS = {
+    'RETURNED': 60,
+    'ACTIVE': 15,
+    'REJECTED': 10,
+    'OVERDUE': 8,
+    'PENDING': 7,
+}
+OPEN_STATUSES = {'PENDING', 'ACTIVE', 'OVERDUE'}
+
+
+@contextmanager
+def _without_auto_now_add(*fields):
+    # bulk_create sobrescreveria as datas históricas geradas com "agora"
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera um acervo sintético (livros, leitores e empréstimos) para benchmarks. '
+        f'Usuários "{USERNAME_PREFIX}*" usam a senha "{SEED_PASSWORD}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=5_000)
+        parser.add_argument('--loans', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--clear', action='store_true', help='Remove os dados sintéticos anteriores antes de gerar.')
+        parser.add_argument('--skip-index', action='store_true', help='Não reconstrói o índice de busca no final.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        # Antes de apagar ou gerar qualquer coisa: empréstimos precisam de livros e leitores
+        if options['loans']:
+            self._check_loan_sources(options)
+
+        if options['clear']:
+            self._clear()
+
+        with _without_auto_now_add(Book._meta.get_field('created_at'), Loan._meta.get_field('loan_date')):
+            book_ids = self._seed_books(options['books'])
+            user_ids = self._seed_users(options['users'])
+            open_loans = self._seed_loans(options['loans'], book_ids, user_ids)
+
+        self._update_availability(open_loans)
+        # bulk_create/update não disparam os signals de invalidação
+        invalidate_librarian_stats()
+
+        if not options['skip_index']:
+            call_command('reindex_books', batch_size=self.batch_size, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(book_ids)} livros, {len(user_ids)} leitores e {options['loans']} empréstimos gerados."
+        ))
+
+    def _check_loan_sources(self, options):
+        sources = [
+            ('books', 'livros', Book.objects.filter(isbn__startswith=ISBN_PREFIX)),
+            ('users', 'leitores', User.objects.filter(username__startswith=USERNAME_PREFIX)),
+        ]
+        for option, label, existing in sources:
+            if not options[option] and (options['clear'] or not existing.exists()):
+                raise CommandError(
+                    f"Nenhum dos {label} sintéticos para os empréstimos: use --{option} maior que 0."
+                )
+
+    def _clear(self):
+        Loan.objects.filter(user__username__startswith=USERNAME_PREFIX).delete()
+        Loan.objects.filter(book__isbn__startswith=ISBN_PREFIX).delete()
+        Book.objects.filter(isbn__startswith=ISBN_PREFIX).delete()
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def _seed_books(self, total):
+        rng = self.rng
+        offset = Book.objects.filter(isbn__startswith=ISBN_PREFIX).count()
+
+        def generate():
+            for i in range(offset, offset + total):
+                copies = rng.choice([1, 1, 2, 2, 3, 5])
+                title = ' '.join(rng.sample(WORDS, rng.randint(1, 3))).capitalize()
+                yield Book(
+                    title=f'{title} {i}',
+                    author=rng.choice(AUTHORS),
+                    isbn=f'{ISBN_PREFIX}{i:010d}',
+                    publisher=rng.choice(['Companhia das Letras', 'Record', 'Rocco', 'Ática', 'Globo']),
+                    publication_date=self.now.date() - timedelta(days=rng.randint(0, 365 * 80)),
+                    genre=rng.choice(GENRES),
+                    language=rng.choice(LANGUAGES),
+                    description=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                    total_copies=copies,
+                    available_copies=copies,
+                    created_at=self.now - timedelta(minutes=rng.randint(0, 60 * 24 * 365 * 3)),
+                )
+
+        for batch in _batched(generate(), self.batch_size):
+            with transaction.atomic():
+                Book.objects.bulk_create(batch)
+
+        return list(
+            Book.objects.filter(isbn__startswith=ISBN_PREFIX).order_by('pk').values_list('pk', 'total_copies')
+        )
+
+    def _seed_users(self, total):
+        offset = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        # Um único hash para todos: make_password por usuário dominaria o tempo do seed
+        password = make_password(SEED_PASSWORD)
+
+        users = (
+            User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com',
+                 password=password, first_name='Leitor', last_name=str(i))
+            for i in range(offset, offset + total)
+        )
+        for batch in _batched(users, self.batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+
+        return list(
+            User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk').values_list('pk', flat=True)
+        )
+
+    def _seed_loans(self, total, books, user_ids):
+        """
+        Gera os empréstimos sem ultrapassar as cópias de cada livro; retorna os
+        abertos por livro, contando também os de execuções anteriores (sem --clear).
+        """
+        rng = self.rng
+        statuses = list(LOAN_STATUS_WEIGHTS)
+        weights = list(LOAN_STATUS_WEIGHTS.values())
+        daily = get_fine_daily_amount()
+        open_loans = Counter(dict(
+            Loan.objects.filter(book__isbn__startswith=ISBN_PREFIX, status__in=OPEN_STATUSES)
+            .values_list('book_id').annotate(total=Count('pk')).order_by()
+        ))
+
+        def generate():
+            for _ in range(total):
+                book_id, copies = books[rng.randrange(len(books))]
+                status = rng.choices(statuses, weights)[0]
+                if status in OPEN_STATUSES:
+                    if open_loans[book_id] >= copies:
+                        status = 'RETURNED'
+                    else:
+                        open_loans[book_id] += 1
+                yield self._loan(rng.choice(user_ids), book_id, status, daily)
+
+        for batch in _batched(generate(), self.batch_size):
+            with transaction.atomic():
+                Loan.objects.bulk_create(batch)
+
+        return open_loans
+
+    def _loan(self, user_id, book_id, status, daily):
+        rng = self.rng
+        loan = Loan(user_id=user_id, book_id=book_id, status=status)
+
+        if status == 'PENDING':
+            loan.loan_date = self.now - timedelta(hours=rng.randint(0, 72))
+        elif status == 'ACTIVE':
+            loan.loan_date = self.now - timedelta(days=rng.randint(0, 6))
+            loan.due_date = loan.loan_date + timedelta(days=7)
+        elif status == 'OVERDUE':
+            late_days = rng.randint(1, 60)
+            loan.due_date = self.now - timedelta(days=late_days)
+            loan.loan_date = loan.due_date - timedelta(days=7)
+            loan.fine_last_updated = self.now - timedelta(days=1)
+            loan.fine_amount = daily * Decimal(max(late_days - 1, 0))
+        else:
+            loan.loan_date = self.now - timedelta(days=rng.randint(8, 365 * 2))
+            loan.due_date = loan.loan_date + timedelta(days=7)
+            if status == 'RETURNED':
+                loan.return_date = loan.loan_date + timedelta(days=rng.randint(1, 12))
+        return loan
+
+    def _update_availability(self, open_loans):
+        # Um UPDATE por (quantidade em aberto, lote de ids) em vez de um por livro
+        by_count = {}
+        for book_id, count in open_loans.items():
+            by_count.setdefault(count, []).append(book_id)
+
+        for count, ids in by_count.items():
+            for batch in _batched(ids, self.batch_size):
+                Book.objects.filter(pk__in=batch).update(
+                    available_copies=F('total_copies') - count, updated_at=timezone.now(),
+                )
@@ -1,10 +1,82 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.functions import Coalesce, Greatest, TruncDate
 from django.utils import timezone
+from datetime import timezone as dt_timezone
 from decimal import Decimal
 from books.models import Book
 from django.utils import timezone # Adicionar import para defaults se necessário
 
+# Empréstimos cuja multa cresce a cada dia de atraso (os demais ficam com o valor gravado)
+FINE_ACCRUING_STATUSES = ('ACTIVE', 'OVERDUE')
+
+
+def get_fine_daily_amount():
+    daily_str = getattr(settings, 'FINE_DAILY_AMOUNT', '1.00')
+    try:
+        return Decimal(str(daily_str))
+    except Exception:
+        return Decimal('1.00')
+
+
+class DaysBetween(models.Func):
+    """Dias entre duas datas (fim - início), como inteiro."""
+    arity = 2
+    output_field = models.IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+
+class QuantizedDecimalField(models.DecimalField):
+    """output_field de anotações: o SQLite devolve expressões decimais sem as casas fixas."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return value.quantize(Decimal(1).scaleb(-self.decimal_places))
+
+
+def last_fine_date():
+    # Mesmo ponto de partida de Loan.apply_fines_until: última atualização ou vencimento.
+    # Os valores vêm do banco em UTC, como no .date() feito em Python.
+    return TruncDate(Coalesce('fine_last_updated', 'due_date'), tzinfo=dt_timezone.utc)
+
+
+class LoanQuerySet(models.QuerySet):
+    def with_fine_due(self, when=None):
+        """
+        Anota ``fine_due``: a multa devida em ``when`` (padrão: agora), igual a
+        ``fine_amount`` mais os dias de atraso ainda não gravados. A multa só é
+        gravada nos acertos (devolução e pagamento); até lá é calculada na leitura.
+        """
+        if when is None:
+            when = timezone.now()
+
+        days = DaysBetween(models.Value(when.date(), models.DateField()), last_fine_date())
+        accrued = models.F('fine_amount') + models.Value(get_fine_daily_amount()) * Greatest(days, 0)
+        fine_field = Loan._meta.get_field('fine_amount')
+        return self.annotate(fine_due=models.Case(
+            models.When(
+                models.Q(paid=False, status__in=FINE_ACCRUING_STATUSES, due_date__lt=when),
+                then=accrued,
+            ),
+            default=models.F('fine_amount'),
+            output_field=QuantizedDecimalField(
+                max_digits=fine_field.max_digits, decimal_places=fine_field.decimal_places,
+            ),
+        ))
+
+
 class Loan(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'Pendente'),  # NOVO STATUS
@@ -21,6 +93,25 @@ class Loan(models.Model):
     return_date = models.DateTimeField(null=True, blank=True, verbose_name='Data da Devolução Real')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING', verbose_name='Status') # NOVO DEFAULT
 
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # lendo_agora/historico, dashboard do leitor e status_usuario
+            models.Index(fields=['user', 'status'], name='loan_user_status_idx'),
+            models.Index(fields=['user', 'book', 'status'], name='loan_user_book_status_idx'),
+            # check_overdue_loans e filtros ?status= da gestão
+            models.Index(fields=['status', 'due_date'], name='loan_status_due_idx'),
+            # Listagem paginada por cursor (-loan_date, -id)
+            models.Index(fields=['-loan_date', '-id'], name='loan_date_id_idx'),
+            # Empréstimos em aberto do leitor, do mais recente para o mais antigo
+            models.Index(
+                fields=['user', '-loan_date'],
+                condition=models.Q(status__in=['PENDING', 'ACTIVE', 'OVERDUE']),
+                name='loan_open_by_user_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user} pegou {self.book} ({self.get_status_display()})"
 
@@ -29,32 +120,54 @@ class Loan(models.Model):
     paid = models.BooleanField(default=False, verbose_name='Multa Paga')
     paid_date = models.DateTimeField(null=True, blank=True, verbose_name='Data do Pagamento')
 
-    def apply_fines_until(self, when=None):
-        if when is None:
-            when = timezone.now()
+    @property
+    def fine_due(self):
+        """
+        Multa devida agora. Vem da anotação de ``with_fine_due()`` quando o
+        empréstimo foi lido com ela; senão é calculada com os campos atuais.
+        """
+        if '_fine_due' in self.__dict__:
+            return self._fine_due
+        return self.fine_due_at()
 
-        if getattr(self, 'paid', False):
-            return
+    @fine_due.setter
+    def fine_due(self, value):
+        # Chamado pelo Django ao carregar a anotação
+        self._fine_due = value
 
-        if self.due_date >= when:
-            return
+    def _fine_days(self, when):
+        if self.paid or self.due_date is None or self.due_date >= when:
+            return 0
+        last_point = self.fine_last_updated or self.due_date
+        return max((when.date() - last_point.date()).days, 0)
 
-        from django.conf import settings as dj_settings
-        from decimal import Decimal
+    def fine_due_at(self, when=None):
+        """Multa devida em ``when`` sem gravar nada (mesma conta de with_fine_due)."""
+        if when is None:
+            when = timezone.now()
+        fine = self.fine_amount or Decimal('0.00')
+        if self.status not in FINE_ACCRUING_STATUSES:
+            return fine
+        return fine + get_fine_daily_amount() * Decimal(self._fine_days(when))
 
-        daily_str = getattr(dj_settings, 'FINE_DAILY_AMOUNT', '1.00')
-        try:
-            daily = Decimal(str(daily_str))
-        except Exception:
-            daily = Decimal('1.00')
+    def apply_fines_until(self, when=None):
+        """Grava em fine_amount a multa acumulada até ``when`` (acertos: devolução e pagamento)."""
+        if when is None:
+            when = timezone.now()
 
-        last_point = self.fine_last_updated or self.due_date
+        # A anotação lida antes deixa de valer
+        self.__dict__.pop('_fine_due', None)
 
-        days = (when.date() - last_point.date()).days
+        days = self._fine_days(when)
         if days <= 0:
             return
 
-        additional = daily * Decimal(days)
+        additional = get_fine_daily_amount() * Decimal(days)
         self.fine_amount = (self.fine_amount or Decimal('0.00')) + additional
         self.fine_last_updated = when
-        return additional
\ No newline at end of file
+        return additional
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # fine_due passa a refletir os campos gravados
+        self.__dict__.pop('_fine_due', None)
@@ -0,0 +1,33 @@
+from sistema_biblioteca.projections import Projection, datetime_formatter, decimal_formatter
+from .models import Loan
+from .serializers import LoanSerializer
+
+_fine_field = Loan._meta.get_field('fine_amount')
+
+
+class LoanProjection(Projection):
+    """values() equivalente ao LoanSerializer (lendo_agora/historico)."""
+    serializer_class = LoanSerializer
+    columns = {
+        'id': 'id',
+        'user': 'user__username',  # StringRelatedField: str(user) é o username
+        'book': 'book_id',
+        'book_title': 'book__title',
+        'loan_date': 'loan_date',
+        'due_date': 'due_date',
+        'return_date': 'return_date',
+        'status': 'status',
+        'fine_amount': 'fine_due',  # anotação de with_fine_due()
+        'paid': 'paid',
+        'paid_date': 'paid_date',
+    }
+
+    def get_formatters(self, request, records):
+        format_datetime = datetime_formatter()
+        return {
+            'loan_date': format_datetime,
+            'due_date': format_datetime,
+            'return_date': format_datetime,
+            'paid_date': format_datetime,
+            'fine_amount': decimal_formatter(_fine_field.max_digits, _fine_field.decimal_places),
+        }
@@ -1,13 +1,22 @@
 from rest_framework import serializers
+from sistema_biblioteca.instrumentation import TimedListSerializer, TimedSerializerMixin
+from sistema_biblioteca.sparse import SparseFieldsetMixin
 from .models import Loan
 
 
-class LoanSerializer(serializers.ModelSerializer):
+class LoanSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     book_title = serializers.CharField(source='book.title', read_only=True)
+    # Multa devida agora (gravada só na devolução/pagamento); ver Loan.objects.with_fine_due
+    fine_amount = serializers.DecimalField(source='fine_due', max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Loan
         
         fields = ['id', 'user', 'book', 'book_title', 'loan_date', 'due_date', 'return_date', 'status', 'fine_amount', 'paid', 'paid_date']
         read_only_fields = ['loan_date', 'return_date', 'status', 'due_date', 'fine_amount', 'paid', 'paid_date']
+        list_serializer_class = TimedListSerializer
+        # ?compact=true: colunas da tela "Meus empréstimos"
+        compact_fields = ['id', 'book', 'book_title', 'loan_date', 'due_date', 'status', 'fine_amount', 'paid']
+        # fine_amount vem da anotação fine_due, calculada no SQL mesmo com .only()
+        field_columns = {'user': ('user__username',), 'book_title': ('book__title',), 'fine_amount': ()}
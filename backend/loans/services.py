@@ -0,0 +1,174 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from users.services import invalidate_librarian_stats
+from books.cache import invalidate_book_detail
+from books.models import Book
+from .events import notify_loan_changes, notify_overdue
+from .models import Loan
+
+OVERDUE_CHUNK_SIZE = 5000
+
+
+def reserve_copy(book_id):
+    """
+    Retira uma cópia do estoque com um UPDATE condicional (só se houver
+    cópia disponível). Retorna False quando o livro está esgotado.
+
+    Só available_copies e updated_at (validador do GET condicional) são
+    escritos: sem save() completo, sem post_save e sem segurar o lock da
+    linha além do próprio UPDATE.
+    """
+    return Book.objects.filter(pk=book_id, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1, updated_at=timezone.now(),
+    ) == 1
+
+
+def release_copy(book_id):
+    """Devolve uma cópia ao estoque (rejeição ou devolução)."""
+    if book_id is None:
+        return False
+    return Book.objects.filter(pk=book_id).update(
+        available_copies=F('available_copies') + 1, updated_at=timezone.now(),
+    ) == 1
+
+
+def process_overdue_loans(when=None, chunk_size=OVERDUE_CHUNK_SIZE):
+    """
+    Versão em lote de check_overdue_loans: marca como OVERDUE os empréstimos
+    ativos vencidos por faixa de ids. De cada lote só são lidas (e travadas)
+    as colunas que os eventos usam (pk, leitor, livro, vencimento), sem
+    instanciar models; o staff recebe um resumo por lote (loans.events).
+
+    As multas não são gravadas aqui: o valor devido é calculado na leitura
+    (``Loan.objects.with_fine_due()``) e só vai para ``fine_amount`` nos
+    acertos (devolução e pagamento). Cada empréstimo é escrito uma única vez,
+    na mudança de status, em vez de todo dia.
+    """
+    started = time.monotonic()
+    if when is None:
+        when = timezone.now()
+
+    late = Loan.objects.filter(status='ACTIVE', due_date__lt=when)
+    bounds = late.aggregate(first=Min('pk'), last=Max('pk'))
+    marked_overdue = 0
+
+    if bounds['first'] is not None:
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            with transaction.atomic():
+                # Os ids do lote vão para os eventos dos leitores (loans.events)
+                chunk = list(
+                    late.filter(pk__gte=start, pk__lt=start + chunk_size)
+                    .select_for_update().values_list('pk', 'user_id', 'book_id', 'due_date')
+                )
+                if not chunk:
+                    continue
+                marked_overdue += Loan.objects.filter(
+                    pk__in=[pk for pk, _, _, _ in chunk], status='ACTIVE'
+                ).update(status='OVERDUE')
+                notify_overdue(chunk)
+
+    # UPDATEs em lote não disparam post_save
+    if marked_overdue:
+        invalidate_librarian_stats()
+
+    return {
+        'marked_overdue': marked_overdue,
+        'duration': time.monotonic() - started,
+    }
+
+
+LOAN_PERIOD = timedelta(days=7)
+MAX_BULK_LOANS = 1000
+
+# action -> (status aceitos, mensagem de erro); mesmas regras das actions individuais
+BULK_TRANSITIONS = {
+    'approve': (('PENDING',), 'Este empréstimo não está pendente de aprovação.'),
+    'reject': (('PENDING',), 'Só é possível rejeitar solicitações pendentes.'),
+    'return': (('PENDING', 'ACTIVE', 'OVERDUE'), 'Este empréstimo já foi finalizado.'),
+}
+
+
+def _apply_transition(loan, action, now):
+    if action == 'approve':
+        loan.status = 'ACTIVE'
+        loan.loan_date = now
+        loan.due_date = now + LOAN_PERIOD
+        return ['status', 'loan_date', 'due_date']
+
+    if action == 'reject':
+        loan.status = 'REJECTED'
+        return ['status']
+
+    if loan.due_date is not None:
+        loan.apply_fines_until(now)
+    loan.return_date = now
+    loan.status = 'RETURNED'
+    return ['status', 'return_date', 'fine_amount', 'fine_last_updated']
+
+
+def bulk_transition(action, loan_ids, when=None):
+    """
+    Aprova, rejeita ou devolve vários empréstimos numa única transação.
+
+    Os locks seguem a mesma ordem das actions individuais (livro, depois
+    empréstimo) e, dentro de cada tabela, a ordem crescente de id, então
+    duas operações em lote concorrentes não entram em deadlock. As cópias
+    devolvidas ao estoque são somadas por livro: um UPDATE por quantidade,
+    não um por empréstimo.
+
+    Retorna um resultado por id, na ordem recebida.
+    """
+    allowed, error = BULK_TRANSITIONS[action]
+    now = when or timezone.now()
+    loan_ids = list(dict.fromkeys(loan_ids))
+
+    with transaction.atomic():
+        if action != 'approve':
+            book_ids = set(
+                Loan.objects.filter(pk__in=loan_ids, book__isnull=False).values_list('book_id', flat=True)
+            )
+            list(Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk').values_list('pk'))
+
+        loans = Loan.objects.select_for_update().filter(pk__in=loan_ids).order_by('pk').in_bulk()
+
+        results, changed, fields, deltas = {}, [], set(), Counter()
+        for loan_id in loan_ids:
+            loan = loans.get(loan_id)
+            if loan is None:
+                results[loan_id] = {'id': loan_id, 'ok': False, 'error': 'Empréstimo não encontrado.'}
+                continue
+            if loan.status not in allowed:
+                results[loan_id] = {'id': loan_id, 'ok': False, 'error': error}
+                continue
+
+            fields.update(_apply_transition(loan, action, now))
+            changed.append(loan)
+            if action != 'approve' and loan.book_id is not None:
+                deltas[loan.book_id] += 1
+            results[loan_id] = {'id': loan_id, 'ok': True, 'status': loan.status}
+
+        if changed:
+            Loan.objects.bulk_update(changed, sorted(fields))
+
+        by_delta = {}
+        for book_id, delta in deltas.items():
+            by_delta.setdefault(delta, []).append(book_id)
+        for delta, book_ids in by_delta.items():
+            Book.objects.filter(pk__in=book_ids).update(
+                available_copies=F('available_copies') + delta, updated_at=timezone.now(),
+            )
+
+        # bulk_update não dispara os signals de Loan
+        for book_id in {loan.book_id for loan in changed if loan.book_id is not None}:
+            invalidate_book_detail(book_id)
+        if changed:
+            invalidate_librarian_stats()
+            notify_loan_changes(changed, stock_changed=action != 'approve')
+
+    return [results[loan_id] for loan_id in loan_ids]
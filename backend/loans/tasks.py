@@ -1,32 +1,15 @@
 from celery import shared_task
-from django.utils import timezone
-from .models import Loan
+from .services import process_overdue_loans
 
 @shared_task
 def check_overdue_loans():
-    today = timezone.now()
-    active_overdue = Loan.objects.filter(
-        status='ACTIVE',
-        due_date__lt=today,
-    )
+    # As multas são calculadas na leitura (Loan.objects.with_fine_due); aqui só muda o status
+    stats = process_overdue_loans()
 
-    count_active = active_overdue.count()
-    for loan in active_overdue.select_related('user'):
-        loan.apply_fines_until(today)
-        loan.status = 'OVERDUE'
-        loan.save()
+    if stats['marked_overdue'] > 0:
+        return (
+            f"{stats['marked_overdue']} empréstimos marcados como atrasados "
+            f"em {stats['duration']:.2f}s."
+        )
 
-    already_overdue = Loan.objects.filter(status='OVERDUE')
-    count_already = already_overdue.count()
-
-    for loan in already_overdue:
-        updated = loan.apply_fines_until(today)
-        if updated:
-            loan.save()
-
-    total_changed = count_active + count_already
-
-    if total_changed > 0:
-        return f'{total_changed} empréstimos processados para multa/atraso.'
-
-    return 'Nenhum empréstimo atrasado encontrado.'
\ No newline at end of file
+    return f"Nenhum empréstimo atrasado encontrado ({stats['duration']:.2f}s)."
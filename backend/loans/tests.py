@@ -1,3 +1,872 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+import asyncio
+import csv
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Count, F, Q
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.importer import import_books, read_csv
+from books.models import Book
+from sistema_biblioteca.query_plans import disable_seqscan, explain, full_scans
+from . import events
+from .models import Loan
+from .serializers import LoanSerializer
+from sistema_biblioteca.projections import ProjectedResponse
+from .services import process_overdue_loans, reserve_copy
+from .tasks import check_overdue_loans
+from .views import LoanViewSet
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+class ProcessamentoAtrasosTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.book = Book.objects.create(
+            title='Capitães da Areia', author='Jorge Amado', isbn='9788535914061',
+            publisher='Companhia das Letras', genre='Romance', language='pt',
+        )
+        self.now = timezone.now()
+
+    def _loan(self, **kwargs):
+        return Loan.objects.create(user=self.user, book=self.book, **kwargs)
+
+    def _cenarios(self):
+        now = self.now
+        return [
+            self._loan(status='ACTIVE', due_date=now - timedelta(days=3)),
+            self._loan(status='ACTIVE', due_date=now - timedelta(hours=2)),
+            self._loan(status='ACTIVE', due_date=now + timedelta(days=2)),
+            self._loan(status='OVERDUE', due_date=now - timedelta(days=10),
+                       fine_amount=Decimal('4.00'), fine_last_updated=now - timedelta(days=4)),
+            self._loan(status='OVERDUE', due_date=now - timedelta(days=10),
+                       fine_amount=Decimal('10.00'), fine_last_updated=now),
+            self._loan(status='OVERDUE', due_date=now - timedelta(days=5), paid=True),
+            self._loan(status='RETURNED', due_date=now - timedelta(days=5)),
+            self._loan(status='PENDING'),
+        ]
+
+    def _esperado(self, loans):
+        esperado = {}
+        for loan in Loan.objects.filter(pk__in=[l.pk for l in loans]):
+            if loan.status == 'ACTIVE' and loan.due_date < self.now:
+                loan.apply_fines_until(self.now)
+                loan.status = 'OVERDUE'
+            elif loan.status == 'OVERDUE':
+                loan.apply_fines_until(self.now)
+            esperado[loan.pk] = (loan.status, loan.fine_amount, loan.fine_last_updated)
+        return esperado
+
+    def _atual(self, loans):
+        return {
+            loan.pk: (loan.status, loan.fine_amount, loan.fine_last_updated)
+            for loan in Loan.objects.filter(pk__in=[l.pk for l in loans])
+        }
+
+    def test_so_marca_atrasados_sem_gravar_multas(self):
+        loans = self._cenarios()
+        antes = self._atual(loans)
+
+        stats = process_overdue_loans(self.now, chunk_size=3)
+
+        self.assertEqual(stats['marked_overdue'], 2)
+        depois = self._atual(loans)
+        for pk, (status, fine_amount, fine_last_updated) in antes.items():
+            self.assertEqual(depois[pk][1:], (fine_amount, fine_last_updated))
+            if status == 'ACTIVE' and depois[pk][0] != status:
+                self.assertEqual(depois[pk][0], 'OVERDUE')
+
+    @override_settings(FINE_DAILY_AMOUNT='0.75')
+    def test_multa_calculada_na_leitura_igual_ao_apply_fines_until(self):
+        loans = self._cenarios()
+        process_overdue_loans(self.now)
+
+        for when in (self.now, self.now + timedelta(days=3)):
+            self.now = when
+            esperado = {pk: fine for pk, (_, fine, _) in self._esperado(loans).items()}
+            anotado = dict(Loan.objects.with_fine_due(when).values_list('pk', 'fine_due'))
+            em_python = {loan.pk: loan.fine_due_at(when) for loan in Loan.objects.all()}
+
+            self.assertEqual(anotado, esperado)
+            self.assertEqual(em_python, esperado)
+
+        # Vencido há 3 dias e ainda sem multa gravada: 3 dias a 0,75
+        self.assertEqual(anotado[loans[0].pk], Decimal('4.50'))
+
+    def test_reexecucao_no_mesmo_dia_e_idempotente(self):
+        loans = self._cenarios()
+        process_overdue_loans(self.now)
+        depois_primeira = self._atual(loans)
+
+        stats = process_overdue_loans(self.now + timedelta(minutes=5))
+
+        self.assertEqual(self._atual(loans), depois_primeira)
+        self.assertEqual(stats['marked_overdue'], 0)
+
+    def test_devolucao_e_pagamento_gravam_a_multa_devida(self):
+        staff = User.objects.create_user(username='staff', password='senha-forte-123', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        devolvido = self._loan(status='OVERDUE', due_date=self.now - timedelta(days=4))
+        pago = self._loan(
+            status='OVERDUE', due_date=self.now - timedelta(days=6),
+            fine_amount=Decimal('2.00'), fine_last_updated=self.now - timedelta(days=4),
+        )
+
+        response = client.post(f'/api/loans/{devolvido.pk}/return_book/')
+        self.assertEqual(response.data['fine_amount'], '4.00')
+        devolvido.refresh_from_db()
+        self.assertEqual(devolvido.fine_amount, Decimal('4.00'))
+        # Devolvido: a multa para de crescer
+        self.assertEqual(devolvido.fine_due_at(self.now + timedelta(days=10)), Decimal('4.00'))
+
+        self.assertEqual(client.get(f'/api/loans/{pago.pk}/').data['fine_amount'], '6.00')
+        leitor = APIClient()
+        leitor.force_authenticate(self.user)
+        response = leitor.post(f'/api/loans/{pago.pk}/pay/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fine_amount'], '0.00')
+        self.assertEqual(leitor.post(f'/api/loans/{pago.pk}/pay/').status_code, 400)
+
+    def test_filtro_e_ordenacao_pela_multa_devida(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        loans = self._cenarios()
+
+        response = client.get('/api/loans/', {'has_fine': 'true', 'ordering': '-fine_due'})
+        multas = [(loan['id'], loan['fine_amount']) for loan in response.data['results']]
+        self.assertEqual(multas, [(loans[4].pk, '10.00'), (loans[3].pk, '8.00'), (loans[0].pk, '3.00')])
+
+        response = client.get('/api/loans/', {'min_fine': '5'})
+        self.assertEqual({loan['id'] for loan in response.data['results']}, {loans[3].pk, loans[4].pk})
+
+    def test_numero_de_queries_nao_cresce_com_os_emprestimos(self):
+        for _ in range(30):
+            self._loan(status='ACTIVE', due_date=self.now - timedelta(days=2))
+
+        with CaptureQueriesContext(connection) as ctx:
+            process_overdue_loans(self.now)
+        self.assertLess(len(ctx.captured_queries), 10)
+
+    def test_task_reporta_contagens(self):
+        self._cenarios()
+        self.assertIn('2 empréstimos marcados como atrasados', check_overdue_loans())
+        self.assertTrue(check_overdue_loans().startswith('Nenhum empréstimo atrasado'))
+
+
+class DisponibilidadeAtomicaTests(TestCase):
+    def setUp(self):
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.admin = User.objects.create_user(username='admin', password='senha-forte-123', is_staff=True)
+        self.book = Book.objects.create(
+            title='Grande Sertão: Veredas', author='Guimarães Rosa', isbn='9788535908237',
+            publisher='Companhia das Letras', genre='Romance', language='pt',
+            total_copies=1, available_copies=1,
+        )
+        self.client = APIClient()
+
+    def test_reserve_copy_nunca_fica_negativo(self):
+        self.assertTrue(reserve_copy(self.book.pk))
+        self.assertFalse(reserve_copy(self.book.pk))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+    def test_solicitacao_atualiza_apenas_estoque_e_updated_at(self):
+        updated_at = self.book.updated_at
+        self.client.force_authenticate(self.leitor)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/loans/', {'book': self.book.pk})
+
+        self.assertEqual(response.status_code, 201)
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "books_book"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "available_copies" = ', updates[0])
+        # updated_at acompanha o estoque: é o validador do GET condicional do acervo
+        self.assertEqual(re.findall(r'"(\w+)" = ', updates[0].split(' WHERE ')[0]), ['available_copies', 'updated_at'])
+        self.assertFalse(any('FOR UPDATE' in q['sql'] for q in ctx.captured_queries))
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertGreater(self.book.updated_at, updated_at)
+
+    def test_rejeicao_e_devolucao_devolvem_estoque(self):
+        self.client.force_authenticate(self.admin)
+        pendente = Loan.objects.create(user=self.leitor, book=self.book, status='PENDING')
+        ativo = Loan.objects.create(user=self.leitor, book=self.book, status='ACTIVE',
+                                    due_date=timezone.now() + timedelta(days=7))
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+
+        self.client.post(f'/api/loans/{pendente.pk}/reject/')
+        self.client.post(f'/api/loans/{ativo.pk}/return_book/')
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+
+def _reservar_com_lock_de_linha(book_id):
+    """Caminho antigo (select_for_update + save completo), mantido só para comparação."""
+    with transaction.atomic():
+        book = Book.objects.select_for_update().get(pk=book_id)
+        if book.available_copies <= 0:
+            return False
+        book.available_copies -= 1
+        book.save()
+        return True
+
+
+def _reservar_com_update_condicional(book_id):
+    with transaction.atomic():
+        return reserve_copy(book_id)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concorrência real exige PostgreSQL (SQLite serializa escritores).')
+class DisponibilidadeConcorrenteTests(TransactionTestCase):
+    """Stress em um único livro "quente": muitas threads reservando ao mesmo tempo."""
+
+    THREADS = 16
+    TENTATIVAS_POR_THREAD = 50
+
+    def _livro(self, copias):
+        return Book.objects.create(
+            title='Livro Quente', author='Autor', isbn=f'{copias:013d}', publisher='Editora',
+            genre='Romance', language='pt', total_copies=copias, available_copies=copias,
+        )
+
+    def _disputar(self, reservar, book_id):
+        barreira = threading.Barrier(self.THREADS)
+        sucessos = []
+
+        def trabalhador():
+            barreira.wait()
+            try:
+                for _ in range(self.TENTATIVAS_POR_THREAD):
+                    if reservar(book_id):
+                        sucessos.append(1)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=trabalhador) for _ in range(self.THREADS)]
+        inicio = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.monotonic() - inicio
+
+        return len(sucessos), (self.THREADS * self.TENTATIVAS_POR_THREAD) / duracao
+
+    def test_sem_venda_acima_do_estoque(self):
+        copias = self.THREADS * self.TENTATIVAS_POR_THREAD // 2
+        book = self._livro(copias)
+
+        sucessos, _ = self._disputar(_reservar_com_update_condicional, book.pk)
+
+        book.refresh_from_db()
+        self.assertEqual(sucessos, copias)
+        self.assertEqual(book.available_copies, 0)
+
+    def test_vazao_maior_que_lock_de_linha(self):
+        total = self.THREADS * self.TENTATIVAS_POR_THREAD
+        _, vazao_lock = self._disputar(_reservar_com_lock_de_linha, self._livro(total).pk)
+        _, vazao_update = self._disputar(_reservar_com_update_condicional, self._livro(total + 1).pk)
+
+        logger.debug('lock de linha: %.0f req/s | update condicional: %.0f req/s', vazao_lock, vazao_update)
+        self.assertGreater(vazao_update, vazao_lock)
+
+
+class PlanosDeConsultaTests(TestCase):
+    """
+    Regressão de índices: captura as consultas dos endpoints principais sobre
+    uma massa de dados e falha se alguma voltar a varrer a tabela inteira.
+    """
+
+    TABELAS = {'books_book', 'loans_loan', 'books_purchaserequest'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.leitores = User.objects.bulk_create([
+            User(username=f'leitor{i}', password='!') for i in range(20)
+        ])
+        cls.admin = User.objects.create_user(username='admin', password='senha-forte-123', is_staff=True)
+        cls.livros = Book.objects.bulk_create([
+            Book(title=f'Livro {i}', author='Autor', isbn=f'{i:013d}', publisher='Editora',
+                 genre='Romance', language='pt', available_copies=i % 3)
+            for i in range(300)
+        ])
+        agora = timezone.now()
+        status_ciclo = ['PENDING', 'ACTIVE', 'OVERDUE', 'RETURNED', 'RETURNED', 'REJECTED']
+        Loan.objects.bulk_create([
+            Loan(user=cls.leitores[i % 20], book=cls.livros[i % 300], status=status_ciclo[i % 6],
+                 due_date=agora + timedelta(days=(i % 15) - 7))
+            for i in range(1500)
+        ])
+
+    def setUp(self):
+        disable_seqscan()
+        self.client = APIClient()
+
+    def _assert_sem_varredura(self, url, usuario, metodo='get', dados=None):
+        self.client.force_authenticate(usuario)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, metodo)(url, dados or {})
+        self.assertLess(response.status_code, 500)
+        self._assert_consultas_sem_varredura(ctx.captured_queries, url)
+
+    def _assert_consultas_sem_varredura(self, consultas, origem):
+        for consulta in consultas:
+            sql = consulta['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            with self.subTest(origem=origem, sql=sql[:120]):
+                self.assertEqual(full_scans(sql, self.TABELAS), set(), explain(sql))
+
+    def test_acervo(self):
+        leitor = self.leitores[0]
+        self._assert_sem_varredura('/api/books/', leitor)
+        self._assert_sem_varredura('/api/books/', leitor, dados={'available': 'true'})
+        self._assert_sem_varredura('/api/books/search-global/', leitor)
+        self._assert_sem_varredura(f'/api/books/{self.livros[10].pk}/', leitor)
+
+    def test_emprestimos_do_leitor(self):
+        leitor = self.leitores[3]
+        self._assert_sem_varredura('/api/loans/', leitor)
+        self._assert_sem_varredura('/api/loans/lendo_agora/', leitor)
+        self._assert_sem_varredura('/api/loans/historico/', leitor)
+        self._assert_sem_varredura('/api/dashboard/', leitor)
+
+    def test_gestao_de_emprestimos(self):
+        self._assert_sem_varredura('/api/loans/', self.admin)
+        self._assert_sem_varredura('/api/loans/', self.admin, dados={'status': 'OVERDUE'})
+
+    def test_solicitacao_de_compra(self):
+        self._assert_sem_varredura(
+            '/api/books/request-purchase/', self.leitores[1], metodo='post',
+            dados={'title': 'Livro Novo', 'author': 'Autor'},
+        )
+
+    def test_job_de_atrasos(self):
+        with CaptureQueriesContext(connection) as ctx:
+            process_overdue_loans()
+        self._assert_consultas_sem_varredura(ctx.captured_queries, 'check_overdue_loans')
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_gera_massa_consistente(self):
+        call_command('seed_library', books=30, users=5, loans=300, stdout=StringIO())
+
+        self.assertEqual(Book.objects.filter(isbn__startswith='999').count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith='bench_').count(), 5)
+        self.assertEqual(Loan.objects.count(), 300)
+
+        # Nenhum livro com mais empréstimos abertos do que cópias
+        abertos = Count('loans', filter=Q(loans__status__in=['PENDING', 'ACTIVE', 'OVERDUE']))
+        for book in Book.objects.annotate(abertos=abertos):
+            self.assertEqual(book.available_copies, book.total_copies - book.abertos)
+
+    def test_reexecucao_sem_clear_conta_os_emprestimos_anteriores(self):
+        call_command('seed_library', books=10, users=3, loans=200, stdout=StringIO())
+        call_command('seed_library', books=0, users=0, loans=200, seed=7, stdout=StringIO())
+
+        self.assertEqual(Loan.objects.count(), 400)
+        abertos = Count('loans', filter=Q(loans__status__in=['PENDING', 'ACTIVE', 'OVERDUE']))
+        for book in Book.objects.annotate(abertos=abertos):
+            self.assertLessEqual(book.abertos, book.total_copies)
+            self.assertEqual(book.available_copies, book.total_copies - book.abertos)
+
+
+    def test_emprestimos_sem_livros_ou_leitores_falham_antes_de_gerar(self):
+        with self.assertRaisesMessage(CommandError, '--books'):
+            call_command('seed_library', books=0, users=3, loans=10, stdout=StringIO())
+        self.assertFalse(User.objects.filter(username__startswith='bench_').exists())
+
+        call_command('seed_library', books=5, users=3, loans=10, stdout=StringIO())
+        # --clear apagaria os leitores existentes: sem --users não sobra nenhum
+        with self.assertRaisesMessage(CommandError, '--users'):
+            call_command('seed_library', books=5, users=0, loans=10, clear=True, stdout=StringIO())
+        self.assertEqual(Loan.objects.count(), 10)
+    def test_benchmark_grava_resultados_em_json(self):
+        call_command('seed_library', books=30, users=5, loans=300, stdout=StringIO())
+        atrasados = Loan.objects.filter(status='OVERDUE').count()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'bench.json'
+            call_command('benchmark', iterations=2, warmup=0, output=str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+
+        self.assertEqual(report['meta']['dataset']['loans'], 300)
+        names = {item['name'] for item in report['results']}
+        self.assertIn('search.local', names)
+        self.assertIn('task.check_overdue_loans', names)
+        for item in report['results']:
+            self.assertEqual(item['iterations'], 2)
+            self.assertTrue(set(item['status_codes']) <= {'200'}, item)
+
+        # A task roda numa transação desfeita: a massa não muda
+        self.assertEqual(Loan.objects.filter(status='OVERDUE').count(), atrasados)
+
+
+@override_settings(REQUEST_INSTRUMENTATION=True, QUERY_BUDGET_STRICT=True)
+class OrcamentoQueriesTests(TestCase):
+    def setUp(self):
+        leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.staff = User.objects.create_user(username='staff', password='senha-forte-123', is_staff=True)
+        self.leitor = leitor
+        now = timezone.now()
+        for i in range(10):
+            book = Book.objects.create(
+                title=f'Livro {i}', author='Autor', isbn=f'{i:013d}',
+                publisher='Editora', genre='Ficção', language='pt',
+            )
+            status = 'ACTIVE' if i % 2 else 'RETURNED'
+            Loan.objects.create(
+                user=leitor, book=book, status=status,
+                due_date=now + timedelta(days=7), return_date=now if status == 'RETURNED' else None,
+            )
+
+    def test_listas_de_emprestimos_nao_fazem_uma_query_por_item(self):
+        client = APIClient()
+        for user, url in [
+            (self.leitor, '/api/loans/lendo_agora/'),
+            (self.leitor, '/api/loans/historico/'),
+            (self.leitor, '/api/loans/'),
+            (self.staff, '/api/loans/'),
+        ]:
+            client.force_authenticate(user)
+            with self.assertLogs('sistema_biblioteca.requests', 'INFO') as logs:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn('Server-Timing', response)
+
+            registro = json.loads(logs.records[-1].getMessage())
+            view, action = registro['view'].split('.')
+            self.assertEqual(view, 'LoanViewSet')
+            self.assertLessEqual(registro['queries'], LoanViewSet.query_budget[action], url)
+
+    def test_modo_compacto_e_fields_nas_listas(self):
+        client = APIClient()
+        client.force_authenticate(self.leitor)
+
+        with self.assertLogs('sistema_biblioteca.requests', 'INFO'):
+            response = client.get('/api/loans/lendo_agora/', {'compact': 'true'})
+        self.assertEqual(list(response.data[0]), LoanSerializer.Meta.compact_fields)
+        self.assertTrue(response.data[0]['book_title'].startswith('Livro '))
+
+        # Sem user/book_title no recorte, a consulta não faz join com usuário nem livro
+        with CaptureQueriesContext(connection) as ctx, \
+                self.assertLogs('sistema_biblioteca.requests', 'INFO') as logs:
+            response = client.get('/api/loans/historico/', {'fields': 'id,status'})
+        self.assertEqual(set(response.data[0]), {'id', 'status'})
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('fine_amount', sql)
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['queries'], 1)
+
+        with self.assertLogs('sistema_biblioteca.requests', 'INFO'):
+            response = client.get('/api/loans/', {'omit': 'user,paid_date'})
+        self.assertNotIn('user', response.data['results'][0])
+        self.assertIn('book_title', response.data['results'][0])
+
+
+class ProjecaoJsonTests(TestCase):
+    """lendo_agora/historico em JSON saem pela LoanProjection com os mesmos bytes do LoanSerializer."""
+
+    def setUp(self):
+        self.leitor = User.objects.create_user(username='joão', password='senha-forte-123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.leitor)
+        now = timezone.now()
+        livros = [
+            Book.objects.create(
+                title=f'Memórias Póstumas {i} \u2029', author='Machado de Assis', isbn=f'97885{i:08d}',
+                publisher='Editora', genre='Romance', language='pt', total_copies=5, available_copies=5,
+            )
+            for i in range(4)
+        ]
+        Loan.objects.create(user=self.leitor, book=livros[0], status='PENDING')
+        Loan.objects.create(
+            user=self.leitor, book=livros[1], status='OVERDUE',
+            due_date=now - timedelta(days=3, microseconds=1), fine_amount=Decimal('3.5'),
+        )
+        Loan.objects.create(
+            user=self.leitor, book=livros[2], status='RETURNED', due_date=now,
+            return_date=now, fine_amount=Decimal('12'), paid=True, paid_date=now,
+        )
+        Loan.objects.create(user=self.leitor, book=livros[3], status='REJECTED')
+
+    def comparar(self, url, params=None):
+        rapida = self.client.get(url, params or {})
+        with mock.patch('loans.views.accepts_projection', return_value=False):
+            serializada = self.client.get(url, params or {})
+
+        self.assertIsInstance(rapida, ProjectedResponse)
+        self.assertEqual(rapida.content, serializada.content)
+        return rapida
+
+    def test_mesmos_bytes_do_serializer(self):
+        for url in ['/api/loans/lendo_agora/', '/api/loans/historico/']:
+            for params in [{}, {'compact': 'true'}, {'omit': 'user'}]:
+                with self.subTest(url=url, params=params):
+                    response = self.comparar(url, params)
+                    self.assertEqual(len(response.data), 2)
+
+        historico = self.comparar('/api/loans/historico/').data
+        self.assertEqual(historico[0]['fine_amount'], '12.00')
+
+    @override_settings(TIME_ZONE='America/Sao_Paulo')
+    def test_datas_no_fuso_atual(self):
+        response = self.comparar('/api/loans/lendo_agora/', {'fields': 'id,due_date'})
+        self.assertTrue(any((row['due_date'] or '').endswith('-03:00') for row in response.data))
+
+    def test_uma_consulta_com_os_joins(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/loans/lendo_agora/')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('JOIN', ctx.captured_queries[0]['sql'])
+
+    def test_benchmark_mede_custo_por_linha(self):
+        from .benchmarks import _render_scenarios, run_scenario
+
+        for scenario in _render_scenarios(self.leitor):
+            result = run_scenario(scenario, iterations=2, warmup=0)
+            self.assertEqual(scenario.rows, 4)
+            self.assertGreater(result.per_row_us, 0)
+
+
+class OperacoesEmLoteTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='senha-forte-123', is_staff=True)
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.livros = [
+            Book.objects.create(
+                title=f'Livro {i}', author='Autor', isbn=f'{i:013d}', publisher='Editora',
+                genre='Ficção', language='pt', total_copies=10, available_copies=10,
+            )
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _pendentes(self, livro, quantidade):
+        # Como em perform_create: a cópia sai do estoque na solicitação
+        Book.objects.filter(pk=livro.pk).update(available_copies=F('available_copies') - quantidade)
+        return [Loan.objects.create(user=self.leitor, book=livro).pk for _ in range(quantidade)]
+
+    def test_aprovar_em_lote_reporta_resultado_por_emprestimo(self):
+        pendentes = self._pendentes(self.livros[0], 3)
+        ativo = Loan.objects.create(user=self.leitor, book=self.livros[1], status='ACTIVE').pk
+
+        response = self.client.post(
+            '/api/loans/bulk-approve/', {'ids': [*pendentes, ativo, 9999]}, format='json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['processed'], response.data['failed']), (3, 2))
+        self.assertEqual([r['id'] for r in response.data['results']], [*pendentes, ativo, 9999])
+        self.assertEqual(response.data['results'][3]['error'], 'Este empréstimo não está pendente de aprovação.')
+        self.assertEqual(response.data['results'][4]['error'], 'Empréstimo não encontrado.')
+
+        for loan in Loan.objects.filter(pk__in=pendentes):
+            self.assertEqual(loan.status, 'ACTIVE')
+            self.assertEqual(loan.due_date - loan.loan_date, timedelta(days=7))
+        # Aprovar não mexe no estoque (a cópia já foi reservada)
+        self.livros[0].refresh_from_db()
+        self.assertEqual(self.livros[0].available_copies, 7)
+
+    def test_rejeitar_e_devolver_somam_estoque_por_livro(self):
+        pendentes = self._pendentes(self.livros[0], 2) + self._pendentes(self.livros[1], 1)
+        response = self.client.post('/api/loans/bulk-reject/', {'ids': pendentes}, format='json')
+        self.assertEqual(response.data['processed'], 3)
+
+        vencido = Loan.objects.create(
+            user=self.leitor, book=self.livros[0], status='OVERDUE',
+            due_date=timezone.now() - timedelta(days=3),
+        )
+        Book.objects.filter(pk=self.livros[0].pk).update(available_copies=F('available_copies') - 1)
+        with override_settings(FINE_DAILY_AMOUNT='2.00'):
+            response = self.client.post('/api/loans/bulk-return/', {'ids': [vencido.pk]}, format='json')
+
+        self.assertEqual(response.data['results'], [{'id': vencido.pk, 'ok': True, 'status': 'RETURNED'}])
+        vencido.refresh_from_db()
+        self.assertEqual(vencido.fine_amount, Decimal('6.00'))
+        self.assertIsNotNone(vencido.return_date)
+        for livro in self.livros:
+            livro.refresh_from_db()
+            self.assertEqual(livro.available_copies, 10)
+
+    def test_queries_nao_crescem_com_o_numero_de_emprestimos(self):
+        def rejeitar(quantidade):
+            ids = self._pendentes(self.livros[0], quantidade)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post('/api/loans/bulk-reject/', {'ids': ids}, format='json')
+            return len(ctx.captured_queries)
+
+        self.assertEqual(rejeitar(2), rejeitar(8))
+
+    def test_apenas_staff_e_entrada_validada(self):
+        self.assertEqual(self.client.post('/api/loans/bulk-approve/', {'ids': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/loans/bulk-approve/', {'ids': ['x']}, format='json').status_code, 400)
+
+        self.client.force_authenticate(self.leitor)
+        response = self.client.post('/api/loans/bulk-approve/', {'ids': [1]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportacaoTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='senha-forte-123', is_staff=True)
+        self.leitor = User.objects.create_user(
+            username='leitor', password='senha-forte-123', email='leitor@example.com',
+        )
+        self.livro = Book.objects.create(
+            title='Vidas Secas', author='Graciliano Ramos', isbn='9788525406347',
+            publisher='Record', genre='Romance', language='pt',
+        )
+        now = timezone.now()
+        Loan.objects.create(user=self.leitor, book=self.livro, status='RETURNED', return_date=now)
+        Loan.objects.create(
+            user=self.leitor, book=self.livro, status='OVERDUE',
+            due_date=now - timedelta(days=2), fine_amount=Decimal('3.00'), fine_last_updated=now,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _conteudo(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_de_emprestimos_aceita_filtros_da_listagem(self):
+        response = self.client.get('/api/loans/export/', {'status': 'OVERDUE'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment; filename="emprestimos-', response['Content-Disposition'])
+        linhas = list(csv.DictReader(StringIO(self._conteudo(response).lstrip('\ufeff'))))
+        self.assertEqual(len(linhas), 1)
+        self.assertEqual(linhas[0]['user'], 'leitor')
+        self.assertEqual(linhas[0]['book_title'], 'Vidas Secas')
+        self.assertEqual(linhas[0]['fine_amount'], '3.00')
+
+    def test_ndjson_de_multas_em_aberto(self):
+        response = self.client.get('/api/loans/fines/export/', {'export_format': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        registros = [json.loads(linha) for linha in self._conteudo(response).splitlines()]
+        self.assertEqual(len(registros), 1)
+        self.assertEqual(registros[0]['email'], 'leitor@example.com')
+        self.assertEqual(registros[0]['fine_amount'], '3.00')
+
+    def test_exportacao_faz_uma_query_independente_do_volume(self):
+        def exportar():
+            with CaptureQueriesContext(connection) as ctx:
+                self._conteudo(self.client.get('/api/loans/export/'))
+            return len(ctx.captured_queries)
+
+        antes = exportar()
+        Loan.objects.bulk_create([Loan(user=self.leitor, book=self.livro, status='RETURNED') for _ in range(50)])
+        self.assertEqual(exportar(), antes)
+
+    def test_apenas_staff_e_formato_validado(self):
+        self.assertEqual(self.client.get('/api/loans/export/', {'export_format': 'xlsx'}).status_code, 400)
+
+        self.client.force_authenticate(self.leitor)
+        self.assertEqual(self.client.get('/api/loans/export/').status_code, 403)
+        self.assertEqual(self.client.get('/api/books/export/').status_code, 403)
+
+    def test_acervo_exportado_pode_ser_reimportado(self):
+        conteudo = self._conteudo(self.client.get('/api/books/export/', {'search': 'graciliano'}))
+        linhas = list(csv.DictReader(StringIO(conteudo.lstrip('\ufeff'))))
+        self.assertEqual([linha['isbn'] for linha in linhas], ['9788525406347'])
+
+        Book.objects.filter(pk=self.livro.pk).update(title='Outro título')
+        resultado = import_books(read_csv(StringIO(conteudo.lstrip('\ufeff'))))
+
+        self.assertEqual(resultado.updated, 1)
+        self.livro.refresh_from_db()
+        self.assertEqual(self.livro.title, 'Vidas Secas')
+
+
+class EventosTempoRealTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='senha-forte-123', is_staff=True)
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.outro = User.objects.create_user(username='outro', password='senha-forte-123')
+        self.livro = Book.objects.create(
+            title='O Cortiço', author='Aluísio Azevedo', isbn='9788508133000', publisher='Ática',
+            genre='Romance', language='pt', total_copies=3, available_copies=2,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def _recebidos(self, subscription):
+        mensagens = []
+        while (mensagem := subscription.get(timeout=0)) is not None:
+            mensagens.append(mensagem)
+        return mensagens
+
+    def test_hub_entrega_por_canal(self):
+        hub = events.EventHub()
+        with hub.subscribe(['user:1', 'books']) as a, hub.subscribe(['user:2']) as b:
+            self.assertEqual(hub.subscriber_count(), 2)
+            self.assertEqual(hub.dispatch('user:1', {'type': 'x'}), 1)
+            self.assertEqual(hub.dispatch('books', {'type': 'y'}), 1)
+            self.assertEqual(self._recebidos(a), [{'type': 'x'}, {'type': 'y'}])
+            self.assertEqual(self._recebidos(b), [])
+        self.assertEqual(hub.subscriber_count(), 0)
+
+    def test_aprovar_e_rejeitar_publicam_depois_do_commit(self):
+        aprovado = Loan.objects.create(user=self.leitor, book=self.livro)
+        rejeitado = Loan.objects.create(user=self.leitor, book=self.livro)
+
+        with events.subscribe(self.leitor) as do_leitor, events.subscribe(self.outro) as de_outro:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/loans/{aprovado.pk}/approve/')
+            mensagens = self._recebidos(do_leitor)
+            self.assertEqual([(m['type'], m['loan'], m['status']) for m in mensagens], [
+                ('loan.status', aprovado.pk, 'ACTIVE'),
+            ])
+            self.assertIsNotNone(mensagens[0]['due_date'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/loans/{rejeitado.pk}/reject/')
+            self.assertEqual(self._recebidos(do_leitor), [
+                {'type': 'loan.status', 'loan': rejeitado.pk, 'user': self.leitor.pk, 'book': self.livro.pk, 'status': 'REJECTED',
+                 'due_date': None, 'return_date': None},
+                {'type': 'book.availability', 'book': self.livro.pk, 'available_copies': 3},
+            ])
+            # Outros leitores só recebem o estoque
+            self.assertEqual([m['type'] for m in self._recebidos(de_outro)], ['book.availability'])
+
+    def test_nada_e_publicado_sem_commit(self):
+        loan = Loan.objects.create(user=self.leitor, book=self.livro)
+        with events.subscribe(self.leitor) as subscription:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self.client.post(f'/api/loans/{loan.pk}/approve/')
+            self.assertEqual(self._recebidos(subscription), [])
+
+            for callback in callbacks:
+                callback()
+            self.assertEqual([m['status'] for m in self._recebidos(subscription)], ['ACTIVE'])
+
+    def test_processamento_de_atrasos_avisa_leitor_e_staff(self):
+        ontem = timezone.now() - timedelta(days=1)
+        loan = Loan.objects.create(user=self.leitor, book=self.livro, status='ACTIVE', due_date=ontem)
+
+        with events.subscribe(self.leitor) as do_leitor, events.subscribe(self.staff) as do_staff:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_overdue_loans()
+            self.assertEqual(
+                [(m['loan'], m['status']) for m in self._recebidos(do_leitor)], [(loan.pk, 'OVERDUE')],
+            )
+            self.assertEqual(self._recebidos(do_staff), [
+                {'type': 'loans.overdue', 'count': 1, 'loans': [loan.pk]},
+            ])
+
+    def test_staff_recebe_um_resumo_por_lote_de_atrasos(self):
+        ontem = timezone.now() - timedelta(days=1)
+        atrasados = [
+            Loan.objects.create(user=self.leitor, book=self.livro, status='ACTIVE', due_date=ontem)
+            for _ in range(5)
+        ]
+
+        with events.subscribe(self.staff) as do_staff:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_overdue_loans(chunk_size=3)
+            resumos = self._recebidos(do_staff)
+        self.assertEqual([m['type'] for m in resumos], ['loans.overdue'] * 2)
+        self.assertEqual(sorted(pk for m in resumos for pk in m['loans']), sorted(l.pk for l in atrasados))
+
+    def _ticket(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        response = client.post('/api/loans/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['ticket']
+
+    def test_stream_exige_ticket(self):
+        self.assertEqual(self.client.get('/api/loans/events/').status_code, 401)
+        self.assertEqual(self.client.get('/api/loans/events/', {'ticket': 'invalido'}).status_code, 401)
+        self.assertEqual(APIClient().post('/api/loans/events/ticket/').status_code, 401)
+
+    def test_token_de_acesso_nao_vale_na_url(self):
+        # A URL vai para os logs de acesso: só o ticket de curta duração é aceito nela
+        token = str(AccessToken.for_user(self.leitor))
+        self.assertEqual(self.client.get('/api/loans/events/', {'token': token}).status_code, 401)
+        self.assertEqual(self.client.get('/api/loans/events/', {'ticket': token}).status_code, 401)
+
+        ticket = self._ticket(self.leitor)
+        with mock.patch('loans.async_views.TICKET_MAX_AGE', -1):
+            self.assertEqual(self.client.get('/api/loans/events/', {'ticket': ticket}).status_code, 401)
+
+        self.leitor.is_active = False
+        self.leitor.save()
+        self.assertEqual(self.client.get('/api/loans/events/', {'ticket': ticket}).status_code, 401)
+
+    def test_stream_sse_sem_consultas(self):
+        response = self.client.get('/api/loans/events/', {'ticket': self._ticket(self.leitor)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        stream = iter(response.streaming_content)
+        try:
+            self.assertIn(b'retry: 3000', next(stream))
+            with CaptureQueriesContext(connection) as ctx:
+                events.get_backend().publish(events.user_channel(self.leitor.pk), {'type': 'loan.status', 'loan': 1})
+                self.assertEqual(next(stream), b'event: loan.status\ndata: {"type": "loan.status", "loan": 1}\n\n')
+                with mock.patch('loans.async_views.HEARTBEAT_SECONDS', 0.01):
+                    self.assertEqual(next(stream), b': ping\n\n')
+            self.assertEqual(len(ctx.captured_queries), 0)
+        finally:
+            response.close()
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    async def test_stream_sse_sob_asgi(self):
+        token = str(await sync_to_async(AccessToken.for_user)(self.leitor))
+        response = await AsyncClient().get('/api/loans/events/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'retry: 3000', await anext(stream))
+        events.get_backend().publish(events.BOOKS_CHANNEL, {'type': 'book.availability', 'book': 1})
+        self.assertEqual(
+            await anext(stream), b'event: book.availability\ndata: {"type": "book.availability", "book": 1}\n\n',
+        )
+
+        # Cliente desconectou: o servidor ASGI cancela a task e a assinatura é liberada
+        esperando = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        esperando.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await esperando
+        self.assertEqual(events.hub.subscriber_count(), 0)
+
+    @skipUnless(os.getenv('TEST_LOAN_EVENTS_REDIS_URL'), 'defina TEST_LOAN_EVENTS_REDIS_URL para testar com Redis')
+    def test_fan_out_pelo_redis(self):
+        hub = events.EventHub()
+        backend = events.RedisBackend(hub, os.environ['TEST_LOAN_EVENTS_REDIS_URL'])
+        backend.ensure_listening()
+        with hub.subscribe(['books']) as subscription:
+            time.sleep(0.5)  # a thread precisa assinar o canal antes da publicação
+            backend.publish('books', {'type': 'book.availability', 'book': 1})
+            self.assertEqual(subscription.get(timeout=5), {'type': 'book.availability', 'book': 1})
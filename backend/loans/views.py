@@ -1,34 +1,79 @@
 from rest_framework import viewsets, status, exceptions, filters
 from rest_framework.response import Response
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend 
 from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
+from .async_views import TICKET_MAX_AGE, issue_ticket
+from .events import notify_loan_changes
+from .filters import LoanFilter
 from .models import Loan
-from books.models import Book
+from .projections import LoanProjection
 from .serializers import LoanSerializer
 from decimal import Decimal
+from .services import MAX_BULK_LOANS, bulk_transition, reserve_copy, release_copy
+from sistema_biblioteca.export import ExportMixin
+from sistema_biblioteca.instrumentation import timed
+from sistema_biblioteca.projections import ProjectedResponse, accepts_projection
+from sistema_biblioteca.pagination import LoanDateCursorPagination
 
 # Create your views here.
 
-class LoanViewSet(viewsets.ModelViewSet):
+# Nomes iguais aos campos do LoanSerializer
+LOAN_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user__username'),
+    ('book', 'book_id'),
+    ('book_title', 'book__title'),
+    ('status', 'status'),
+    ('loan_date', 'loan_date'),
+    ('due_date', 'due_date'),
+    ('return_date', 'return_date'),
+    ('fine_amount', 'fine_due'),
+    ('paid', 'paid'),
+    ('paid_date', 'paid_date'),
+]
+
+FINE_EXPORT_COLUMNS = [
+    ('loan', 'id'),
+    ('user', 'user__username'),
+    ('email', 'user__email'),
+    ('book_title', 'book__title'),
+    ('status', 'status'),
+    ('due_date', 'due_date'),
+    ('fine_amount', 'fine_due'),
+    ('fine_last_updated', 'fine_last_updated'),
+]
+
+
+class LoanViewSet(ExportMixin, viewsets.ModelViewSet):
     serializer_class = LoanSerializer
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'patch']
+    pagination_class = LoanDateCursorPagination
+    query_budget = {'list': 3, 'retrieve': 3, 'lendo_agora': 3, 'historico': 3}
 
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
-    filterset_fields = ['status', 'user', 'book']
+    filterset_class = LoanFilter
     search_fields = ['user__username', 'book__title']
-    ordering_fields = ['loan_date', 'due_date']
-    ordering = ['-loan_date']
+    # fine_due: multa devida agora (anotação de with_fine_due)
+    ordering_fields = ['loan_date', 'due_date', 'fine_due']
+    ordering = ['-loan_date', '-id']
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return Loan.objects.all().order_by('-loan_date')
-        return Loan.objects.filter(user=user).order_by('-loan_date')
+        # user e book.title entram na serialização: evita uma query por empréstimo
+        loans = Loan.objects.select_related('user', 'book').with_fine_due()
+        if not user.is_staff:
+            loans = loans.filter(user=user)
+        if self.action in ('list', 'lendo_agora', 'historico'):
+            # ?fields=/?omit=/?compact=: só as colunas (e joins) do recorte
+            # A lista paginada também lê as colunas da ordenação (posição do cursor)
+            ordering = self.paginator.get_ordering(self.request, loans, self) if self.action == 'list' else ()
+            loans = LoanSerializer.restrict_queryset(loans, self.request, ordering=ordering)
+        return loans.order_by('-loan_date')
 
     def perform_create(self, serializer):
         book = serializer.validated_data['book']
@@ -43,15 +88,11 @@ class LoanViewSet(viewsets.ModelViewSet):
             raise exceptions.ValidationError("Você já possui uma solicitação ou empréstimo ativo deste livro.")
 
         with transaction.atomic():
-            book_locked = Book.objects.select_for_update().get(pk=book.pk)
-
-            if book_locked.available_copies <= 0:
+            if not reserve_copy(book.pk):
                 raise exceptions.ValidationError('Este livro não está disponível no momento.')
-
-            book_locked.available_copies -= 1
-            book_locked.save()
             
-            serializer.save(user=self.request.user)
+            loan = serializer.save(user=self.request.user)
+            notify_loan_changes([loan])
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def approve(self, request, pk=None):
@@ -67,6 +108,7 @@ class LoanViewSet(viewsets.ModelViewSet):
         loan.loan_date = timezone.now()
         loan.due_date = timezone.now() + timedelta(days=7)
         loan.save()
+        notify_loan_changes([loan], stock_changed=False)
 
         return Response(self.get_serializer(loan).data)
 
@@ -81,12 +123,11 @@ class LoanViewSet(viewsets.ModelViewSet):
                )
 
         with transaction.atomic():
-            book_locked = Book.objects.select_for_update().get(pk=loan.book.pk)
-            book_locked.available_copies += 1
-            book_locked.save()
+            release_copy(loan.book_id)
             
             loan.status = 'REJECTED'
             loan.save()
+            notify_loan_changes([loan])
 
         return Response({'status': 'Solicitação rejeitada e estoque devolvido.'})
 
@@ -98,42 +139,92 @@ class LoanViewSet(viewsets.ModelViewSet):
             return Response({"error": "Este empréstimo já foi finalizado."}, status=status.HTTP_400_BAD_REQUEST)
         
         with transaction.atomic():
-            book_locked = Book.objects.select_for_update().get(pk=loan.book.pk)
-            book_locked.available_copies += 1
-            book_locked.save()
+            release_copy(loan.book_id)
             now = timezone.now()
             loan.apply_fines_until(now)
             loan.return_date = now
             loan.status = 'RETURNED'
             loan.save()
+            notify_loan_changes([loan])
 
         return Response(self.get_serializer(loan).data)
 
+    def _bulk(self, request, action_name):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({"error": "Envie uma lista 'ids' de empréstimos."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BULK_LOANS:
+            return Response(
+                {"error": f"Máximo de {MAX_BULK_LOANS} empréstimos por requisição."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            ids = [int(loan_id) for loan_id in ids]
+        except (TypeError, ValueError):
+            return Response({"error": "Os ids devem ser números inteiros."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_transition(action_name, ids)
+        processed = sum(1 for result in results if result['ok'])
+        return Response({'processed': processed, 'failed': len(results) - processed, 'results': results})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        return self._bulk(request, 'approve')
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        return self._bulk(request, 'reject')
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], url_path='bulk-return')
+    def bulk_return(self, request):
+        return self._bulk(request, 'return')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """Exporta os empréstimos filtrados (mesmos filtros da listagem) em CSV/NDJSON."""
+        return self.export_queryset(self.filter_queryset(self.get_queryset()), LOAN_EXPORT_COLUMNS, 'emprestimos')
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser], url_path='fines/export')
+    def export_fines(self, request):
+        """Exporta as multas em aberto dos empréstimos filtrados."""
+        queryset = self.filter_queryset(self.get_queryset()).filter(fine_due__gt=0, paid=False)
+        return self.export_queryset(queryset, FINE_EXPORT_COLUMNS, 'multas')
+
     @action(detail=False, methods=['get'])
     def lendo_agora(self, request):
-        user = self.request.user
         loans = self.get_queryset().filter(status__in=['PENDING', 'ACTIVE', 'OVERDUE']).order_by('-loan_date')
-        serializer = self.get_serializer(loans, many=True)
-        return Response(serializer.data)
+        return self._unpaginated_list(loans)
 
     @action(detail=False, methods=['get'])
     def historico(self, request):
-        user = self.request.user
         loans = self.get_queryset().filter(status__in=['RETURNED', 'REJECTED']).order_by('-return_date') 
-        serializer = self.get_serializer(loans, many=True)
-        return Response(serializer.data)
+        return self._unpaginated_list(loans)
+
+    def _unpaginated_list(self, loans):
+        if not accepts_projection(self.request):
+            serializer = self.get_serializer(loans, many=True)
+            return Response(serializer.data)
+
+        # JSON: linhas do values() (uma consulta com os joins) no formato do LoanSerializer
+        projection = LoanProjection()
+        records = list(projection.values(loans, self.request))
+        with timed('serializer'):
+            return ProjectedResponse(projection.rows(records, self.request))
 
     @action(detail=True, methods=['post'])
     def pay(self, request, pk=None):
         loan = self.get_object()
 
+        # Acerto: os dias de atraso até agora entram na multa antes de quitar
+        now = timezone.now()
+        loan.apply_fines_until(now)
+
         if loan.fine_amount is None or loan.fine_amount <= 0:
             return Response({"error": "Não há multa a pagar."}, status=status.HTTP_400_BAD_REQUEST)
 
         if getattr(loan, 'paid', False):
             return Response({"error": "A multa já foi paga."}, status=status.HTTP_400_BAD_REQUEST)
 
-        now = timezone.now()
         loan.paid = True
         loan.paid_date = now
         loan.fine_amount = Decimal('0.00')
@@ -141,3 +232,10 @@ class LoanViewSet(viewsets.ModelViewSet):
         loan.save()
 
         return Response(self.get_serializer(loan).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def loan_events_ticket(request):
+    """Ticket de curta duração para abrir o stream de eventos (loans.async_views)."""
+    return Response({'ticket': issue_ticket(request.auth), 'expires_in': TICKET_MAX_AGE})
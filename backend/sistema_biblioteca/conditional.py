@@ -0,0 +1,44 @@
+"""
+GET condicional (ETag / Last-Modified -> 304) para as views do acervo.
+
+As views calculam os validadores com consultas baratas (ex.: max(updated_at)
+e contagem do queryset filtrado) antes de serializar; se o cliente já tem
+essa versão, a resposta é um 304 sem corpo e o serializer nem roda.
+
+Respostas que dependem do usuário (status_usuario) incluem a parte do
+usuário no ETag e não mandam Last-Modified, que sozinho não perceberia
+mudanças nos empréstimos. As listagens também só usam ETag: a contagem
+percebe remoções, o max(updated_at) do Last-Modified não.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def not_modified(request, etag, last_modified=None):
+    """Resposta 304 (ou 412) se os validadores do cliente ainda valem; senão None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    # If-Modified-Since tem resolução de segundos
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Sempre revalida; "private" porque o corpo pode depender do usuário
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,103 @@
+"""
+Exportação em streaming (CSV ou NDJSON) para relatórios.
+
+As linhas saem de um ``values_list().iterator()``: no PostgreSQL isso usa
+cursor no servidor e busca os registros em blocos, então a memória não
+cresce com o tamanho da exportação. Cada bloco é escrito na resposta assim
+que chega do banco.
+
+Uso nos ViewSets: herde de ExportMixin e chame ``self.export_queryset(queryset,
+columns, name)`` numa action; o queryset deve vir de ``filter_queryset``
+para aceitar os mesmos filtros da listagem. Formato por
+``?export_format=csv|ndjson`` (``format`` é reservado pelo DRF).
+"""
+import csv
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+EXPORT_CHUNK_SIZE = 2000
+# Linhas são agrupadas em pedaços de ~64 KiB antes de ir para o socket
+WRITE_BUFFER_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    """Pseudo-buffer: o csv.writer devolve a linha em vez de acumular."""
+
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield [_format_value(value) for value in row]
+
+
+def _buffered(lines):
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= WRITE_BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_csv(queryset, columns):
+    writer = csv.writer(_Echo())
+    # BOM para o Excel reconhecer UTF-8
+    yield '\ufeff' + writer.writerow([header for header, _ in columns])
+    for row in iter_rows(queryset, [field for _, field in columns]):
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def stream_ndjson(queryset, columns):
+    headers = [header for header, _ in columns]
+    for row in iter_rows(queryset, [field for _, field in columns]):
+        yield json.dumps(dict(zip(headers, row)), ensure_ascii=False) + '\n'
+
+
+def export_response(queryset, columns, name, export_format='csv'):
+    """
+    ``columns`` é uma lista de (cabeçalho, campo do values_list), ex.:
+    ``[('usuario', 'user__username'), ('livro', 'book__title')]``.
+    """
+    if export_format not in CONTENT_TYPES:
+        raise ValidationError({'export_format': f'Use um de: {", ".join(CONTENT_TYPES)}.'})
+
+    stream = stream_csv if export_format == 'csv' else stream_ndjson
+    response = StreamingHttpResponse(
+        _buffered(stream(queryset, columns)), content_type=CONTENT_TYPES[export_format],
+    )
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+    response['Content-Disposition'] = f'attachment; filename="{name}-{stamp}.{export_format}"'
+    return response
+
+
+class ExportMixin:
+    def export_queryset(self, queryset, columns, name):
+        export_format = self.request.query_params.get('export_format', 'csv')
+        return export_response(queryset, columns, name, export_format)
@@ -0,0 +1,239 @@
+"""
+Instrumentação por requisição: queries SQL, tempo de banco, serialização e
+chamadas HTTP externas (Google Books).
+
+Ligada com REQUEST_INSTRUMENTATION=True. Cada resposta ganha um header
+``Server-Timing`` (visível na aba Network do navegador) e uma linha de log
+JSON no logger ``sistema_biblioteca.requests``.
+
+Views podem declarar um orçamento de queries (``query_budget``); com
+QUERY_BUDGET_STRICT=True (usado nos testes) estourar o orçamento levanta
+QueryBudgetExceeded, senão só gera um log de aviso.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger('sistema_biblioteca.requests')
+
+SLOWEST_QUERIES = 3
+SQL_PREVIEW_LENGTH = 200
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+        self.timings = {}
+        self._depth = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.db_time += duration
+            self.slowest.append((duration, sql[:SQL_PREVIEW_LENGTH]))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_QUERIES:]
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        parts = [f'db;desc="{self.queries} queries";dur={self.db_time * 1000:.2f}']
+        parts += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.timings.items()]
+        parts.append(f'total;dur={self.total_time * 1000:.2f}')
+        return ', '.join(parts)
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.timings.items()},
+            'slowest': [{'ms': round(d * 1000, 2), 'sql': sql} for d, sql in self.slowest],
+        }
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """
+    Soma o tempo do bloco em ``name`` na requisição atual. Sem instrumentação
+    ativa não faz nada; blocos aninhados com o mesmo nome contam uma vez só.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    depth = metrics._depth.get(name, 0)
+    metrics._depth[name] = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics._depth[name] = depth
+        if depth == 0:
+            elapsed = time.perf_counter() - started
+            metrics.timings[name] = metrics.timings.get(name, 0.0) + elapsed
+
+
+def query_budget(budget):
+    """Decorator para function views (@api_view): ``@query_budget(3)``."""
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def _view_info(view_func, method):
+    """Nome legível da view e orçamento de queries aplicável ao método."""
+    cls = getattr(view_func, 'cls', None)
+    # ViewSets guardam o mapeamento método -> action (ex.: {'get': 'list'})
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+
+    name = cls.__name__ if cls is not None else view_func.__name__
+    if action:
+        name = f'{name}.{action}'
+
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None and cls is not None:
+        budget = getattr(cls, 'query_budget', None)
+    if isinstance(budget, dict):
+        # Orçamento por action ({'list': 4, 'retrieve': 3})
+        budget = budget.get(action)
+    return name, budget
+
+
+def _record_query(execute, sql, params, many, context):
+    # Fica instalado nas conexões; só mede quando há uma requisição instrumentada no contexto
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def _install_query_recorder(connection=None, **kwargs):
+    """
+    Instala o _record_query nas conexões da thread atual (ou na recém-criada).
+    O ContextVar acompanha o sync_to_async, então queries de views assíncronas
+    feitas em outra thread também são atribuídas à requisição certa.
+    """
+    for conn in [connection] if connection is not None else connections.all():
+        if _record_query not in conn.execute_wrappers:
+            conn.execute_wrappers.append(_record_query)
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(_install_query_recorder, dispatch_uid='request_instrumentation')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics, token = self._start(request)
+        _install_query_recorder()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = self._start(request)
+        await sync_to_async(_install_query_recorder)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics)
+
+    def _start(self, request):
+        request._view_name, request._query_budget = None, None
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics)
+
+    def _finish(self, request, response, metrics):
+        response['Server-Timing'] = metrics.server_timing()
+        self._log(request, response, metrics)
+        self._check_budget(request, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_name, request._query_budget = _view_info(view_func, request.method)
+
+    def _log(self, request, response, metrics):
+        payload = {
+            'method': request.method,
+            'path': request.path,
+            'view': request._view_name,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }
+        slow_ms = getattr(settings, 'REQUEST_SLOW_MS', 500)
+        level = logging.WARNING if payload['total_ms'] >= slow_ms else logging.INFO
+        logger.log(level, json.dumps(payload, ensure_ascii=False))
+
+    def _check_budget(self, request, metrics):
+        budget = request._query_budget
+        if budget is None or metrics.queries <= budget:
+            return
+
+        message = (
+            f'{request.method} {request.path} fez {metrics.queries} queries '
+            f'(orçamento: {budget}).'
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class TimedSerializerMixin:
+    """Conta o tempo de ``.data`` (to_representation) como "serializer"."""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
@@ -0,0 +1,35 @@
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset): o custo de qualquer página é o mesmo da
+    primeira, pois filtra pela posição do último item em vez de usar OFFSET.
+    Os tokens next/previous são opacos (base64) e gerados pelo DRF.
+    """
+    page_size = 40
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CreatedAtCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class LoanDateCursorPagination(KeysetPagination):
+    ordering = ('-loan_date', '-id')
+
+
+class UsernameCursorPagination(KeysetPagination):
+    ordering = ('username',)
+
+
+class BookCursorPagination(CreatedAtCursorPagination):
+    """Em buscas sem ?ordering explícito, pagina pela relevância (search_rank)."""
+
+    def get_ordering(self, request, queryset, view):
+        is_search = 'search_rank' in queryset.query.annotations
+        if is_search and OrderingFilter.ordering_param not in request.query_params:
+            return ('-search_rank', '-created_at', '-id')
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,147 @@
+"""
+Caminho rápido de leitura para as listagens mais acessadas.
+
+Em vez de instanciar models e passar cada linha pelos campos do DRF, a view
+lê as colunas com ``values()`` (uma consulta, já com os joins) e uma
+``Projection`` monta os dicts com os valores no mesmo formato dos
+serializers (datas ISO 8601 no fuso atual, Decimal como string, URLs
+absolutas). O JSON sai pelo orjson quando instalado, ou pelo JSONRenderer
+do DRF caso contrário; nos dois casos os bytes são os mesmos da resposta
+serializada (os testes comparam as duas).
+
+Só atende requisições JSON: o navegador da API (BrowsableAPIRenderer)
+continua pelo serializer. Respeita ``?fields=``/``?omit=``/``?compact=``
+(ver sistema_biblioteca.sparse).
+"""
+import decimal
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele o JSONRenderer do DRF faz o mesmo, mais devagar
+    orjson = None
+
+
+def dumps(data):
+    """Mesmos bytes do JSONRenderer do DRF (compacto, UTF-8, U+2028/U+2029 escapados)."""
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data)
+        except (orjson.JSONEncodeError, TypeError):
+            pass  # ex.: surrogate isolado numa string; o DRF sabe lidar
+        else:
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return JSONRenderer().render(data)
+
+
+def accepts_projection(request):
+    """True se a resposta negociada é JSON (o navegador da API usa o serializer)."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is None or renderer.format == 'json'
+
+
+class ProjectedResponse(HttpResponse):
+    """Resposta JSON já renderizada; ``data`` fica disponível como no Response do DRF."""
+
+    def __init__(self, data, **kwargs):
+        with timed('serializer'):
+            content = dumps(data)
+        super().__init__(content, content_type='application/json', **kwargs)
+        self.data = data
+
+
+# Formatadores: mesmo resultado do to_representation dos campos do DRF
+
+def datetime_formatter():
+    field_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def format_datetime(value):
+        if not value:
+            return None
+        if field_timezone is not None:
+            value = value.astimezone(field_timezone)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return format_datetime
+
+
+def format_date(value):
+    return value.isoformat() if value else None
+
+
+def decimal_formatter(max_digits, decimal_places):
+    context = decimal.getcontext().copy()
+    context.prec = max_digits
+    exponent = decimal.Decimal('.1') ** decimal_places
+
+    def format_decimal(value):
+        if value is None:
+            return None
+        return f'{value.quantize(exponent, context=context):f}'
+
+    return format_decimal
+
+
+def file_url_formatter(request):
+    def format_file_url(name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+
+    return format_file_url
+
+
+class Projection:
+    """
+    Leitura de um serializer via ``values()``. Subclasses definem:
+
+    - ``serializer_class``: fonte dos nomes/ordem dos campos (e do recorte);
+    - ``columns``: campo -> lookup do ``values()`` (ex.: ``'book__title'``);
+    - ``get_formatters(request, records)``: campo -> função aplicada ao valor
+      da coluna (campos sem formatador saem como vieram do banco).
+    """
+    serializer_class = None
+    columns = {}
+
+    def get_fields(self, request):
+        fields = self.serializer_class.requested_fields(request)
+        return list(self.serializer_class.Meta.fields) if fields is None else fields
+
+    def lookups(self, request, extra=()):
+        """Colunas do ``values()`` para os campos pedidos (mais ``extra``, ex.: a ordenação)."""
+        lookups = dict.fromkeys(self.columns[name] for name in self.get_fields(request))
+        lookups.update(dict.fromkeys(extra))
+        return list(lookups)
+
+    def values(self, queryset, request, extra=()):
+        return queryset.values(*self.lookups(request, extra))
+
+    def get_formatters(self, request, records):
+        return {}
+
+    def rows(self, records, request):
+        records = list(records)
+        formatters = self.get_formatters(request, records)
+        plan = [
+            (name, self.columns[name], formatters.get(name))
+            for name in self.get_fields(request)
+        ]
+        rows = []
+        for record in records:
+            row = {}
+            for name, lookup, formatter in plan:
+                value = record[lookup]
+                row[name] = value if formatter is None else formatter(value)
+            rows.append(row)
+        return rows
@@ -0,0 +1,39 @@
+"""
+Captura de planos de consulta (EXPLAIN) para os testes de regressão de índices.
+
+Em PostgreSQL o teste roda com ``enable_seqscan = off``: se mesmo assim o plano
+tiver "Seq Scan", não existe índice utilizável para aquele formato de consulta.
+Em SQLite, um "SCAN <tabela>" sem "USING ... INDEX" é uma varredura completa.
+"""
+import re
+
+from django.db import connection
+
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+_POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def disable_seqscan():
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def full_scans(sql, tables):
+    """Tabelas de ``tables`` lidas por varredura sequencial no plano de ``sql``."""
+    pattern = _SQLITE_FULL_SCAN if connection.vendor == 'sqlite' else _POSTGRES_FULL_SCAN
+    scanned = set()
+    for line in explain(sql):
+        match = pattern.search(line.strip())
+        if match and match.group(1) in tables:
+            scanned.add(match.group(1))
+    return scanned
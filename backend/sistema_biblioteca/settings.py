@@ -53,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Só fica ativo com REQUEST_INSTRUMENTATION=True (Server-Timing + log por requisição)
+    'sistema_biblioteca.instrumentation.RequestInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -151,7 +153,8 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication com o usuário lido do cache (users.authentication)
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_FILTER_BACKENDS': (
@@ -184,15 +187,87 @@ CELERY_BEAT_SCHEDULE = { # roda o check_overdue_loans todo dia as 00:00
         'task': 'loans.tasks.check_overdue_loans',
         'schedule': crontab(hour=0, minute=0), 
     },
+    'enrich-books-every-night': { # completa capa/descrição/data pelo Google Books
+        'task': 'books.tasks.enrich_books',
+        'schedule': crontab(hour=3, minute=0),
+    },
 }
 
 # Redis
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# Com CACHE_REDIS_URL o cache é compartilhado entre workers web e Celery;
+# sem ele, cada processo usa o seu LocMemCache (desenvolvimento/testes).
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+        }
     }
+
+# Eventos de empréstimo em tempo real (/api/loans/events/). Com Redis, os eventos
+# publicados em qualquer processo (web ou Celery) chegam a todas as conexões.
+LOAN_EVENTS_REDIS_URL = os.getenv('LOAN_EVENTS_REDIS_URL', CACHE_REDIS_URL)
+LOAN_EVENTS_HEARTBEAT = int(os.getenv('LOAN_EVENTS_HEARTBEAT', 15))
+LOAN_EVENTS_MAX_AGE = int(os.getenv('LOAN_EVENTS_MAX_AGE', 30 * 60))
+LOAN_EVENTS_TICKET_MAX_AGE = int(os.getenv('LOAN_EVENTS_TICKET_MAX_AGE', 30))
+
+# TTL (segundos) do detalhe de livro cacheado; a invalidação é por versão
+BOOK_DETAIL_CACHE_TTL = int(os.getenv('BOOK_DETAIL_CACHE_TTL', 60 * 15))
+
+# Cache das respostas do Google Books (segundos). Entradas negativas = vazio/erro
+GOOGLE_BOOKS_SEARCH_CACHE_TTL = int(os.getenv('GOOGLE_BOOKS_SEARCH_CACHE_TTL', 60 * 60))
+GOOGLE_BOOKS_VOLUME_CACHE_TTL = int(os.getenv('GOOGLE_BOOKS_VOLUME_CACHE_TTL', 60 * 60 * 24))
+GOOGLE_BOOKS_NEGATIVE_CACHE_TTL = int(os.getenv('GOOGLE_BOOKS_NEGATIVE_CACHE_TTL', 60))
+# Prazo total (segundos) para buscar os blocos de uma página no Google em paralelo
+GOOGLE_BOOKS_SEARCH_DEADLINE = float(os.getenv('GOOGLE_BOOKS_SEARCH_DEADLINE', 6.0))
+# Quanto (segundos) a busca source=all espera pelo Google antes de responder só com o acervo
+FEDERATED_SEARCH_BUDGET = float(os.getenv('FEDERATED_SEARCH_BUDGET', 2.0))
+# Enriquecimento em segundo plano (books.tasks.enrich_books): livros por lote e consultas/s ao Google
+BOOK_ENRICHMENT_BATCH_SIZE = int(os.getenv('BOOK_ENRICHMENT_BATCH_SIZE', 50))
+BOOK_ENRICHMENT_RATE = float(os.getenv('BOOK_ENRICHMENT_RATE', 2.0))
+# Dias até consultar de novo um livro que o Google não conseguiu completar
+BOOK_ENRICHMENT_RECHECK_DAYS = int(os.getenv('BOOK_ENRICHMENT_RECHECK_DAYS', 30))
+# Conexões simultâneas com o Google por worker ASGI (rotas /api/books/async/)
+GOOGLE_BOOKS_ASYNC_MAX_CONNECTIONS = int(os.getenv('GOOGLE_BOOKS_ASYNC_MAX_CONNECTIONS', 100))
+
+# TTL (segundos) do snapshot do usuário usado na autenticação JWT
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60 * 5))
+
+# TTL (segundos) dos números gerais do dashboard do bibliotecário
+DASHBOARD_STATS_CACHE_TTL = int(os.getenv('DASHBOARD_STATS_CACHE_TTL', 60))
+
+# Instrumentação por requisição (queries, tempo de banco/serialização/Google).
+# Desligada por padrão; QUERY_BUDGET_STRICT faz o orçamento de queries virar erro.
+REQUEST_INSTRUMENTATION = os.getenv('REQUEST_INSTRUMENTATION', 'False') == 'True'
+REQUEST_SLOW_MS = int(os.getenv('REQUEST_SLOW_MS', 500))
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'sistema_biblioteca.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 CORS_ALLOWED_ORIGINS = [
@@ -0,0 +1,117 @@
+"""
+Sparse fieldsets para as listagens (``?fields=``, ``?omit=`` e ``?compact=``).
+
+``?fields=id,title`` devolve só esses campos, ``?omit=description`` devolve
+todos menos esses e ``?compact=true`` usa o conjunto reduzido declarado em
+``Meta.compact_fields`` (``omit`` pode ser combinado com os outros dois).
+Sem nenhum dos parâmetros a resposta é a completa, como antes.
+
+As views passam o queryset por ``restrict_queryset`` para que o banco também
+só devolva as colunas usadas (``.only()``): a descrição e os demais campos
+fora do JSON nem saem do banco. Só vale para leitura (GET/HEAD); escritas
+continuam com todos os campos. Listagens com paginação por cursor passam a
+ordenação do paginator: ele lê essas colunas do último item da página, e
+uma coluna adiada custaria uma query por livro.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+COMPACT_PARAM = 'compact'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    """
+    Para ModelSerializers. No Meta:
+
+    - ``compact_fields``: campos do modo compacto;
+    - ``field_columns``: colunas lidas por cada campo que não é uma coluna de
+      mesmo nome (ex.: ``{'book_title': ('book__title',)}``; ``()`` para
+      campos que não leem colunas).
+
+    ``context['sparse_fields'] = False`` desliga o recorte (ex.: quando a
+    representação completa vai para o cache).
+    """
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Campos pedidos, na ordem do Meta, ou None para a representação completa."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+
+        params = request.query_params
+        available = list(cls.Meta.fields)
+        names = None
+
+        if params.get(FIELDS_PARAM):
+            names = _split(params[FIELDS_PARAM])
+            cls._check_names(FIELDS_PARAM, names, available)
+        elif params.get(COMPACT_PARAM, '').lower() in ('true', '1'):
+            names = list(cls.Meta.compact_fields)
+
+        if params.get(OMIT_PARAM):
+            omit = _split(params[OMIT_PARAM])
+            cls._check_names(OMIT_PARAM, omit, available)
+            names = [name for name in (names or available) if name not in omit]
+
+        if names is None:
+            return None
+        return [name for name in available if name in names]
+
+    @staticmethod
+    def _check_names(param, names, available):
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise serializers.ValidationError({
+                param: f"Campos inválidos: {', '.join(unknown)}. Disponíveis: {', '.join(available)}."
+            })
+
+    @classmethod
+    def restrict_queryset(cls, queryset, request, extra=(), ordering=()):
+        """
+        ``.only()`` com as colunas dos campos pedidos (mais ``extra`` e as de
+        ``ordering``, a ordenação do paginator). Os select_related passam a
+        ser só os das relações usadas.
+        """
+        names = cls.requested_fields(request)
+        if names is None:
+            return queryset
+
+        field_columns = getattr(cls.Meta, 'field_columns', {})
+        columns = {queryset.model._meta.pk.name, *extra}
+        # Anotações (search_rank, fine_due) já vêm no SELECT: não são colunas do .only()
+        columns.update(
+            name for name in (field.lstrip('-') for field in ordering)
+            if name not in queryset.query.annotations
+        )
+        for name in names:
+            columns.update(field_columns.get(name, (name,)))
+
+        relations = sorted({column.rsplit('__', 1)[0] for column in columns if '__' in column})
+        queryset = queryset.select_related(None)
+        if relations:
+            # select_related() sem argumentos seguiria todas as FKs
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.context.get('sparse_fields', True) or not self._is_sparse_root():
+            return fields
+
+        names = self.requested_fields(self.context.get('request'))
+        if names is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in names}
+
+    def _is_sparse_root(self):
+        # Só o serializer da resposta (ou o filho de uma lista); aninhados ficam completos
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
@@ -13,7 +13,8 @@ from users.views import (
     dashboard_stats,
     UserViewSet 
 )
-from loans.views import LoanViewSet
+from loans.async_views import loan_events
+from loans.views import LoanViewSet, loan_events_ticket
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -29,6 +30,10 @@ urlpatterns = [
 
     path('api/books/', include('books.urls')),
 
+    # Stream de eventos (SSE); antes do router para não cair no detalhe loans/<pk>/
+    path('api/loans/events/', loan_events, name='loan_events'),
+    path('api/loans/events/ticket/', loan_events_ticket, name='loan_events_ticket'),
+
     # Router Principal (Loans e Users)
     path('api/', include(router.urls)),
 
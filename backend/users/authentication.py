@@ -0,0 +1,131 @@
+"""
+Autenticação JWT com o usuário cacheado.
+
+O JWTAuthentication do simplejwt busca a linha inteira de ``users_user``
+(com os campos de endereço) a cada requisição, antes de qualquer view. Aqui
+a busca sai de um snapshot compacto no cache, com só o que a autenticação e
+as permissões usam (``role``, ``is_staff``, ``is_active``...). O usuário
+devolvido é uma instância de User com os demais campos adiados: quem
+precisar do perfil completo (ex.: ``/api/users/me/``) recarrega do banco.
+
+O snapshot só é usado com um cache compartilhado entre os processos
+(Redis, memcached...). Com o LocMemCache padrão cada worker teria a sua
+cópia e a invalidação só chegaria ao processo que salvou o usuário: aí a
+autenticação é a do simplejwt, com a consulta de sempre.
+
+A chave é ``auth_user_{id}``. Qualquer ``save()`` do usuário (promote,
+upgrade_role, troca de senha, desativação) apaga o snapshot, já e de novo
+depois do commit (users.signals). UPDATEs em lote no queryset não disparam
+signals e precisam chamar ``invalidate_user_snapshot``.
+
+Com ``SIMPLE_JWT['CHECK_REVOKE_TOKEN']`` o snapshot guarda o hash de senha
+do token, e tokens emitidos antes de uma troca de senha continuam recusados.
+"""
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+AUTH_USER_CACHE_TTL = getattr(settings, 'AUTH_USER_CACHE_TTL', 60 * 5)
+
+# Campos do snapshot: o que autenticação, permissões e filtros por usuário leem
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name',
+    'role', 'is_staff', 'is_superuser', 'is_active',
+)
+# Chave no snapshot do hash usado na revogação de tokens (CHECK_REVOKE_TOKEN)
+PASSWORD_HASH_KEY = '_password_hash'
+# Backends em que cada processo tem o próprio cache (ou nenhum)
+LOCAL_CACHE_BACKENDS = (LocMemCache, DummyCache)
+
+
+def uses_shared_cache():
+    return not isinstance(caches['default'], LOCAL_CACHE_BACKENDS)
+
+
+def user_snapshot_key(user_id):
+    return f'auth_user_{user_id}'
+
+
+def invalidate_user_snapshot(user_id):
+    # Apaga já e depois do commit: uma leitura concorrente durante a transação
+    # recolocaria os dados antigos
+    key = user_snapshot_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _snapshot(user):
+    snapshot = {name: getattr(user, name) for name in SNAPSHOT_FIELDS}
+    if api_settings.CHECK_REVOKE_TOKEN:
+        snapshot[PASSWORD_HASH_KEY] = get_md5_hash_password(user.password)
+    return snapshot
+
+
+def _from_snapshot(model, snapshot):
+    # from_db marca como adiados os campos fora do snapshot (carregados sob demanda)
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in snapshot]
+    user = model.from_db(router.db_for_read(model), names, [snapshot[name] for name in names])
+    if PASSWORD_HASH_KEY in snapshot:
+        user._password_hash = snapshot[PASSWORD_HASH_KEY]
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que lê o usuário do cache (mesmas verificações do simplejwt)."""
+
+    def get_user(self, validated_token):
+        # O snapshot é indexado pela pk; com outro USER_ID_FIELD vale a busca normal
+        if api_settings.USER_ID_FIELD != self.user_model._meta.pk.name or not uses_shared_cache():
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = self.get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != getattr(user, '_password_hash', None):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
+
+    def get_cached_user(self, user_id):
+        key = user_snapshot_key(user_id)
+        snapshot = cache.get(key)
+        # Snapshot gravado antes de ligarem o CHECK_REVOKE_TOKEN não tem o hash: recarrega
+        if snapshot is not None and (PASSWORD_HASH_KEY in snapshot or not api_settings.CHECK_REVOKE_TOKEN):
+            return _from_snapshot(self.user_model, snapshot)
+
+        user = self._load_user(user_id)
+        if user is not None:
+            snapshot = _snapshot(user)
+            cache.set(key, snapshot, AUTH_USER_CACHE_TTL)
+            user = _from_snapshot(self.user_model, snapshot)
+        return user
+
+    def _load_user(self, user_id):
+        fields = SNAPSHOT_FIELDS + (('password',) if api_settings.CHECK_REVOKE_TOKEN else ())
+        try:
+            return self.user_model.objects.only(*fields).get(pk=user_id)
+        except (self.user_model.DoesNotExist, ValueError, TypeError):
+            return None
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """Mesmo esquema Bearer do simplejwt na documentação OpenAPI."""
+    target_class = CachedJWTAuthentication
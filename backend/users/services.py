@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+LIBRARIAN_STATS_CACHE_KEY = 'dashboard_stats_librarian'
+LIBRARIAN_STATS_CACHE_TTL = getattr(settings, 'DASHBOARD_STATS_CACHE_TTL', 60)
+
+
+def librarian_stats():
+    """Números gerais do acervo, servidos do cache até a próxima escrita (ou TTL)."""
+    data = cache.get(LIBRARIAN_STATS_CACHE_KEY)
+    if data is not None:
+        return data
+
+    from books.models import Book
+    from loans.models import Loan
+
+    data = Loan.objects.aggregate(
+        active_loans=Count('pk', filter=Q(status='ACTIVE')),
+        overdue_loans=Count('pk', filter=Q(status='OVERDUE')),
+        pending_loans=Count('pk', filter=Q(status='PENDING')),
+    )
+    data['total_books'] = Book.objects.count()
+    data['total_users'] = get_user_model().objects.count()
+
+    cache.set(LIBRARIAN_STATS_CACHE_KEY, data, LIBRARIAN_STATS_CACHE_TTL)
+    return data
+
+
+def reader_stats(user):
+    from loans.models import Loan
+
+    return Loan.objects.filter(user=user).aggregate(
+        my_active_loans=Count('pk', filter=Q(status__in=['ACTIVE', 'PENDING'])),
+        my_history=Count('pk', filter=Q(status='RETURNED')),
+        my_overdue=Count('pk', filter=Q(status='OVERDUE')),
+    )
+
+
+def invalidate_librarian_stats():
+    cache.delete(LIBRARIAN_STATS_CACHE_KEY)
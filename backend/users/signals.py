@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from books.models import Book
+from loans.models import Loan
+from .authentication import invalidate_user_snapshot
+from .services import invalidate_librarian_stats
+
+User = get_user_model()
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_dashboard_stats(sender, instance, **kwargs):
+    invalidate_librarian_stats()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_auth_snapshot(sender, instance, update_fields=None, **kwargs):
+    # Papel, is_staff, senha ou desativação: a próxima requisição relê o usuário.
+    # O last_login gravado no login não está no snapshot.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_user_snapshot(instance.pk)
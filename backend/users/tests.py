@@ -1,3 +1,167 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from books.models import Book
+from loans.models import Loan
+from users.authentication import user_snapshot_key
+
+User = get_user_model()
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.leitor = User.objects.create_user(username='leitor', password='senha-forte-123')
+        self.bibliotecario = User.objects.create_user(
+            username='bibliotecario', password='senha-forte-123', role='LIBRARIAN', is_staff=True
+        )
+        self.book = Book.objects.create(
+            title='O Cortiço', author='Aluísio Azevedo', isbn='9788508000001',
+            publisher='Ática', genre='Romance', language='pt',
+        )
+        Loan.objects.create(user=self.leitor, book=self.book, status='ACTIVE')
+        Loan.objects.create(user=self.leitor, book=self.book, status='OVERDUE')
+        Loan.objects.create(user=self.leitor, book=self.book, status='RETURNED')
+        self.client = APIClient()
+
+    def test_leitor_em_uma_query(self):
+        self.client.force_authenticate(self.leitor)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/dashboard/')
+
+        self.assertEqual(response.data, {
+            'my_active_loans': 1, 'my_history': 1, 'my_overdue': 1, 'is_admin': False,
+        })
+
+    def test_bibliotecario_servido_do_cache_e_invalidado_em_escrita(self):
+        self.client.force_authenticate(self.bibliotecario)
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['active_loans'], 1)
+        self.assertEqual(response.data['total_users'], 2)
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/dashboard/')
+
+        Loan.objects.create(user=self.leitor, book=self.book, status='PENDING')
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['pending_loans'], 1)
+
+
+class AutenticacaoCacheadaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # O LocMemCache dos testes faz o papel do cache compartilhado (um processo só)
+        compartilhado = mock.patch('users.authentication.uses_shared_cache', return_value=True)
+        compartilhado.start()
+        self.addCleanup(compartilhado.stop)
+        self.leitor = User.objects.create_user(
+            username='leitor', password='senha-forte-123', city='Maceió', state='AL',
+        )
+        self.bibliotecario = User.objects.create_user(
+            username='bibliotecario', password='senha-forte-123', role='LIBRARIAN', is_staff=True
+        )
+
+    def _cliente(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def _consultas_de_usuario(self, client, url='/api/dashboard/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        return response, [q['sql'] for q in ctx.captured_queries if '"users_user"' in q['sql']]
+
+    def test_usuario_servido_do_cache(self):
+        client = self._cliente(self.leitor)
+        response, consultas = self._consultas_de_usuario(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(consultas), 1)
+        # Só as colunas do snapshot, sem o endereço
+        self.assertNotIn('"city"', consultas[0])
+
+        response, consultas = self._consultas_de_usuario(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(consultas, [])
+
+    def test_perfil_completo_em_me(self):
+        client = self._cliente(self.leitor)
+        client.get('/api/dashboard/')
+        response = client.get('/api/users/me/')
+        self.assertEqual((response.data['city'], response.data['state']), ('Maceió', 'AL'))
+
+    def test_promote_e_upgrade_role_valem_na_proxima_requisicao(self):
+        leitor = self._cliente(self.leitor)
+        self.assertFalse(leitor.get('/api/dashboard/').data['is_admin'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._cliente(self.bibliotecario).post(f'/api/users/{self.leitor.pk}/promote/')
+        self.assertTrue(leitor.get('/api/dashboard/').data['is_admin'])
+        self.assertEqual(leitor.post('/api/books/', {}).status_code, 400)  # passou pela permissão
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._cliente(self.bibliotecario).post(f'/api/users/{self.leitor.pk}/promote/')
+        self.assertFalse(leitor.get('/api/dashboard/').data['is_admin'])
+        self.assertEqual(leitor.post('/api/books/', {}).status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            leitor.post('/api/users/upgrade_role/', {'admin_code': 'BIBLIOTECA_ADMIN_2025'})
+        self.assertTrue(leitor.get('/api/dashboard/').data['is_admin'])
+        # upgrade_role salvou a partir do snapshot sem apagar o endereço
+        self.leitor.refresh_from_db()
+        self.assertEqual((self.leitor.city, self.leitor.role), ('Maceió', 'LIBRARIAN'))
+
+    def test_desativacao_recusa_o_token(self):
+        client = self._cliente(self.leitor)
+        self.assertEqual(client.get('/api/dashboard/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leitor.is_active = False
+            self.leitor.save()
+        self.assertEqual(client.get('/api/dashboard/').status_code, 401)
+
+    def test_troca_de_senha_revoga_tokens_antigos(self):
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            client = self._cliente(self.leitor)
+            self.assertEqual(client.get('/api/dashboard/').status_code, 200)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                client.patch('/api/users/me/', {'password': 'outra-senha-456'})
+            self.assertEqual(client.get('/api/dashboard/').status_code, 401)
+
+            self.leitor.refresh_from_db()
+            self.assertEqual(self._cliente(self.leitor).get('/api/dashboard/').status_code, 200)
+
+    def test_cache_local_usa_a_busca_do_simplejwt(self):
+        # Com LocMem cada worker teria o seu snapshot: a invalidação não chegaria aos outros
+        client = self._cliente(self.leitor)
+        with mock.patch('users.authentication.uses_shared_cache', return_value=False):
+            for _ in range(2):
+                response, consultas = self._consultas_de_usuario(client)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(consultas), 1)
+        self.assertIsNone(cache.get(user_snapshot_key(self.leitor.pk)))
+
+    def test_invalidacao_apaga_o_snapshot(self):
+        client = self._cliente(self.leitor)
+        client.get('/api/dashboard/')
+        self.assertIsNotNone(cache.get(user_snapshot_key(self.leitor.pk)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leitor.is_active = False
+            self.leitor.save()
+        self.assertIsNone(cache.get(user_snapshot_key(self.leitor.pk)))
 
-# Create your tests here.
+    def test_last_login_nao_invalida(self):
+        client = self._cliente(self.leitor)
+        client.get('/api/dashboard/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leitor.save(update_fields=['last_login'])
+        self.assertEqual(self._consultas_de_usuario(client)[1], [])
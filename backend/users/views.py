@@ -5,8 +5,10 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
-from django.core.management import call_command
 from .serializers import UserSerializer, CustomTokenObtainPairSerializer
+from .services import librarian_stats, reader_stats
+from sistema_biblioteca.instrumentation import query_budget
+from sistema_biblioteca.pagination import UsernameCursorPagination
 
 try:
     from books.models import Book
@@ -41,6 +43,7 @@ def check_email(request):
 class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UsernameCursorPagination
     lookup_value_regex = r'\d+' 
 
     def get_queryset(self):
@@ -66,7 +69,8 @@ class UserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get', 'patch', 'put'])
     def me(self, request):
-        user = request.user
+        # request.user vem do snapshot da autenticação (sem o endereço): lê o perfil completo
+        user = User.objects.get(pk=request.user.pk)
         if request.method == 'GET':
             serializer = self.get_serializer(user)
             return Response(serializer.data)
@@ -107,38 +111,16 @@ class UserViewSet(viewsets.ModelViewSet):
         user.save()
         return Response(UserSerializer(user).data)
 
+@query_budget(5)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
-    try:
-        call_command('update_status')
-    except Exception:
-        pass
-
-    try:
-        from books.models import Book
-        from loans.models import Loan
-    except ImportError:
-        return Response({"error": "Configuração incompleta"}, status=503)
-
+    # O refresh de status (atrasos/multas) roda no Celery (loans.tasks.check_overdue_loans)
     user = request.user
-    data = {}
 
     if getattr(user, 'role', 'READER') == 'LIBRARIAN' or user.is_staff:
-        data = {
-            'total_books': Book.objects.count(),
-            'total_users': User.objects.count(),
-            'active_loans': Loan.objects.filter(status='ACTIVE').count(),
-            'overdue_loans': Loan.objects.filter(status='OVERDUE').count(),
-            'pending_loans': Loan.objects.filter(status='PENDING').count(),
-            'is_admin': True
-        }
+        data = {**librarian_stats(), 'is_admin': True}
     else:
-        data = {
-            'my_active_loans': Loan.objects.filter(user=user, status__in=['ACTIVE', 'PENDING']).count(),
-            'my_history': Loan.objects.filter(user=user, status='RETURNED').count(),
-            'my_overdue': Loan.objects.filter(user=user, status='OVERDUE').count(),
-            'is_admin': False
-        }
-
-    return Response(data)
\ No newline at end of file
+        data = {**reader_stats(user), 'is_admin': False}
+
+    return Response(data)
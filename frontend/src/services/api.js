@@ -22,4 +22,26 @@ api.interceptors.response.use(response => response, error => {
   return Promise.reject(error)
 })
 
+// Listagens paginadas por cursor (DRF): até 100 itens por página e o link "next"
+// (absoluto, já com os filtros) para a seguinte
+export const PAGE_SIZE = 100
+
+export const fetchPage = async (url, params = {}, next = null) => {
+  const { data } = next
+    ? await api.get(next)
+    : await api.get(url, { params: { ...params, page_size: PAGE_SIZE } })
+  return { results: data.results || data, next: data.next || null }
+}
+
+// Para telas que filtram/agrupam a lista inteira no navegador
+export const fetchAllPages = async (url, params = {}) => {
+  let page = await fetchPage(url, params)
+  const items = [...page.results]
+  while (page.next) {
+    page = await fetchPage(url, params, page.next)
+    items.push(...page.results)
+  }
+  return items
+}
+
 export default api
\ No newline at end of file
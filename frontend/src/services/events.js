@@ -0,0 +1,68 @@
+import api from './api'
+
+// Eventos em tempo real (Server-Sent Events) de /api/loans/events/.
+// O EventSource não envia headers: cada conexão pede antes um ticket de curta
+// duração (POST loans/events/ticket/, com o token no header) e só ele vai na
+// query string — o token de acesso não aparece em logs de URL.
+// Quando a conexão cai (ou o servidor encerra ao expirar o token), reconecta
+// com um ticket novo. Sem token válido (ausente ou expirado) fica
+// desconectado: o servidor só responderia 401 a cada tentativa.
+const RECONNECT_MS = 3000
+
+// Campo exp (segundos) do JWT; o navegador não valida a assinatura, só lê a expiração
+const tokenIsValid = (token) => {
+  try {
+    const payload = token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')
+    const { exp } = JSON.parse(atob(payload))
+    return typeof exp === 'number' && exp * 1000 > Date.now()
+  } catch (e) {
+    return false
+  }
+}
+
+export function subscribeEvents(handlers) {
+  let source = null
+  let timer = null
+  let closed = false
+
+  const retry = () => {
+    // Token expirado: parar aqui; o próximo request pela api desloga (401)
+    if (!closed && tokenIsValid(localStorage.getItem('token') || '')) {
+      timer = setTimeout(connect, RECONNECT_MS)
+    }
+  }
+
+  const connect = async () => {
+    const token = localStorage.getItem('token')
+    if (closed || !token || !tokenIsValid(token)) return
+
+    let ticket
+    try {
+      ticket = (await api.post('loans/events/ticket/')).data.ticket
+    } catch (e) {
+      return retry()
+    }
+    if (closed) return
+
+    const url = new URL('loans/events/', api.defaults.baseURL)
+    url.searchParams.set('ticket', ticket)
+    source = new EventSource(url)
+
+    Object.entries(handlers).forEach(([type, handler]) => {
+      source.addEventListener(type, (event) => handler(JSON.parse(event.data)))
+    })
+
+    source.onerror = () => {
+      source.close()
+      retry()
+    }
+  }
+
+  connect()
+
+  return () => {
+    closed = true
+    clearTimeout(timer)
+    if (source) source.close()
+  }
+}